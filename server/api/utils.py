@@ -26,6 +26,45 @@ def make_response_(status, message, data=None, cookies=None):
         }
         
     return Response(
-        json.dumps(response, ensure_ascii=False),  # ensure_ascii=False to handle Arabic
+        # ensure_ascii=False to handle Arabic
+        json.dumps(response, ensure_ascii=False),
         content_type="application/json"
     )
+
+
+def get_page_args(args):
+    """
+    Reads the keyset pagination parameters of a list endpoint.
+
+    Args:
+        args (MultiDict): the request query string.
+
+    Returns:
+        tuple: the cursor (or None) and the page size (or None).
+
+    Raises:
+        ValueError: If limit is not a positive integer.
+    """
+    cursor = args.get("cursor") or None
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+    return cursor, limit
+
+
+def make_page_response_(message, data, next_cursor):
+    """
+    Creates a success response for one page of a list endpoint.
+
+    The cursor of the next page is sent in the `X-Next-Cursor` header,
+    which is left out on the last page.
+    """
+    response = make_response_("success", message, data)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
@@ -3,10 +3,15 @@ This module sets up the Flask application for the Job-linker application.
 """
 import os
 import redis
+from flask import request
 from server.models import storage
+from server.commands import register_commands
 from server.error_handlers import register_error_handlers
 from server.extensions import app, jwt
 from server.jwt_handlers import register_jwt_handlers
+from server.services.mail import mail_service
+from server.services.scheduler import scheduler
+from server.services.task_queue import task_queue
 from dotenv import load_dotenv
 
 
@@ -17,28 +22,46 @@ redis_port = int(os.environ['REDIS_PORT'])
 redis_db_jwt = int(os.environ['REDIS_DB_JWT'])
 
 jwt_redis_blocklist = redis.StrictRedis(
-        host=redis_host, port=redis_port, db=redis_db_jwt, decode_responses=True
+        host=redis_host, port=redis_port, db=redis_db_jwt,
+        decode_responses=True
         )
 
-def create_app():
+def create_app(start_background=True):
     """
     Initializes the Flask application.
 
     Sets up error handlers, JWT handlers, and blueprints.
+
+    Args:
+        start_background: start the mail workers, the task queue and the
+            scheduler; the maintenance commands run without them.
     """
-    # Setup our redis connection for storing the blocklisted tokens. You will probably
-    # want your redis instance configured to persist data to disk, so that a restart
-    # does not cause your application to forget that a JWT was revoked.
+    # Setup our redis connection for storing the blocklisted tokens. You
+    # will probably want your redis instance configured to persist data to
+    # disk, so that a restart does not cause your application to forget
+    # that a JWT was revoked.
     from server.api.v1.views import app_views
     from server.api.v2.views import app_views2
 
     register_error_handlers(app)
     register_jwt_handlers(jwt)
+    register_commands(app)
 
 
     app.register_blueprint(app_views)
     app.register_blueprint(app_views2)
 
+    if start_background:
+        # open the mail outbox and start its workers, which also send
+        # what an earlier process left in it
+        mail_service.start_workers()
+        # run the background tasks, those an earlier process left
+        # included; the handlers were registered with the views above
+        task_queue.start()
+        # close the jobs past their deadline, purge old tasks, and keep
+        # doing so
+        scheduler.start()
+
 
     @jwt.token_in_blocklist_loader
     def check_if_token_is_revoked(jwt_header, jwt_payload: dict):
@@ -47,6 +70,25 @@ def create_app():
         token_in_redis = jwt_redis_blocklist.get(jti)
         return token_in_redis is not None
 
+    @app.before_request
+    def reset_query_stats():
+        """Start the request with an empty lookup cache and zeroed
+        counters, whatever the previous request on this thread left."""
+        storage.clear_cache()
+        storage.reset_request_stats()
+
+    @app.after_request
+    def add_query_stats(response):
+        """Expose the number of queries and rows used by the request."""
+        stats = storage.request_stats()
+        response.headers["X-DB-Queries"] = str(stats["queries"])
+        response.headers["X-DB-Rows"] = str(stats["rows"])
+        app.logger.info(
+            "%s %s: %d queries, %d rows",
+            request.method, request.path, stats["queries"], stats["rows"]
+        )
+        return response
+
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         """Close the database session at the end of the request."""
@@ -7,7 +7,8 @@ from flasgger.utils import swag_from
 from flask import request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
-from server.api.utils import make_response_
+from server.api.utils import (
+    get_page_args, make_page_response_, make_response_)
 from server.api.v1.views import app_views
 from server.controllers.admin_controller import AdminController
 from server.decorators import handle_errors
@@ -21,14 +22,21 @@ admin_controller = AdminController()
 @swag_from("docs/app_views/get_all_users.yaml")
 def get_all_users():
     """
-    Endpoint to get all users.
+    Endpoint to get one page of users.
     Only accessible by admin users.
+
+    Query Parameters:
+        cursor (str): The `X-Next-Cursor` header of the previous page.
+        limit (int): The maximum number of users to return.
     """
     curr_user_id = get_jwt_identity()
-    users = admin_controller.get_all_users(curr_user_id)
+    cursor, limit = get_page_args(request.args)
+    users, next_cursor = admin_controller.get_all_users(
+            curr_user_id, cursor, limit
+            )
     return (
-        make_response_(
-            "success", "Fetched all users", [user.to_dict for user in users]
+        make_page_response_(
+            "Fetched all users", [user.to_dict for user in users], next_cursor
         ),
         200,
     )
@@ -103,3 +111,17 @@ def get_sys_statistics():
     curr_user_id = get_jwt_identity()
     stats = admin_controller.get_sys_statistics(curr_user_id)
     return make_response_("success", "Fetched system statistics", stats), 200
+
+
+@app_views.route("/admins/stats/mail", methods=["GET"])
+@jwt_required()
+@handle_errors
+@swag_from("docs/app_views/get_mail_statistics.yaml")
+def get_mail_statistics():
+    """
+    Endpoint to get the metrics of the mail service.
+    Only accessible by admin users.
+    """
+    curr_user_id = get_jwt_identity()
+    stats = admin_controller.get_mail_statistics(curr_user_id)
+    return make_response_("success", "Fetched mail statistics", stats), 200
@@ -7,7 +7,7 @@ from flasgger.utils import swag_from
 from flask import request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
-from server.api.utils import make_response_
+from server.api.utils import get_page_args, make_response_
 from server.api.v1.views import app_views
 from server.controllers.candidate_controller import CandidateController
 from server.decorators import handle_errors
@@ -85,18 +85,30 @@ def get_recommended_jobs():
     authenticated candidate based on their skills and major. The user
     must be authenticated and have the role of a candidate.
 
+    Query Parameters:
+        limit (int): The maximum number of jobs to return.
+        exclude_applied (bool): Leave out the jobs already applied for.
+
     Returns:
         A JSON response containing the recommended jobs, or an error
         message if the jobs could not be fetched.
     """
     user_id = get_jwt_identity()
-    rec_jobs = candidate_controller.recommend_jobs(user_id)
+    _, limit = get_page_args(request.args)
+    exclude_applied = request.args.get("exclude_applied") == "true"
+    rec_jobs = candidate_controller.recommend_jobs(
+            user_id, limit, exclude_applied
+            )
     return make_response_(
         "success",
         "Recommended Jobs based on Major & Skills",
         {
             "jobs": [
-                {"job": job["job"].to_dict, "has_applied": job["has_applied"]}
+                {
+                    "job": job["job"].to_dict,
+                    "skill_overlap": job["skill_overlap"],
+                    "has_applied": job["has_applied"],
+                }
                 for job in rec_jobs
             ]
         },
@@ -23,8 +23,13 @@ file_controller = FileController()
 @handle_errors
 @swag_from("docs/app_views/upload.yaml")
 def upload():
-    """save file into server"""
-    role = request.query_string.decode("utf8").split("=")[-1]
+    """save file into server
+
+    With `?async=true` (or UPLOAD_ASYNC set), the file is queued for
+    processing and the response is 202 with the id of the task to poll at
+    /upload/tasks/<task_id>.
+    """
+    role = request.args.get("role", "")
     dir_ = {
         "candidate": ApplicationConfig.UPLOAD_CV,
         "recruiter": ApplicationConfig.UPLOAD_JOB,
@@ -41,12 +46,43 @@ def upload():
         request.files["file"], dir_.get(role, ApplicationConfig.UPLOAD_TEMP)
     )
     user_id = get_jwt_identity()
+    run_async = request.args.get("async")
+    if run_async is None:
+        run_async = ApplicationConfig.UPLOAD_ASYNC
+    else:
+        run_async = run_async.lower() == "true"
+
+    if run_async:
+        task_id = file_controller.enqueue_upload(
+            file_path, original_filename, user_id, major_id
+        )
+        status_url = url_for("app_views.upload_task", task_id=task_id)
+        response = make_response_(
+            "success", "File queued for processing",
+            {"task_id": task_id, "status_url": status_url},
+        )
+        response.headers["Location"] = status_url
+        return response, 202
+
     message, data, status_code = file_controller.process_upload(
         file_path, original_filename, user_id, major_id
     )
     return make_response_("success", message, data), status_code
 
 
+@app_views.route("/upload/tasks/<task_id>", methods=["GET"])
+@jwt_required(optional=True)
+@handle_errors
+@swag_from("docs/app_views/upload_task.yaml")
+def upload_task(task_id):
+    """state of a queued upload: its status, progress and, once done,
+    the result /upload would have returned"""
+    task = file_controller.get_upload_task(task_id, get_jwt_identity())
+    if task is None:
+        return make_response_("error", "Task not found"), 404
+    return make_response_("success", "Fetched task", task), 200
+
+
 @app_views.route("/upload/insights", methods=["POST"])
 @handle_errors
 @limiter.limit("3 per minute")
@@ -3,10 +3,11 @@ This module provides views for the Job model in the Job-linker application.
 """
 
 from flasgger.utils import swag_from
-from flask import request
+from flask import request, url_for
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
-from server.api.utils import make_response_
+from server.api.utils import (
+    get_page_args, make_page_response_, make_response_)
 from server.api.v1.views import app_views
 from server.controllers.job_controller import JobController
 from server.decorators import handle_errors
@@ -185,12 +186,18 @@ def get_recommended_candidates(job_id):
     Args:
         job_id: The ID of the job to fetch recommendations for.
 
+    Query Parameters:
+        limit (int): The maximum number of candidates to return.
+
     Returns:
         A JSON response containing the recommended candidates, or an error
         message if the candidates could not be fetched.
     """
     user_id = get_jwt_identity()
-    rec_candidates = job_controller.recommend_candidates(job_id, user_id)
+    _, limit = get_page_args(request.args)
+    rec_candidates = job_controller.recommend_candidates(
+            job_id, user_id, limit
+            )
 
     return make_response_(
         "success",
@@ -199,18 +206,68 @@ def get_recommended_candidates(job_id):
     )
 
 
+@app_views.route("/jobs/<job_id>/rescore", methods=["POST"])
+@jwt_required()
+@handle_errors
+@swag_from("docs/app_views/rescore_job.yaml")
+def rescore_job(job_id):
+    """
+    Queues the re-scoring of every application of a job.
+
+    Args:
+        job_id: The ID of the job to re-score.
+
+    Returns:
+        A 202 JSON response with the id of the task to poll at
+        /jobs/<job_id>/rescore/<task_id>, or an error message.
+    """
+    user_id = get_jwt_identity()
+    task_id = job_controller.rescore_applications(user_id, job_id)
+    status_url = url_for(
+            "app_views.rescore_task", job_id=job_id, task_id=task_id
+            )
+    response = make_response_(
+        "success", "Re-scoring queued",
+        {"task_id": task_id, "status_url": status_url},
+    )
+    response.headers["Location"] = status_url
+    return response, 202
+
+
+@app_views.route("/jobs/<job_id>/rescore/<task_id>", methods=["GET"])
+@jwt_required()
+@handle_errors
+@swag_from("docs/app_views/rescore_task.yaml")
+def rescore_task(job_id, task_id):
+    """state of a queued re-scoring: its status, progress and, once
+    done, the number of applications re-scored and the time spent"""
+    user_id = get_jwt_identity()
+    task = job_controller.get_rescore_task(user_id, job_id, task_id)
+    if task is None:
+        return make_response_("error", "Task not found"), 404
+    return make_response_("success", "Fetched task", task), 200
+
+
 @app_views.route("/jobs/all", methods=["GET"])
+@handle_errors
 @swag_from("docs/app_views/get_all_jobs.yaml")
 def get_all_jobs():
     """
-    Fetches all jobs sorted by their major.
+    Fetches one page of jobs sorted by their major.
+
+    Query Parameters:
+        cursor (str): The `X-Next-Cursor` header of the previous page.
+        limit (int): The maximum number of jobs to return.
 
     Returns:
-        A list of all jobs in JSON format if successful.
+        A list of jobs in JSON format if successful.
         Otherwise, it returns an error message.
     """
-    jobs = job_controller.get_all_jobs_sorted_by_major()
-    return make_response_("success", "Fetched all jobs", jobs), 200
+    cursor, limit = get_page_args(request.args)
+    jobs, next_cursor = job_controller.get_all_jobs_sorted_by_major(
+            cursor, limit
+            )
+    return make_page_response_("Fetched all jobs", jobs, next_cursor), 200
 
 
 @app_views.route("/jobs/counts", methods=["GET"])
@@ -228,6 +285,7 @@ def get_job_counts():
 
 
 @app_views.route("/jobs/search", methods=["GET"])
+@handle_errors
 @swag_from("docs/app_views/search_jobs.yaml")
 def search_jobs():
     """
@@ -236,26 +294,41 @@ def search_jobs():
     Query Parameters:
         location (str): The location to search for.
         title (str): The title to search for.
+        sort (str): "date" to get the newest jobs first.
+        cursor (str): The `X-Next-Cursor` header of the previous page.
+        limit (int): The maximum number of jobs to return.
 
     Returns:
-        A list of jobs that match the search criteria.
+        A list of jobs that match the search criteria, the most relevant
+        first.
     """
     location = request.args.get("location")
     title = request.args.get("title")
     sort = request.args.get("sort")
-    jobs = job_controller.search_jobs(location, title, sort)
-    return make_response_("success", "Fetched jobs", jobs), 200
+    cursor, limit = get_page_args(request.args)
+    jobs, next_cursor = job_controller.search_jobs(
+            location, title, sort, cursor, limit
+            )
+    return make_page_response_("Fetched jobs", jobs, next_cursor), 200
 
 
 @app_views.route("/jobs/all/sorted", methods=["GET"])
+@handle_errors
 @swag_from("docs/app_views/get_all_jobs_sorted.yaml")
 def get_all_jobs_sorted():
     """
-    Fetches all jobs sorted by created_at, the newest first.
+    Fetches one page of jobs sorted by created_at, the newest first.
+
+    Query Parameters:
+        cursor (str): The `X-Next-Cursor` header of the previous page.
+        limit (int): The maximum number of jobs to return.
 
     Returns:
-        A list of all jobs in JSON format if successful.
+        A list of jobs in JSON format if successful.
         Otherwise, it returns an error message.
     """
-    jobs = job_controller.get_all_jobs_sorted_by_date()
-    return make_response_("success", "Fetched all jobs", jobs), 200
+    cursor, limit = get_page_args(request.args)
+    jobs, next_cursor = job_controller.get_all_jobs_sorted_by_date(
+            cursor, limit
+            )
+    return make_page_response_("Fetched all jobs", jobs, next_cursor), 200
@@ -0,0 +1,48 @@
+"""
+Maintenance commands for the Job-linker application, run through the
+Flask CLI on an application that starts no background work, so that a
+command is not raced by the scheduler's own sweep:
+
+    flask --app "server.api.v1.app:create_app(start_background=False)" \
+        <command>
+
+A command sending email starts the mail workers itself.
+"""
+
+import click
+
+from server.models import storage
+from server.services.mail import mail_service
+
+
+def register_commands(app):
+    """
+    Registers the maintenance commands on the Flask application.
+    """
+
+    @app.cli.command("reconcile-application-counts")
+    def reconcile_application_counts():
+        """Recompute jobs.applications_count from the applications table."""
+        fixed = storage.reconcile_application_counts()
+        click.echo(f"{fixed} job(s) had a stale applications_count")
+
+    @app.cli.command("requeue-dead-mail")
+    def requeue_dead_mail():
+        """Give the dead-lettered emails a new set of attempts."""
+        requeued = mail_service.outbox.requeue_dead()
+        if requeued:
+            mail_service.start_workers()
+            mail_service.drain(timeout=60)
+        click.echo(f"{requeued} email(s) requeued")
+
+    @app.cli.command("close-expired-jobs")
+    def close_expired_jobs():
+        """Close the jobs past their application deadline now."""
+        from server.controllers.job_controller import JobController
+
+        stats = JobController().close_expired_jobs()
+        mail_service.start_workers()
+        mail_service.drain(timeout=60)
+        click.echo(
+            f"{stats['closed']} job(s) closed, {stats['failed']} failed"
+        )
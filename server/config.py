@@ -45,6 +45,66 @@ class ApplicationConfig:
         MAX_CONTENT_LENGTH (int): The maximum size (in bytes) of the content
         that can be uploaded.
             The current limit is 2 MB.
+
+        JOB_SEARCH_ENGINE (str): The engine behind /jobs/search, either
+        "fuzzy" (in-process trigram index) or "fulltext" (the database's
+        native full-text search).
+
+        AI_CACHE_BACKEND (str): Where parsed AI results are cached: "memory",
+        "disk", "redis" or "none". AI_CACHE_TTL (seconds) and
+        AI_CACHE_MAX_ENTRIES bound the cache.
+
+        MATCH_CACHE_BACKEND (str): Where Gemini match scores are
+        memoized, "disk" by default, see AI_CACHE_BACKEND;
+        MATCH_CACHE_DIR, MATCH_CACHE_TTL and MATCH_CACHE_MAX_ENTRIES as
+        their AI_CACHE_ counterparts. The Redis backend shares
+        AI_CACHE_REDIS_DB under its own key prefix.
+
+        UPLOAD_ASYNC (bool): `True`, /upload queues the AI parsing and
+        answers 202 with a task id; a request can also ask for it with
+        `?async=true`. TASK_DB is the SQLite file of the task queue and
+        TASK_WORKERS its number of worker threads. A worker holds a task
+        for TASK_LEASE seconds, renewed while it runs; a task whose
+        lease ran out is run again by the next process started. Tasks
+        finished more than TASK_RETENTION seconds ago are deleted every
+        TASK_PURGE_INTERVAL seconds.
+
+        EXTRACT_WORKERS (int): Processes extracting the text of uploads.
+        EXTRACT_TIMEOUT (seconds), EXTRACT_MAX_PAGES, EXTRACT_MAX_CHARS and
+        EXTRACT_MAX_BYTES bound the work spent on one document.
+
+        DATA_PATH (str): The directory of the server's own data, apart
+        from the uploads: the SQLite files TASK_DB and MAIL_OUTBOX_DB
+        are kept there unless set.
+
+        MAIL_WORKERS (int): Threads sending the emails of the outbox,
+        the SQLite file MAIL_OUTBOX_DB, claiming MAIL_BATCH_SIZE of them
+        at a time. An email is dead-lettered after MAIL_MAX_ATTEMPTS
+        failed attempts. At exit the workers keep sending what is due
+        for MAIL_DRAIN_TIMEOUT seconds at most. Each thread keeps an
+        SMTP connection for SMTP_MAX_PER_CONNECTION emails, sends a NOOP
+        on it every SMTP_KEEPALIVE seconds while idle and closes it
+        after SMTP_IDLE_TIMEOUT seconds without an email.
+
+        GOOGLE_API_KEY (str): The Gemini API key. GEMINI_MODEL is the
+        model asked; GEMINI_MAX_CONCURRENCY caps the model calls in flight
+        in one process, and a call waits GEMINI_SLOT_TIMEOUT seconds at
+        most for its turn.
+
+        AI_INLINE_TEXT (bool): `True`, the text extracted from an upload
+        is sent to Gemini in the prompt, and the file itself is only
+        uploaded when it has no text (a scanned CV); `False` always
+        uploads the file.
+
+        MATCH_SCORER (str): How applications are scored: "ai" (Gemini),
+        "local" (services.match_scorer) or "local+ai" (local at once,
+        refined by Gemini in the background). RESCORE_WORKERS is the
+        number of threads asking Gemini when a whole job is re-scored.
+
+        JOB_SWEEP_INTERVAL (seconds): How often each worker closes the jobs
+        past their application deadline, JOB_SWEEP_BATCH_SIZE jobs at a
+        time; 0 disables the sweep. Listings only show open jobs, so an
+        expired job stays listed for up to this long.
     """
 
     SECRET_KEY = os.environ["SECRET_KEY"]
@@ -59,7 +119,8 @@ class ApplicationConfig:
     JWT_ACCESS_COOKIE_PATH = '/'
     JWT_REFRESH_COOKIE_PATH = '/refresh'
     JWT_COOKIE_SECURE = True  # Ensure this is True for production (HTTPS)
-    JWT_COOKIE_CSRF_PROTECT = False  # Adjust based on your CSRF protection needs
+    # Adjust based on your CSRF protection needs
+    JWT_COOKIE_CSRF_PROTECT = False
 
     # Redis configuration
     REDIS_HOST = os.environ["REDIS_HOST"]
@@ -94,14 +155,74 @@ class ApplicationConfig:
     UPLOAD_CV = os.path.join(BASE_UPLOAD_PATH, "cvs")
     UPLOAD_IMAGE = os.path.join(BASE_UPLOAD_PATH, "images")
     UPLOAD_TEMP = os.path.join(BASE_UPLOAD_PATH, "temp")
+    AI_CACHE_DIR = os.getenv(
+        "AI_CACHE_DIR", os.path.join(BASE_UPLOAD_PATH, "ai_cache")
+    )
+    MATCH_CACHE_DIR = os.getenv(
+        "MATCH_CACHE_DIR", os.path.join(BASE_UPLOAD_PATH, "match_cache")
+    )
+    DATA_PATH = os.getenv("DATA_PATH", os.path.join(os.getcwd(), "data"))
+    TASK_DB = os.getenv("TASK_DB", os.path.join(DATA_PATH, "tasks.db"))
+    MAIL_OUTBOX_DB = os.getenv(
+        "MAIL_OUTBOX_DB", os.path.join(DATA_PATH, "mail_outbox.db")
+    )
     ALLOWED_EXTENSIONS = {"pdf", "doc", "docx"}
     ALLOWED_IMAGE_EXTENSIONS = {"jpg", "jpeg", "png"}
     MAX_IMAGE_CONTENT_LENGTH = 2 * 1024 * 1024
     MAX_CONTENT_LENGTH = 2 * 1000 * 1000
 
+    JOB_SEARCH_ENGINE = os.getenv("JOB_SEARCH_ENGINE", "fuzzy")
+
+    # AI result cache
+    AI_CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND", "memory")
+    AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", 7 * 24 * 3600))
+    AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 1000))
+    AI_CACHE_REDIS_DB = int(os.getenv("AI_CACHE_REDIS_DB", 4))
+    MATCH_CACHE_BACKEND = os.getenv("MATCH_CACHE_BACKEND", "disk")
+    MATCH_CACHE_TTL = int(os.getenv("MATCH_CACHE_TTL", 30 * 24 * 3600))
+    MATCH_CACHE_MAX_ENTRIES = int(os.getenv("MATCH_CACHE_MAX_ENTRIES", 10000))
+
+    # Background tasks
+    UPLOAD_ASYNC = os.getenv("UPLOAD_ASYNC", "false").lower() == "true"
+    TASK_WORKERS = int(os.getenv("TASK_WORKERS", 2))
+    TASK_LEASE = int(os.getenv("TASK_LEASE", 60))
+    TASK_RETENTION = int(os.getenv("TASK_RETENTION", 7 * 24 * 3600))
+    TASK_PURGE_INTERVAL = int(os.getenv("TASK_PURGE_INTERVAL", 3600))
+
+    # Text extraction
+    EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 2))
+    EXTRACT_TIMEOUT = int(os.getenv("EXTRACT_TIMEOUT", 30))
+    EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", 10))
+    EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", 20000))
+    EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", 10 * 1000 * 1000))
+
+    # Email
+    MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))
+    MAIL_DRAIN_TIMEOUT = int(os.getenv("MAIL_DRAIN_TIMEOUT", 10))
+    MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 10))
+    MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+    SMTP_MAX_PER_CONNECTION = int(os.getenv("SMTP_MAX_PER_CONNECTION", 100))
+    SMTP_KEEPALIVE = int(os.getenv("SMTP_KEEPALIVE", 30))
+    SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", 300))
+
+    # Gemini
+    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+    GEMINI_SLOT_TIMEOUT = int(os.getenv("GEMINI_SLOT_TIMEOUT", 30))
+    AI_INLINE_TEXT = os.getenv("AI_INLINE_TEXT", "true").lower() == "true"
+
+    # Application scoring
+    MATCH_SCORER = os.getenv("MATCH_SCORER", "ai")
+    RESCORE_WORKERS = int(os.getenv("RESCORE_WORKERS", 8))
+
+    # Closing expired jobs
+    JOB_SWEEP_INTERVAL = int(os.getenv("JOB_SWEEP_INTERVAL", 60))
+    JOB_SWEEP_BATCH_SIZE = int(os.getenv("JOB_SWEEP_BATCH_SIZE", 100))
+
     UPLOADED_IMAGE_DEST = "server/images"
     UPLOADED_CV_DEST = "server/cvs"
     UPLOADED_JOB_DEST = "server/jobs"
 
-    for path in [UPLOAD_JOB, UPLOAD_CV, UPLOAD_IMAGE, UPLOAD_TEMP]:
+    for path in [UPLOAD_JOB, UPLOAD_CV, UPLOAD_IMAGE, UPLOAD_TEMP, DATA_PATH]:
         os.makedirs(path, exist_ok=True)
@@ -15,6 +15,8 @@ from server.models.recruiter import Recruiter
 from server.models.skill import Skill
 from server.models.user import User
 from server.models.work_experience import WorkExperience
+from server.services.mail import mail_service
+from server.services.search_index import job_index
 
 
 class AdminController:
@@ -36,22 +38,25 @@ class AdminController:
         if not user.is_admin:
             raise UnauthorizedError("Unauthorized")
 
-    def get_all_users(self, curr_user_id):
+    def get_all_users(self, curr_user_id, cursor=None, limit=None):
         """
-        Fetches all users in the system.
+        Fetches one page of the users in the system.
 
         This method should only be accessible by admin users.
 
+        Args:
+            cursor (str): The cursor returned with the previous page.
+            limit (int): The maximum number of users to return.
+
         Raises:
             UnauthorizedError: If the current user is not an admin.
 
         Returns:
-            list: A list of all users.
+            tuple: A list of users and the cursor of the next page.
         """
         self._check_admin(curr_user_id)
 
-        users = storage.all(User).values()
-        return users
+        return storage.paginate(User, cursor=cursor, limit=limit)
 
     def delete_user(self, target_user_id, curr_user_id):
         """
@@ -85,6 +90,10 @@ class AdminController:
         storage.delete(user)
         storage.save()
 
+        if recruiter:
+            for job in jobs:
+                job_index.remove(job.id)
+
     def disable_user(self, target_user_id, curr_user_id):
         """
         Disables a specific user account.
@@ -185,3 +194,18 @@ class AdminController:
         }
 
         return {name: storage.count(model) for name, model in models.items()}
+
+    def get_mail_statistics(self, curr_user_id):
+        """
+        Fetches the metrics of the mail service of this process.
+
+        Raises:
+            UnauthorizedError: If the current user is not an admin.
+
+        Returns:
+            Dict: The queue depth, the worker threads alive, the emails
+            queued, sent, failed and being sent, and the number of
+            threads of the process.
+        """
+        self._check_admin(curr_user_id)
+        return mail_service.stats()
@@ -3,10 +3,12 @@ This module provides a controller for the Application model in the
 Job-linker application.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
 from marshmallow import ValidationError
 
+from server.config import ApplicationConfig
 from server.controllers.schemas import application_schema
 from server.exception import UnauthorizedError
 from server.models import storage
@@ -17,7 +19,9 @@ from server.models.recruiter import Recruiter
 from server.models.user import User
 from server.services.ai_job_matcher import AIJobMatcher
 from server.email_templates import application_submission_email
-from server.services.mail import MailService
+from server.services.mail import mail_service
+from server.services.match_scorer import match_scorer
+from server.services.task_queue import task_queue
 
 
 class ApplicationsController:
@@ -29,7 +33,7 @@ class ApplicationsController:
         """
         Initialize the ApplicationsController.
         """
-        self.email_service = MailService()
+        self.email_service = mail_service
 
     def get_application(self, user_id, application_id=None):
         """
@@ -197,11 +201,13 @@ class ApplicationsController:
         )
         storage.new(new_application)
 
-        matcher = AIJobMatcher(candidate, job)
-        match_score = matcher.calculate_match_score()
-
-        new_application.match_score = match_score
+        new_application.match_score = self.score(candidate, job)
         storage.save()
+        if ApplicationConfig.MATCH_SCORER == "local+ai":
+            # the local score stands until the model's replaces it
+            task_queue.submit(
+                "refine_match_score", {"application_id": new_application.id}
+            )
 
         # Prepare the email
         email = candidate.user.email
@@ -217,10 +223,61 @@ class ApplicationsController:
         subject = "Application Submitted Successfully for {}".format(job_title)
 
         # Send the email
-        self.email_service.send_mail(template, email, name, subject)
+        self.email_service.send_mail(
+            template, email, name, subject,
+            idempotency_key=f"application-submitted:{new_application.id}",
+        )
 
         return new_application
 
+    @staticmethod
+    def score(candidate, job):
+        """
+        Score a candidate for a job with the scorer set in
+        ApplicationConfig.MATCH_SCORER: "ai" asks Gemini, "local" and
+        "local+ai" use the local scorer.
+
+        Returns:
+            float: The match score, between 0.0 and 1.0.
+        """
+        if ApplicationConfig.MATCH_SCORER == "ai":
+            return AIJobMatcher(candidate, job).calculate_match_score()
+        return match_scorer.score(candidate, job)
+
+    @staticmethod
+    def score_many(job, candidates, workers=None):
+        """
+        Score many candidates for one job with the scorer set in
+        ApplicationConfig.MATCH_SCORER.
+
+        The local scorer is CPU bound and computes the job's features
+        once, so it runs in the calling thread; Gemini calls wait on the
+        network and run in a pool of RESCORE_WORKERS threads.
+
+        Args:
+            job (Job): with skills loaded.
+            candidates: candidates with skills, experiences and
+                educations loaded.
+            workers (int): threads calling Gemini.
+
+        Returns:
+            list: The match score of each candidate, in order; None where
+            Gemini failed.
+        """
+        if ApplicationConfig.MATCH_SCORER != "ai":
+            return match_scorer.score_many(job, candidates)
+
+        def ask(candidate):
+            try:
+                return AIJobMatcher(candidate, job).calculate_match_score()
+            except Exception as e:
+                print(f"scoring candidate {candidate.id} failed: {e}")
+                return None
+
+        workers = workers or ApplicationConfig.RESCORE_WORKERS
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(ask, candidates))
+
     def update_application(self, user_id, application_id, data):
         """
         Update an existing application.
@@ -326,3 +383,20 @@ class ApplicationsController:
         )
 
         return hired_count
+
+
+@task_queue.handler("refine_match_score")
+def refine_match_score(payload, progress):
+    """Replace the local match score of an application with Gemini's"""
+    try:
+        application = storage.get(Application, payload["application_id"])
+        if application is None:
+            return {"match_score": None}  # withdrawn in the meantime
+        progress("asking the model")
+        matcher = AIJobMatcher(application.candidate, application.job)
+        application.match_score = matcher.calculate_match_score()
+        storage.save()
+        return {"match_score": application.match_score}
+    finally:
+        # worker threads get their own session, release it
+        storage.close()
@@ -8,12 +8,13 @@ from sqlalchemy.exc import IntegrityError
 
 from server.controllers.education_controller import EducationController
 from server.controllers.schemas import candidate_schema
-from server.controllers.work_experience_controller import WorkExperienceController
+from server.controllers.work_experience_controller import (
+    WorkExperienceController,
+)
 from server.exception import UnauthorizedError
 from server.models import storage
 from server.models.candidate import Candidate
 from server.models.education import Education
-from server.models.job import Job
 from server.models.language import Language
 from server.models.major import Major
 from server.models.recruiter import Recruiter
@@ -27,6 +28,8 @@ class CandidateController:
     Controller for Candidate model.
     """
 
+    RECOMMENDATIONS_LIMIT = 20
+
     def __init__(self):
         """
         Initializes the CandidateController.
@@ -373,18 +376,23 @@ class CandidateController:
 
         return candidate
 
-    def recommend_jobs(self, user_id):
+    def recommend_jobs(self, user_id, limit=None, exclude_applied=False):
         """
         Recommend jobs for a specific candidate.
 
-        This method returns a list of jobs that are recommended for the
-        specified candidate based on their skills and major.
+        This method returns the open jobs of the candidate's major that
+        share skills with the candidate, ranked by the number of shared
+        skills.
 
         Args:
             user_id: The ID of the candidate to fetch recommendations for.
+            limit: The maximum number of jobs to return.
+            exclude_applied: Leave out the jobs the candidate applied for.
 
         Returns:
-            A list of Job objects that are recommended for the candidate.
+            A list of dictionaries with the recommended Job, the number of
+            shared skills and whether the candidate has applied for it,
+            best match first.
         """
         # Check user role
         user = storage.get(User, user_id)
@@ -396,33 +404,18 @@ class CandidateController:
         if not candidate:
             raise ValueError("Candidate not found")
 
-        # Fetch the candidate's skills and major
-        candidate_skills = [skill.name for skill in candidate.skills]
-        candidate_major = candidate.major.name
-
-        # Fetch all jobs
-        all_jobs = storage.all(Job).values()
-
-        # Filter jobs based on the candidate's skills and major
-        recommended_jobs = []
-        for job in all_jobs:
-            job_skills = [skill.name for skill in job.skills]
-            job_major = job.major.name
-            # Check if the candidate's skills match the job's skills
-            # and the candidate's major matches the job's major
-            if (
-                set(candidate_skills).intersection(job_skills)
-                and candidate_major == job_major
-            ):
-                # Check if the candidate has applied for this job before
-                has_applied = any(
-                    application.job_id == job.id
-                    for application in candidate.applications
-                )
-                recommended_jobs.append(
-                    {"job": job, "has_applied": has_applied})
-
-        return recommended_jobs
+        ranked = storage.rank_jobs(
+            candidate,
+            limit=min(
+                limit or self.RECOMMENDATIONS_LIMIT, storage.MAX_PAGE_SIZE
+                ),
+            exclude_applied=exclude_applied,
+            profile="job_card",
+        )
+        return [
+            {"job": job, "skill_overlap": overlap, "has_applied": has_applied}
+            for job, overlap, has_applied in ranked
+        ]
 
     def add_work_experience(self, user_id, data):
         """
@@ -19,6 +19,7 @@ from server.prompts import ATS_FRIENDLY_PROMPT, CANDID_PROMPT, JOB_PROMPT
 from server.services.ai import AIService
 from server.services.ai_cand_creator import AICandidateProfileCreator
 from server.services.ai_job_creator import AIJobCreator
+from server.services.task_queue import task_queue
 
 
 circuit_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=60)
@@ -58,11 +59,15 @@ class FileController:
 
     def process_upload(
         self, file_path, original_filename,
-        user_id, major_id=None
+        user_id, major_id=None, progress=None
     ):
         """Process the uploaded file based on the user's role.
         It creates candidate profile or job from the uploaded file.
+
+        Args:
+            progress: optional callable told the name of each stage
         """
+        progress = progress or (lambda stage: None)
         ai = AIService(file_path=file_path)
 
         # This logic will work with authorized or Unauthorized users
@@ -70,7 +75,9 @@ class FileController:
         size = os.stat(file_path).st_size
 
         if user and user.role == "candidate":
+            progress("parsing")
             ai_data = ai.to_dict(CANDID_PROMPT)
+            progress("creating profile")
             creator = AICandidateProfileCreator(
                 user_id, ai_data, self.bcrypt_instance)
             candidate = creator.create_profile()
@@ -90,8 +97,10 @@ class FileController:
             )
 
         elif user and user.role == "recruiter":
+            progress("parsing")
             ai_data = ai.to_dict(JOB_PROMPT)
             ai_data["major_id"] = major_id
+            progress("creating job")
             creator = AIJobCreator(user_id, ai_data)
             job = creator.create_job()
             new_file_path = os.path.join(
@@ -110,6 +119,7 @@ class FileController:
             )
 
         else:
+            progress("parsing")
             ai_data = ai.to_dict(CANDID_PROMPT)
             if os.path.exists(file_path):
                 os.remove(file_path)
@@ -122,6 +132,50 @@ class FileController:
                 201,
             )
 
+    def enqueue_upload(
+        self, file_path, original_filename,
+        user_id, major_id=None
+    ):
+        """Queue the processing of an uploaded file, see process_upload.
+
+        Returns:
+            The id of the task, to poll with get_upload_task.
+        """
+        return task_queue.submit(
+            "process_upload",
+            {
+                "file_path": file_path,
+                "original_filename": original_filename,
+                "user_id": user_id,
+                "major_id": major_id,
+            },
+            owner_id=user_id,
+        )
+
+    def get_upload_task(self, task_id, user_id=None):
+        """Get the state of a queued upload.
+
+        Args:
+            task_id (str): The id returned by enqueue_upload.
+            user_id (str): The id of the user asking, None for a visitor.
+
+        Returns:
+            The task's status, progress and, once done, its result, or
+            None if there is no such task for this user.
+        """
+        task = task_queue.status(task_id)
+        if (
+            task is None
+            or task["kind"] != "process_upload"
+            or task["owner_id"] != user_id
+        ):
+            return None
+        return {
+            key: task[key]
+            for key in ("id", "status", "progress", "result", "error",
+                        "created_at", "updated_at")
+        }
+
     @circuit_breaker
     def generate_insights(self, file_path):
         """Generate ATS insights for the uploaded file."""
@@ -146,3 +200,21 @@ class FileController:
             ]
         )
         return "Count retrieved successfully", {"count": num_files}, 200
+
+
+@task_queue.handler("process_upload")
+def run_upload_task(payload, progress):
+    """Worker side of FileController.enqueue_upload"""
+    try:
+        with app.app_context():
+            message, data, status_code = FileController().process_upload(
+                payload["file_path"],
+                payload["original_filename"],
+                payload["user_id"],
+                payload["major_id"],
+                progress=progress,
+            )
+        return {"message": message, "data": data, "status_code": status_code}
+    finally:
+        # worker threads get their own session, release it
+        storage.close()
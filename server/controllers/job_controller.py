@@ -4,11 +4,12 @@ Job-linker application.
 """
 
 import json
+import time
 from datetime import datetime
 
-from fuzzywuzzy import fuzz
 from marshmallow import ValidationError
 
+from server.config import ApplicationConfig
 from server.controllers.schemas import job_schema
 from server.email_templates import (
     no_shortlisted_candidates_email,
@@ -25,7 +26,11 @@ from server.models.major import Major
 from server.models.recruiter import Recruiter
 from server.models.skill import Skill
 from server.models.user import User
-from server.services.mail import MailService
+from server.services.job_search import get_search_engine
+from server.services.mail import mail_service
+from server.services.scheduler import scheduler
+from server.services.search_index import job_index
+from server.services.task_queue import task_queue
 
 
 class JobController:
@@ -34,14 +39,19 @@ class JobController:
     """
 
     MATCH_SCORE_THRESHOLD = 0.4
+    RECOMMENDATIONS_LIMIT = 20
     STATUS_SHORTLISTED = "shortlisted"
     STATUS_REJECTED = "rejected"
+    # the attributes of a job a match score depends on
+    SCORING_FIELDS = (
+        "job_description", "responsibilities", "exper_years", "major_id"
+    )
 
     def __init__(self):
         """
         Initializes the JobController.
         """
-        self.email_service = MailService()
+        self.email_service = mail_service
 
     def create_job(self, user_id, data):
         """
@@ -101,6 +111,7 @@ class JobController:
         )
         storage.new(new_job)
         storage.save()
+        job_index.add(new_job)
 
         return new_job
 
@@ -119,15 +130,12 @@ class JobController:
             ValueError: If the job is not found.
         """
         # Get job
-        job = storage.get(Job, job_id)
+        job = storage.get(Job, job_id, profile="job_detail")
         if not job:
             raise ValueError("Job not found")
 
         # Get applications for the job
-        applications = []
-        if job:
-            applications = storage.get_all_by_attr(
-                Application, "job_id", job.id)
+        applications = job.applications
 
         # Check if user is a recruiter
         recruiter = storage.get_by_attr(Recruiter, "user_id", user_id)
@@ -165,7 +173,7 @@ class JobController:
         # If the user is a candidate or a visitor, add a count displays
         # the number
         # of the candidates who applied for this job
-        rec_user = storage.get_by_attr(Recruiter, "id", job.recruiter_id)
+        rec_user = job.recruiter
         if rec_user:
             company_name = json.loads(
                 rec_user.user.contact_info).get("company_name")
@@ -174,7 +182,7 @@ class JobController:
             "job_title": job.job_title,
             "created_at": job.created_at,
             "job_description": job.job_description,
-            "applications_count": len(applications),
+            "applications_count": job.applications_count,
             "company_name": company_name if rec_user else None,
             "location": job.location,
             "salary": job.salary,
@@ -220,44 +228,82 @@ class JobController:
 
         # Check if the job is being closed
         is_being_closed = job.is_open and not data.get("is_open", True)
+        scores_stale = any(
+            key in data and data[key] != getattr(job, key)
+            for key in self.SCORING_FIELDS
+        )
 
         for key, value in data.items():
             setattr(job, key, value)
+        if is_being_closed:
+            job.times_closed += 1
 
         # If the job is closed, shortlist candidates and send emails
         # and notify the recruiter with the shortlisted candidates
-        if is_being_closed:
+        if is_being_closed and scores_stale:
+            # shortlist on scores of the job as it is now; re-scoring
+            # every application is too slow for a request
+            storage.save()
+            task_queue.submit("close_job", {"job_id": job.id})
+        elif is_being_closed:
+            # commits the job with its applications' new statuses
             self.handle_job_closure(job, recruiter)
-
-        storage.save()
+        else:
+            storage.save()
+            if scores_stale:
+                self.queue_rescore(job)
+        job_index.update(job)
 
         return job
 
     def handle_job_closure(self, job, recruiter):
-        """Handle Job Closing Process and email notifications"""
-        applications = storage.get_all_by_attr(Application, "job_id", job.id)
+        """
+        Handle Job Closing Process and email notifications.
+
+        The applicants are loaded with their users in one query, shortlisted
+        or rejected by MATCH_SCORE_THRESHOLD with two UPDATEs committed in
+        one transaction, along with any pending change to the job, and
+        their emails and the recruiter's are added to the outbox as one
+        batch once committed. The emails are keyed by job.times_closed,
+        so a job reopened and closed again emails everyone again.
+
+        Args:
+            job (Job): The job being closed.
+            recruiter (Recruiter): The recruiter who posted it.
+        """
+        applicants = storage.job_applicants(job.id)
+        storage.set_application_statuses(
+            job.id, self.MATCH_SCORE_THRESHOLD,
+            self.STATUS_SHORTLISTED, self.STATUS_REJECTED,
+        )
+        storage.save()
+
         shortlisted_candidates = []
         company_name = json.loads(
-            recruiter.user.contact_info).get("company_name")
+            recruiter.user.contact_info or "{}").get("company_name")
         job_title = job.job_title
-        for application in applications:
-            candidate = storage.get(Candidate, application.candidate_id)
-            email = candidate.user.email
-            name = candidate.user.name
-            contact_info = candidate.user.contact_info
-
-            if application.match_score > self.MATCH_SCORE_THRESHOLD:
-                application.application_status = self.STATUS_SHORTLISTED
+        emails = []
+        for applicant in applicants:
+            name, email = applicant.name, applicant.email
+            # the same test as set_application_statuses
+            if (
+                applicant.match_score is not None
+                and applicant.match_score > self.MATCH_SCORE_THRESHOLD
+            ):
                 template = shortlisted_email(name, company_name, job_title)
                 subject = "Job Application Shortlisted"
-                shortlisted_candidates.append((name, email, contact_info))
+                shortlisted_candidates.append(
+                    (name, email, applicant.contact_info)
+                )
             else:
-                application.application_status = self.STATUS_REJECTED
                 template = rejection_email(name, company_name, job_title)
                 subject = "Job Application Status"
-
-            self.email_service.send_mail(template, email, name, subject)
-            storage.save()
+            emails.append({
+                "template": template, "receiver_email": email,
+                "name": name, "subject": subject,
+                "idempotency_key": f"job-closed:{job.id}:"
+                    f"{job.times_closed}:{applicant.application_id}",
+            })
 
         recruiter_email = recruiter.user.email
         if shortlisted_candidates:
@@ -271,10 +317,198 @@ class JobController:
                 recruiter.user.name, company_name, job_title
             )
             subject = "No Candidates Shortlisted"
+        emails.append({
+            "template": shortlisted_template,
+            "receiver_email": recruiter_email, "name": "Recruiter",
+            "subject": subject,
+            "idempotency_key":
+                f"job-closed:{job.id}:{job.times_closed}:recruiter",
+        })
+
+        self.email_service.send_many(emails)
+
+    def close_expired_jobs(self, now=None, batch_size=None):
+        """
+        Closes the open jobs whose application deadline has passed, as
+        their recruiters would, batch_size jobs at a time.
+
+        Each job is claimed by a conditional UPDATE committed with its
+        applications' statuses, so that of several workers sweeping at
+        once only one closes it. A job failing to close is rolled back
+        and left open for the next sweep.
+
+        Args:
+            now: time the deadlines are compared with.
+            batch_size: The number of jobs loaded at a time.
+
+        Returns:
+            Dict: The number of jobs closed, skipped as closed by another
+            worker, and failed, and the seconds spent.
+        """
+        now = now or datetime.utcnow()
+        batch_size = batch_size or ApplicationConfig.JOB_SWEEP_BATCH_SIZE
+        start = time.perf_counter()
+        closed, skipped, failed = 0, 0, 0
+        # jobs not closed by this sweep, not to be returned again
+        passed = []
+        while True:
+            ids = storage.expired_job_ids(now, batch_size, exclude=passed)
+            if not ids:
+                break
+            for job in storage.find(Job, Job.id.in_(ids), profile="job_card"):
+                try:
+                    if not storage.claim_job_closure(job.id):
+                        # closed by another worker, drop it from the
+                        # index of this one
+                        job_index.remove(job.id)
+                        skipped += 1
+                        passed.append(job.id)
+                        continue
+                    self.handle_job_closure(job, job.recruiter)
+                except Exception as e:
+                    print(f"Failed to close expired job {job.id}:", e)
+                    storage.rollback()
+                    failed += 1
+                    passed.append(job.id)
+                    continue
+                closed += 1
+                job_index.update(job)
+
+        return {
+            "closed": closed,
+            "skipped": skipped,
+            "failed": failed,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    def rescore_applications(self, user_id, job_id):
+        """
+        Queues the re-scoring of every application of a job.
+
+        Args:
+            user_id: The ID of the recruiter.
+            job_id: The ID of the job.
+
+        Returns:
+            str: The id of the rescore_job task, to poll with
+            get_rescore_task.
+
+        Raises:
+            ValueError: If the job is not found.
+            UnauthorizedError: If the user is not a recruiter.
+        """
+        return self.queue_rescore(self._get_recruiter_job(user_id, job_id))
+
+    def get_rescore_task(self, user_id, job_id, task_id):
+        """
+        Gets the state of a queued re-scoring of a job.
+
+        Returns:
+            The task's status, progress and, once done, the throughput
+            stats of rescore_job, or None if it is no re-scoring of
+            this job.
+
+        Raises:
+            ValueError: If the job is not found.
+            UnauthorizedError: If the user is not a recruiter.
+        """
+        job = self._get_recruiter_job(user_id, job_id)
+        task = task_queue.store.get(task_id)
+        if (
+            task is None
+            or task["kind"] != "rescore_job"
+            or task["payload"] != {"job_id": job.id}
+        ):
+            return None
+        return {
+            key: task[key]
+            for key in ("id", "status", "progress", "result", "error",
+                        "created_at", "updated_at")
+        }
+
+    def _get_recruiter_job(self, user_id, job_id):
+        """the job of id job_id, posted by the recruiter user_id"""
+        recruiter = storage.get_by_attr(Recruiter, "user_id", user_id)
+        if not recruiter:
+            raise UnauthorizedError()
+
+        job = storage.get(Job, job_id)
+        if not job or job.recruiter_id != recruiter.id:
+            raise ValueError("Job not found")
+        return job
+
+    @staticmethod
+    def queue_rescore(job):
+        """
+        Queues the re-scoring of the applications of a job, unless one
+        is queued already: it reads the job as it is when it runs, so
+        a burst of edits is scored once.
+
+        Returns:
+            str: The id of the rescore_job task.
+        """
+        return task_queue.submit(
+                "rescore_job", {"job_id": job.id}, coalesce=True
+                )
+
+    @staticmethod
+    def rescore_job(job):
+        """
+        Recomputes the match score of every application of a job.
+
+        The applicants are loaded with their skills, experiences and
+        educations in four queries, scored by
+        ApplicationsController.score_many and written back with one bulk
+        UPDATE. A score Gemini failed to give keeps its old value.
 
-        self.email_service.send_mail(
-            shortlisted_template, recruiter_email, "Recruiter", subject
+        Args:
+            job (Job): The job whose applications are re-scored.
+
+        Returns:
+            dict: applications, updated, failed, the seconds spent
+            loading, scoring and writing, and applications scored per
+            second.
+        """
+        # imported here: the scorers load the Gemini client, which job
+        # listings and searches never need
+        from server.controllers.application_controller import (
+            ApplicationsController)
+
+        started = time.perf_counter()
+        applications = storage.get_all_by_attr(
+            Application, "job_id", job.id, profile="application_scoring"
         )
+        loaded = time.perf_counter()
+        scores = ApplicationsController.score_many(
+            job, [application.candidate for application in applications]
+        )
+        scored = time.perf_counter()
+        rows = [
+            {"id": application.id, "match_score": score}
+            for application, score in zip(applications, scores)
+            if score is not None
+        ]
+        updated = storage.bulk_update(Application, rows)
+        written = time.perf_counter()
+
+        if ApplicationConfig.MATCH_SCORER == "local+ai":
+            for row in rows:
+                task_queue.submit(
+                    "refine_match_score", {"application_id": row["id"]}
+                )
+
+        elapsed = written - started
+        return {
+            "applications": len(applications),
+            "updated": updated,
+            "failed": len(applications) - updated,
+            "load_seconds": round(loaded - started, 4),
+            "score_seconds": round(scored - loaded, 4),
+            "write_seconds": round(written - scored, 4),
+            "per_second": (
+                round(len(applications) / elapsed, 1) if elapsed else None
+            ),
+        }
 
     def delete_job(self, user_id, job_id):
         """
@@ -301,6 +535,7 @@ class JobController:
         # Delete job
         storage.delete(job)
         storage.save()
+        job_index.remove(job.id)
 
     def add_skill(self, user_id, job_id, skill_id):
         """
@@ -339,6 +574,7 @@ class JobController:
         if skill not in job.skills:
             job.skills.append(skill)
             storage.save()
+            self.queue_rescore(job)
 
         return job
 
@@ -381,6 +617,7 @@ class JobController:
         # Remove skill from job
         job.skills.remove(skill)
         storage.save()
+        self.queue_rescore(job)
 
         return job
 
@@ -402,14 +639,14 @@ class JobController:
             UnauthorizedError: If the user is not a candidate or a recruiter.
         """
 
-        def create_job_data(job, applications, company_name=None):
+        def create_job_data(job, company_name=None):
             """Helper function to create job data dictionary."""
             job_data = {
                 "id": job.id,
                 "job_title": job.job_title,
                 "created_at": job.created_at,
                 "job_description": job.job_description,
-                "applications_count": len(applications),
+                "applications_count": job.application_count,
                 "application_deadline": job.application_deadline,
                 "is_open": job.is_open,
                 "location": job.location,
@@ -425,14 +662,15 @@ class JobController:
         # Check if user is a candidate
         candidate = storage.get_by_attr(Candidate, "user_id", user_id)
         if candidate:
-            jobs = storage.get_all_by_attr(Job, "major_id", candidate.major_id)
+            jobs = storage.get_all_by_attr(
+                    Job, "major_id", candidate.major_id, profile="job_card"
+                    )
             if not jobs:
                 raise ValueError("No jobs found for your major")
 
             return [
                 create_job_data(
                     job,
-                    storage.get_all_by_attr(Application, "job_id", job.id),
                     (
                         json.loads(recruiter.user.contact_info).get(
                             "company_name")
@@ -442,45 +680,43 @@ class JobController:
                     ),
                 )
                 for job in jobs
-                if (recruiter := storage.get_by_attr(
-                    Recruiter, "id", job.recruiter_id
-                    ))
-                is not None
+                if (recruiter := job.recruiter) is not None
             ]
 
         # Check if user is a recruiter
         recruiter = storage.get_by_attr(Recruiter, "user_id", user_id)
         if recruiter:
-            jobs = storage.get_all_by_attr(Job, "recruiter_id", recruiter.id)
+            jobs = storage.get_all_by_attr(
+                    Job, "recruiter_id", recruiter.id, profile="job_card"
+                    )
             if not jobs:
                 raise ValueError("No jobs found")
 
-            return [
-                create_job_data(
-                    job,
-                    storage.get_all_by_attr(Application, "job_id", job.id),
-                )
-                for job in jobs
-            ]
+            return [create_job_data(job) for job in jobs]
 
         raise UnauthorizedError("You are not a candidate or a recruiter")
 
-    def get_all_jobs_sorted_by_major(self):
+    def get_all_jobs_sorted_by_major(self, cursor=None, limit=None):
         """
-        Gets all jobs sorted by their major.
+        Gets one page of the open jobs, sorted by their major.
+
+        Args:
+            cursor: The cursor returned with the previous page.
+            limit: The maximum number of jobs to return.
 
         Returns:
-            The jobs sorted by their major.
+            The jobs of the page sorted by their major, and the cursor
+            of the next page.
         """
 
-        def create_job_data(job, applications, company_name=None):
+        def create_job_data(job, company_name=None):
             """Helper function to create job data dictionary."""
             job_data = {
                 "id": job.id,
                 "job_title": job.job_title,
                 "created_at": job.created_at,
                 "job_description": job.job_description,
-                "applications_count": len(applications),
+                "applications_count": job.application_count,
                 "application_deadline": job.application_deadline,
                 "is_open": job.is_open,
                 "location": job.location,
@@ -497,14 +733,17 @@ class JobController:
                 )
             return job_data
 
-        jobs_dict = storage.all(Job)
-        jobs = list(jobs_dict.values())
-        jobs.sort(key=lambda job: job.major_id)
+        # the keyset leads with major_id, so pages follow one another
+        # in major order
+        jobs, next_cursor = storage.paginate(
+                Job, Job.is_open == True,  # noqa: E712
+                cursor=cursor, limit=limit, sort_by="major_id",
+                profile="job_card"
+                )
 
         return [
             create_job_data(
                 job,
-                storage.get_all_by_attr(Application, "job_id", job.id),
                 (
                     json.loads(recruiter.user.contact_info).get("company_name")
                     if recruiter and recruiter.user
@@ -513,12 +752,8 @@ class JobController:
                 ),
             )
             for job in jobs
-            if (recruiter := storage.get_by_attr(
-                Recruiter, "id", job.recruiter_id
-                ))
-            is not None
-            and job.is_open
-        ]
+            if (recruiter := job.recruiter) is not None
+        ], next_cursor
 
     def get_job_counts(self):
         """
@@ -544,91 +779,101 @@ class JobController:
 
         return {"total_count": total_count, "major_counts": major_counts}
 
-    def search_jobs(self, location=None, title=None, sort=[]):
+    def search_jobs(self, location=None, title=None, sort=None, cursor=None,
+                    limit=None):
         """
-        Search for jobs by location and title.
+        Search for jobs by location and title, one page at a time.
 
         Args:
             location (str): The location to search for.
             title (str): The title to search for.
+            sort (str): "date" to get the newest jobs first instead of the
+                most relevant.
+            cursor: The cursor returned with the previous page.
+            limit: The maximum number of jobs to return.
 
         Returns:
-            A list of jobs that match the search criteria.
-        """
-        jobs_dict = storage.all(Job)
-        matched_jobs = {}
-
-        for k, v in jobs_dict.items():
-            # Skip if the job is not open
-            if not v.is_open:
-                continue
-            # Skip if the job is expired
-            if v.application_deadline and datetime.utcnow() > v.application_deadline:
-                continue
-            # Calculate match scores for location and title
-            location_score = (
-                fuzz.token_set_ratio(location.lower(), v.location.lower())
-                if location
-                else 100
-            )
-            title_score = (
-                fuzz.token_set_ratio(title.lower(), v.job_title.lower())
-                if title
-                else 100
-            )
-
-            # If both scores are above a certain threshold
-            # add the job to the results
-            if location_score > 70 and title_score > 70:
-                matched_jobs[k] = v
+            The jobs that match the search criteria, and the cursor of the
+            next page.
 
-        jobs = list(matched_jobs.values())
-        if "date" in sort:
-            jobs.sort(key=lambda job: job.created_at, reverse=True)
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        # matches are ranked, not keyed, so the cursor is an offset
+        try:
+            offset = int(cursor) if cursor else 0
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        if offset < 0:
+            raise ValueError("Invalid cursor")
+        limit = min(limit or storage.DEFAULT_PAGE_SIZE, storage.MAX_PAGE_SIZE)
+
+        # the fuzzy index lags behind jobs closed by other workers: those
+        # are dropped from it and the window fetched again
+        engine = get_search_engine()
+        while True:
+            ids = engine.search(
+                    location, title, offset=offset, limit=limit + 1,
+                    newest_first=sort == "date"
+                    )
+            jobs = storage.find(
+                    Job, Job.id.in_(ids), Job.is_open == True,  # noqa: E712
+                    profile="job_card"
+                    ) if ids else []
+            stale = set(ids).difference(job.id for job in jobs)
+            if not stale or not engine.discard(stale):
+                break
+
+        next_cursor = str(offset + limit) if len(ids) > limit else None
+        rank = {id: i for i, id in enumerate(ids)}
+        jobs.sort(key=lambda job: rank[job.id])
+        jobs = jobs[:limit]
 
         jobs = [job.to_dict for job in jobs]
 
-        return jobs
+        return jobs, next_cursor
 
-    def get_all_jobs_sorted_by_date(self):
+    def get_all_jobs_sorted_by_date(self, cursor=None, limit=None):
         """
-        Gets all jobs sorted by created_at, the newest first.
+        Gets one page of the open jobs sorted by created_at, the newest
+        first.
+
+        Args:
+            cursor: The cursor returned with the previous page.
+            limit: The maximum number of jobs to return.
 
         Returns:
-            The jobs sorted by created_at.
+            The jobs sorted by created_at, and the cursor of the next page.
         """
-        jobs_dict = storage.all(Job)
-
-        # Filter out closed jobs
-        jobs = [job for job in jobs_dict.values() if job.is_open]
-
-        # Filter out expired jobs
-        jobs = [
-                job for job in jobs
-                if not job.application_deadline
-                or datetime.utcnow() < job.application_deadline
-                ]
-
-        # Sort jobs by created_at
-        jobs.sort(key=lambda job: job.created_at, reverse=True)
+        # Filter out closed jobs; expired ones are closed by the sweeper
+        jobs, next_cursor = storage.paginate(
+            Job,
+            Job.is_open == True,  # noqa: E712
+            cursor=cursor,
+            limit=limit,
+            newest_first=True,
+            profile="job_card",
+        )
 
         jobs = [job.to_dict for job in jobs]
 
-        return jobs
+        return jobs, next_cursor
 
-    def recommend_candidates(self, job_id, user_id):
+    def recommend_candidates(self, job_id, user_id, limit=None):
         """
         Recommend candidates for a specific job.
 
-        This method returns a list of candidates that are recommended for
-        the specified job based on the job's required skills and major.
+        This method returns the candidates of the job's major that share
+        skills with the job, ranked by the number of shared skills.
 
         Args:
             job_id: The ID of the job to fetch recommendations for.
             user_id: The ID of the recruiter requesting the recommendations.
+            limit: The maximum number of candidates to return.
 
         Returns:
-            A list of Candidate objects that are recommended for the job.
+            A list of Candidate objects that are recommended for the job,
+            best match first.
         """
         # Check if user is a recruiter
         recruiter = storage.get_by_attr(Recruiter, "user_id", user_id)
@@ -640,24 +885,54 @@ class JobController:
         if not job:
             raise ValueError("Job not found")
 
-        # Fetch the job's required skills and major
-        job_skills = [skill.name for skill in job.skills]
-        job_major = job.major.name
-
-        # Fetch all candidates
-        all_candidates = storage.all(Candidate).values()
-
-        # Filter candidates based on the job's required skills and major
-        recommended_candidates = []
-        for candidate in all_candidates:
-            candidate_skills = [skill.name for skill in candidate.skills]
-            candidate_major = candidate.major.name
-            # Check if the job's required skills match the candidate's skills
-            # and the job's major matches the candidate's major
-            if (
-                set(job_skills).intersection(candidate_skills)
-                and job_major == candidate_major
-            ):
-                recommended_candidates.append(candidate)
-
-        return recommended_candidates
+        ranked = storage.rank_candidates(
+                job,
+                limit=min(
+                    limit or self.RECOMMENDATIONS_LIMIT, storage.MAX_PAGE_SIZE
+                    ),
+                profile="candidate_card",
+                )
+        return [candidate for candidate, _ in ranked]
+
+
+@task_queue.handler("rescore_job")
+def rescore_job(payload, progress):
+    """Re-score the applications of a job after an edit"""
+    try:
+        job = storage.get(Job, payload["job_id"], profile="job_card")
+        if job is None:
+            return None  # deleted in the meantime
+        progress("scoring applications")
+        return JobController.rescore_job(job)
+    finally:
+        # worker threads get their own session, release it
+        storage.close()
+
+
+@scheduler.every("close_expired_jobs", ApplicationConfig.JOB_SWEEP_INTERVAL)
+def close_expired_jobs():
+    """Close the jobs past their application deadline"""
+    try:
+        return JobController().close_expired_jobs()
+    finally:
+        # the scheduler thread gets its own session, release it
+        storage.close()
+
+
+@task_queue.handler("close_job")
+def close_job(payload, progress):
+    """Re-score the applications of a job closed along with an edit to
+    it, then shortlist them"""
+    try:
+        job = storage.get(Job, payload["job_id"], profile="job_card")
+        if job is None:
+            return None  # deleted in the meantime
+        progress("scoring applications")
+        stats = JobController.rescore_job(job)
+        progress("shortlisting")
+        recruiter = storage.get(Recruiter, job.recruiter_id)
+        JobController().handle_job_closure(job, recruiter)
+        return stats
+    finally:
+        # worker threads get their own session, release it
+        storage.close()
@@ -26,7 +26,7 @@ from server.models.candidate import Candidate
 from server.models.job import Job
 from server.models.recruiter import Recruiter
 from server.models.user import User
-from server.services.mail import MailService
+from server.services.mail import mail_service
 
 
 class UserController:
@@ -40,17 +40,22 @@ class UserController:
         password hashing.
         """
         self.bcrypt = bcrypt_instance
-        self.email_service = MailService()
+        self.email_service = mail_service
+
+    _shared = None
 
     @classmethod
     def with_encrypt(cls):
-        """Generate a new instance of UserController with encryption.
+        """The UserController of the process, with encryption, created
+        on first call.
 
-        Returns: new instance of UserController
+        Returns: the shared instance of UserController
         """
-        from server.api.v1.app import app
+        if cls._shared is None:
+            from server.api.v1.app import app
 
-        return UserController(Bcrypt(app))
+            cls._shared = UserController(Bcrypt(app))
+        return cls._shared
 
     def get_user(self, user_id):
         """
@@ -93,7 +98,9 @@ class UserController:
         """
         template = verification_email(name, token)
         subject = "Email Verification for Joblinker"
-        self.email_service.send_mail(template, email, name, subject)
+        self.email_service.send_mail(
+            template, email, name, subject, idempotency_key=f"verify:{token}"
+        )
 
     def verify_email(self, token):
         """
@@ -254,7 +261,9 @@ class UserController:
             recruiter = storage.get_by_attr(Recruiter, "user_id", user_id)
             if not recruiter:
                 return user_data
-            jobs = storage.get_all_by_attr(Job, "recruiter_id", recruiter.id)
+            jobs = storage.get_all_by_attr(
+                    Job, "recruiter_id", recruiter.id, profile="job_card"
+                    )
             if recruiter:
                 user_data["recruiter"] = {
                     "jobs": [job.to_dict for job in jobs],
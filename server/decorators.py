@@ -4,7 +4,7 @@ from flask_jwt_extended import get_jwt_identity
 
 from server.api.utils import make_response_
 from server.controllers.user_controller import UserController
-from server.exception import UnauthorizedError
+from server.exception import AIResponseError, UnauthorizedError
 
 
 def verified_required(fn):
@@ -30,6 +30,8 @@ def verified_required(fn):
             user = UserController.with_encrypt().get_user(user_id)
         except ValueError as e:
             return make_response_("error", str(e)), 400
+        except AIResponseError as e:
+            return make_response_("error", str(e)), 502
         if not user.verified:
             return make_response_("error", "Email not verified"), 400
         return fn(*args, **kwargs)
@@ -41,9 +43,10 @@ def handle_errors(f):
     """
     Decorator to handle common errors.
 
-    This decorator wraps a function and handles UnauthorizedError and
-    ValueError exceptions.
-    If one of these exceptions is raised, it returns an error response.
+    This decorator wraps a function and handles UnauthorizedError,
+    ValueError and AIResponseError exceptions.
+    If one of these exceptions is raised, it returns an error response;
+    an AIResponseError is the AI service's failure, a 502.
 
     Args:
         f (function): The function to decorate.
@@ -29,3 +29,17 @@ class UnreadableCVError(Exception):
     ):
         self.message = message
         super().__init__(self.message)
+
+
+class AIResponseError(Exception):
+    """Exception raised when the AI model gives no usable answer."""
+
+    def __init__(
+        self,
+        message=(
+            "The AI service did not return a valid answer. "
+            "Please try again later."
+        ),
+    ):
+        self.message = message
+        super().__init__(self.message)
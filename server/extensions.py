@@ -17,7 +17,15 @@ app = Flask(__name__)
 app.config.from_object(ApplicationConfig)
 
 app.url_map.strict_slashes = False
-CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}}, expose_headers=["Content-Type", "Authorization"])
+CORS(
+    app,
+    supports_credentials=True,
+    resources={r"/*": {"origins": "*"}},
+    expose_headers=[
+        "Content-Type", "Authorization", "X-DB-Queries", "X-DB-Rows",
+        "X-Next-Cursor",
+    ],
+)
 
 swagger = Swagger(app)
 jwt = JWTManager(app)
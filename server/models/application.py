@@ -1,6 +1,6 @@
 """Application Model"""
 
-from sqlalchemy import Column, Enum, Float, ForeignKey, String
+from sqlalchemy import Column, Enum, Float, ForeignKey, Index, String
 from sqlalchemy.orm import relationship
 
 from server.models.base_model import Base, BaseModel
@@ -10,6 +10,9 @@ class Application(BaseModel, Base):
     """Application Model"""
 
     __tablename__ = "applications"
+    __table_args__ = (
+        Index("ix_applications_job_candidate", "job_id", "candidate_id"),
+    )
 
     job_id = Column(String(60), ForeignKey("jobs.id"), nullable=False)
     candidate_id = Column(
@@ -26,7 +26,7 @@ class BaseModel:
             primary_key=True,
             default=lambda: str(uuid.uuid4())
             )
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(
             DateTime,
             default=datetime.utcnow,
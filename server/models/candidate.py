@@ -17,7 +17,9 @@ class Candidate(BaseModel, Base):
     user_id = Column(
         String(60), ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
-    major_id = Column(String(60), ForeignKey("majors.id"), nullable=False)
+    major_id = Column(
+            String(60), ForeignKey("majors.id"), nullable=False, index=True
+            )
 
     # Relationship with User
     user = relationship(
@@ -2,20 +2,36 @@
 Contains the class DBStorage
 """
 import os
+import threading
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as B64Error
+from datetime import datetime
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import (
+    and_,
+    create_engine,
+    distinct,
+    event,
+    exists,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.orm import object_session, scoped_session, sessionmaker
+from sqlalchemy.orm.util import identity_key
 from os import getenv
-import server.models as models
 from server.models.application import Application
 from server.models.base_model import Base
 from server.models.candidate import Candidate
 from server.models.education import Education
+from server.models.engine import fulltext, migrations
+from server.models.engine.load_profiles import load_options
 from server.models.job import Job
 from server.models.language import Language
 from server.models.major import Major
 from server.models.recruiter import Recruiter
-from server.models.skill import Skill
+from server.models.skill import Skill, candidate_skills, job_skills
 from server.models.user import User
 from server.models.user_file import UserFile
 from server.models.work_experience import WorkExperience
@@ -44,6 +60,9 @@ class DBStorage:
     __engine = None
     __session = None
 
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+
     def __init__(self):
         """Instantiate a DBStorage object"""
         engine = getenv("ENGINE")
@@ -52,6 +71,216 @@ class DBStorage:
         else:
             self.__engine = create_engine(engine, pool_size=30, max_overflow=5)
 
+        # per-thread (i.e. per-request) lookup cache and query statistics
+        self.__local = threading.local()
+        event.listen(
+                self.__engine, "before_cursor_execute", self.__count_query
+                )
+        event.listen(Base, "load", self.__count_row, propagate=True)
+        event.listen(
+                Application, "after_insert", self.__count_application(1)
+                )
+        event.listen(
+                Application, "after_delete", self.__count_application(-1)
+                )
+
+    def __request_state(self):
+        """Returns the lookup cache and counters of the current thread"""
+        if not hasattr(self.__local, "cache"):
+            self.__local.cache = {}
+            self.__local.queries = 0
+            self.__local.rows = 0
+        return self.__local
+
+    def __count_query(self, *_):
+        """engine hook: count every statement sent to the database"""
+        self.__request_state().queries += 1
+
+    def __count_row(self, *_):
+        """ORM hook: count every row loaded into an object"""
+        self.__request_state().rows += 1
+
+    @staticmethod
+    def __count_application(step):
+        """
+        mapper hook: add step to the applications_count of the job of
+        an application inserted (1) or deleted (-1), with an atomic
+        UPDATE in the transaction of the flush.
+
+        Every row the flush writes goes through here: the applications
+        removed from a job or candidate as orphans, and those deleted
+        along with their candidate or user, included.
+        """
+        def hook(mapper, connection, application):
+            connection.execute(
+                    update(Job).where(Job.id == application.job_id)
+                    .values(applications_count=Job.applications_count + step)
+                    )
+            session = object_session(application)
+            if session is not None:
+                session.info.setdefault("counted_jobs", set()).add(
+                        application.job_id
+                        )
+        return hook
+
+    @staticmethod
+    def __expire_counts(session, *_):
+        """session hook: reload applications_count of the jobs counted
+        by the flush on next access"""
+        for job_id in session.info.pop("counted_jobs", ()):
+            job = session.identity_map.get(identity_key(Job, job_id))
+            if job is not None:
+                session.expire(job, ["applications_count"])
+
+    def bulk_update(self, cls, rows):
+        """
+        Updates many rows of a table by primary key with one executemany
+        UPDATE, and commits.
+
+        Args:
+            cls: model class to update.
+            rows: dicts holding the "id" of a row and the columns to set.
+
+        Returns:
+            int: The number of rows given.
+        """
+        if not rows:
+            return 0
+        self.__session.execute(update(cls), rows)
+        self.save()
+        # objects loaded before still hold the old values
+        self.__session.expire_all()
+        return len(rows)
+
+    def job_applicants(self, job_id):
+        """
+        Returns who applied to a job, in one query joining applications
+        to their candidates' users; only the columns needed to notify
+        them are loaded.
+
+        Returns:
+            list of rows with application_id, match_score, email, name
+            and contact_info.
+        """
+        return self.__session.query(
+                Application.id.label("application_id"),
+                Application.match_score,
+                User.email,
+                User.name,
+                User.contact_info,
+                ).join(
+                Candidate, Candidate.id == Application.candidate_id
+                ).join(
+                User, User.id == Candidate.user_id
+                ).filter(
+                Application.job_id == job_id
+                ).order_by(Application.id).all()
+
+    def set_application_statuses(self, job_id, threshold, above, below):
+        """
+        Sets the status of every application of a job from its match
+        score, with two UPDATEs left for the caller to commit.
+
+        Args:
+            job_id: the job whose applications are updated.
+            threshold: the score an application must exceed.
+            above: status of the applications scoring over threshold.
+            below: status of the others, unscored ones included.
+
+        Returns:
+            tuple: The number of applications set to above and to below.
+        """
+        of_job = update(Application).where(Application.job_id == job_id)
+        high = self.__session.execute(
+                of_job.where(Application.match_score > threshold)
+                .values(application_status=above)
+                ).rowcount
+        low = self.__session.execute(
+                of_job.where(or_(
+                    Application.match_score <= threshold,
+                    Application.match_score.is_(None),
+                    )).values(application_status=below)
+                ).rowcount
+        return high, low
+
+    def expired_job_ids(self, now, limit=None, exclude=()):
+        """
+        Returns the ids of the open jobs whose application deadline has
+        passed, the longest expired first, through the
+        (is_open, application_deadline) index.
+
+        Args:
+            now: time the deadlines are compared with.
+            limit: maximum number of ids to return.
+            exclude: ids of jobs to leave out.
+        """
+        query = select(Job.id).where(
+            Job.is_open == True,  # noqa: E712
+            Job.application_deadline <= now,
+        )
+        if exclude:
+            query = query.where(Job.id.notin_(exclude))
+        query = query.order_by(
+                Job.application_deadline, Job.id
+                ).limit(limit)
+        return [row[0] for row in self.__session.execute(query)]
+
+    def claim_job_closure(self, job_id):
+        """
+        Marks a job closed if it is still open, left for the caller to
+        commit; of two workers closing the same job, only one claims it.
+
+        Returns:
+            bool: Whether the job was open and is now the caller's to
+            close.
+        """
+        return self.__session.execute(
+                update(Job).where(
+                    Job.id == job_id, Job.is_open == True,  # noqa: E712
+                    ).values(is_open=False, times_closed=Job.times_closed + 1)
+                ).rowcount == 1
+
+    def reconcile_application_counts(self, batch_size=1000):
+        """
+        Recomputes jobs.applications_count from the applications table,
+        checking batch_size jobs at a time against count_by.
+
+        Returns:
+            The number of jobs whose counter was out of date.
+        """
+        stale = []
+        rows = self.__session.execute(
+                select(Job.id, Job.applications_count).order_by(Job.id)
+                .execution_options(yield_per=batch_size)
+                )
+        for batch in rows.partitions():
+            stored = dict(batch)
+            actual = self.count_by(Application, "job_id", stored)
+            stale.extend(
+                    {"id": job_id, "applications_count": count}
+                    for job_id, count in actual.items()
+                    if count != stored[job_id]
+                    )
+        return self.bulk_update(Job, stale)
+
+    def clear_cache(self):
+        """drop the cached attribute lookups of the current request"""
+        self.__request_state().cache.clear()
+
+    def request_stats(self):
+        """
+        Returns the number of queries issued and rows loaded since the
+        last reset_request_stats() on the current thread
+        """
+        state = self.__request_state()
+        return {"queries": state.queries, "rows": state.rows}
+
+    def reset_request_stats(self):
+        """reset the query and row counters of the current thread"""
+        state = self.__request_state()
+        state.queries = 0
+        state.rows = 0
+
     def all(self, cls=None):
         """query on the current database session"""
         new_dict = {}
@@ -65,46 +294,59 @@ class DBStorage:
 
     def new(self, obj):
         """add the object to the current database session"""
+        self.clear_cache()
         self.__session.add(obj)
 
     def save(self):
         """commit all changes of the current database session"""
+        self.clear_cache()
         self.__session.commit()
 
     def delete(self, obj=None):
         """delete from the current database session obj if not None"""
         if obj is not None:
+            self.clear_cache()
             self.__session.delete(obj)
 
     def reload(self):
         """reloads data from the database"""
         Base.metadata.create_all(self.__engine)
+        with self.__engine.begin() as connection:
+            migrations.upgrade(connection)
+            fulltext.install(connection)
         sess_factory = sessionmaker(bind=self.__engine, expire_on_commit=False)
+        event.listen(
+                sess_factory, "after_flush_postexec", self.__expire_counts
+                )
         Session = scoped_session(sess_factory)
         self.__session = Session
 
     def rollback(self):
         """Rollback the current transaction."""
+        self.clear_cache()
         self.__session.rollback()
 
     def close(self):
         """call remove() method on the private session attribute"""
+        self.clear_cache()
         self.__session.remove()
 
-    def get(self, cls, id):
+    def get(self, cls, id, profile=None):
         """
         Returns the object based on the class name and its ID, or
         None if not found
+
+        The lookup goes through the session identity map first, and only
+        issues a single SELECT on the primary key when the object is not
+        already loaded in the current session. A loading profile
+        eager-loads the relationships it names along with the object.
         """
-        if cls not in classes.values():
+        if isinstance(cls, str):
+            cls = classes.get(cls)
+        if cls not in classes.values() or id is None:
             return None
 
-        all_cls = models.storage.all(cls)
-        for value in all_cls.values():
-            if value.id == id:
-                return value
-
-        return None
+        return self.__session.get(cls, id, options=load_options(profile))
 
     def count(self, cls=None):
         """
@@ -117,19 +359,288 @@ class DBStorage:
                     self.__session.query(c).count() for c in classes.values()
                     )
 
+    def count_by(self, cls, attr, values):
+        """
+        Counts the objects of a class for each of the given attribute
+        values, in one grouped COUNT query.
+
+        Returns:
+            dict mapping every value to its count, 0 included.
+        """
+        values = list(values)
+        counts = dict.fromkeys(values, 0)
+        if not values:
+            return counts
+        column = getattr(cls, attr)
+        rows = self.__session.query(column, func.count(cls.id)).filter(
+                column.in_(values)
+                ).group_by(column).all()
+        counts.update(rows)
+        return counts
+
+    def rank_candidates(self, job, limit=None, profile=None):
+        """
+        Returns the candidates of the job's major that share at least one
+        skill with it, best first, with their skill overlap.
+
+        The overlap is counted in SQL by joining candidate_skills to
+        job_skills on skill_id, so only the top `limit` candidates are
+        ever loaded.
+
+        Returns:
+            list of (candidate, overlap) tuples.
+        """
+        overlap = func.count(distinct(job_skills.c.skill_id)).label("overlap")
+        candidate_id = candidate_skills.c.candidate_id
+        query = self.__session.query(candidate_id, overlap).join(
+                job_skills,
+                job_skills.c.skill_id == candidate_skills.c.skill_id
+                ).join(
+                Candidate, Candidate.id == candidate_id
+                ).filter(
+                job_skills.c.job_id == job.id,
+                Candidate.major_id == job.major_id,
+                ).group_by(candidate_id).order_by(
+                overlap.desc(), candidate_id
+                )
+        if limit:
+            query = query.limit(limit)
+        ranked = query.all()
+        if not ranked:
+            return []
+
+        candidates = self.find(
+                Candidate,
+                Candidate.id.in_([id for id, _ in ranked]),
+                profile=profile,
+                )
+        by_id = {candidate.id: candidate for candidate in candidates}
+        return [(by_id[id], score) for id, score in ranked]
+
+    def rank_jobs(self, candidate, limit=None, exclude_applied=False,
+                  profile=None):
+        """
+        Returns the open, unexpired jobs of the candidate's major that
+        share at least one skill with the candidate, best first.
+
+        The overlap is counted in SQL on job_skills joined to
+        candidate_skills, and whether the candidate already applied is
+        an EXISTS on applications; with exclude_applied those jobs are
+        dropped by the same query (anti-join).
+
+        Returns:
+            list of (job, overlap, has_applied) tuples.
+        """
+        overlap = func.count(
+                distinct(candidate_skills.c.skill_id)
+                ).label("overlap")
+        job_id = job_skills.c.job_id
+        applied = exists().where(
+                Application.job_id == job_id,
+                Application.candidate_id == candidate.id,
+                )
+        query = self.__session.query(
+                job_id, overlap, applied.label("has_applied")
+                ).join(
+                candidate_skills,
+                candidate_skills.c.skill_id == job_skills.c.skill_id
+                ).join(
+                Job, Job.id == job_id
+                ).filter(
+                candidate_skills.c.candidate_id == candidate.id,
+                Job.major_id == candidate.major_id,
+                # expired jobs are closed by the sweeper
+                Job.is_open == True,  # noqa: E712
+                )
+        if exclude_applied:
+            query = query.filter(~applied)
+        query = query.group_by(job_id).order_by(overlap.desc(), job_id)
+        if limit:
+            query = query.limit(limit)
+        ranked = query.all()
+        if not ranked:
+            return []
+
+        jobs = self.find(
+                Job, Job.id.in_([id for id, _, _ in ranked]), profile=profile
+                )
+        by_id = {job.id: job for job in jobs}
+        return [
+            (by_id[id], score, bool(has_applied))
+            for id, score, has_applied in ranked
+        ]
+
+    def search_jobs(self, title=None, location=None, offset=0, limit=None,
+                    newest_first=False):
+        """
+        Returns the ids of the open jobs matching title and location
+        through the database's native full-text search, the most relevant
+        first; with neither, every open job, the newest first.
+
+        Args:
+            title: words searched in job_title and job_description.
+            location: words searched in location.
+            offset: number of matches to skip.
+            limit: maximum number of ids to return.
+            newest_first: order the matches by created_at instead.
+        """
+        query = fulltext.search_query(
+                self.__engine.dialect.name, title, location
+                )
+        if query is None:
+            query = select(Job.id)
+            newest_first = True
+        # expired jobs are closed by the sweeper
+        query = query.where(Job.is_open == True)  # noqa: E712
+        if newest_first:
+            query = query.order_by(None).order_by(
+                    Job.created_at.desc(), Job.id.desc()
+                    )
+        query = query.offset(offset).limit(limit)
+        return [row[0] for row in self.__session.execute(query)]
+
     def get_by_attr(self, cls, attr, value):
         """
         Returns the object with the given attribute value,
         None if not found.
+
+        Hits are cached for the rest of the request, keyed by
+        (class, attr, value); the cache is dropped on every write.
         """
-        return self.__session.query(cls).filter(
+        cache = self.__request_state().cache
+        key = (cls.__name__, attr, value)
+        if key in cache:
+            return cache[key]
+
+        obj = self.__session.query(cls).filter(
                 getattr(cls, attr) == value
                 ).first()
+        if obj is not None:
+            cache[key] = obj
+        return obj
 
-    def get_all_by_attr(self, cls, attr, value):
+    def get_all_by_attr(self, cls, attr, value, profile=None):
         """
         Returns all objects of a class with the given attribute value.
         """
-        return self.__session.query(cls).filter(
-                getattr(cls, attr) == value
-                ).all()
+        return self.find(cls, getattr(cls, attr) == value, profile=profile)
+
+    def find(self, cls, *criteria, profile=None, order_by=None):
+        """
+        Returns all objects of a class matching the filter expressions,
+        with the relationships of the loading profile eager-loaded.
+
+        Args:
+            cls: model class to query.
+            criteria: filter expressions.
+            profile: name of a loading profile, see load_profiles.
+            order_by: column or expression to sort by.
+        """
+        query = self.__session.query(cls).filter(*criteria)
+        query = query.options(*load_options(profile))
+        if order_by is not None:
+            query = query.order_by(order_by)
+        return query.all()
+
+    @staticmethod
+    def encode_cursor(obj, sort_by=None):
+        """Returns an opaque keyset cursor pointing at obj"""
+        parts = [obj.created_at.isoformat(), obj.id]
+        if sort_by:
+            parts.insert(0, str(getattr(obj, sort_by)))
+        return urlsafe_b64encode("|".join(parts).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor, sort_by=None):
+        """
+        Returns the (created_at, id) pair held by a cursor, preceded by
+        the value of the sort_by column when given.
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        n = 3 if sort_by else 2
+        try:
+            raw = urlsafe_b64decode(cursor.encode()).decode()
+            # created_at and id never hold "|", the sort_by column may
+            parts = raw.rsplit("|", n - 1)
+            if len(parts) != n:
+                raise ValueError("Invalid cursor")
+            parts[-2] = datetime.fromisoformat(parts[-2])
+            return tuple(parts)
+        except (B64Error, UnicodeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+    def paginate(self, cls, *criteria, cursor=None, limit=None,
+                 newest_first=False, profile=None, sort_by=None):
+        """
+        Returns one page of objects ordered by (created_at, id), and the
+        cursor of the next page, None when this is the last page.
+
+        Args:
+            cls: model class to query.
+            criteria: extra filter expressions.
+            cursor: cursor returned with the previous page.
+            limit: page size, capped at MAX_PAGE_SIZE.
+            newest_first: walk the table from the newest row.
+            profile: name of a loading profile, see load_profiles.
+            sort_by: name of a non-null column to order by first, ahead
+                of (created_at, id).
+        """
+        limit = min(limit or self.DEFAULT_PAGE_SIZE, self.MAX_PAGE_SIZE)
+        query = self.__session.query(cls).filter(*criteria)
+        query = query.options(*load_options(profile))
+        keys = [cls.created_at, cls.id]
+        if sort_by:
+            keys.insert(0, getattr(cls, sort_by))
+
+        if cursor:
+            values = self.decode_cursor(cursor, sort_by)
+            # rows after the cursor: equal on the first i keys and past
+            # it on the next one
+            query = query.filter(or_(*(
+                and_(
+                    *(key == value
+                      for key, value in zip(keys[:i], values[:i])),
+                    keys[i] < values[i] if newest_first
+                    else keys[i] > values[i],
+                )
+                for i in range(len(keys))
+            )))
+
+        if newest_first:
+            query = query.order_by(*(key.desc() for key in keys))
+        else:
+            query = query.order_by(*keys)
+
+        objs = query.limit(limit + 1).all()
+        if len(objs) > limit:
+            objs = objs[:limit]
+            return objs, self.encode_cursor(objs[-1], sort_by)
+        return objs, None
+
+    def iter_column(self, column, *criteria, batch_size=1000):
+        """
+        Iterates over the values of one column of the matching rows,
+        streamed from a single query batch_size rows at a time; no ORM
+        object is built.
+        """
+        result = self.__session.execute(
+                select(column).where(*criteria)
+                .execution_options(yield_per=batch_size)
+                )
+        yield from result.scalars()
+
+    def iter_all(self, cls, *criteria, batch_size=None, **kwargs):
+        """
+        Iterates over every matching object, one keyset page at a time,
+        so that only batch_size rows are held in memory.
+        """
+        cursor = None
+        while True:
+            objs, cursor = self.paginate(
+                    cls, *criteria, cursor=cursor, limit=batch_size, **kwargs
+                    )
+            yield from objs
+            if cursor is None:
+                return
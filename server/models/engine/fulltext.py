@@ -0,0 +1,101 @@
+"""
+Native full-text search over jobs: FULLTEXT indexes on MySQL, an FTS5
+shadow table kept in sync by triggers on SQLite.
+"""
+import re
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.dialects.mysql import match
+
+from server.models.job import Job
+
+# SQLite: the virtual table mirrors the searchable columns of jobs
+SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+        job_id UNINDEXED, job_title, job_description, location
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS jobs_fts_ai AFTER INSERT ON jobs BEGIN
+        INSERT INTO jobs_fts (job_id, job_title, job_description, location)
+        VALUES (new.id, new.job_title, new.job_description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS jobs_fts_ad AFTER DELETE ON jobs BEGIN
+        DELETE FROM jobs_fts WHERE job_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS jobs_fts_au
+    AFTER UPDATE OF job_title, job_description, location ON jobs BEGIN
+        UPDATE jobs_fts SET job_title = new.job_title,
+            job_description = new.job_description, location = new.location
+        WHERE job_id = old.id;
+    END""",
+    """INSERT INTO jobs_fts (job_id, job_title, job_description, location)
+    SELECT id, job_title, job_description, location FROM jobs
+    WHERE id NOT IN (SELECT job_id FROM jobs_fts)""",
+)
+
+jobs_fts = table(
+        "jobs_fts",
+        column("job_id"),
+        column("job_title"),
+        column("job_description"),
+        column("location"),
+        )
+
+
+def install(connection):
+    """create the full-text structures the dialect needs, if missing;
+    MySQL gets its FULLTEXT indexes from Job.__table_args__, created on
+    existing tables by migrations.upgrade"""
+    if connection.dialect.name == "sqlite":
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+
+
+def _fts5_terms(query):
+    """words of query as quoted FTS5 strings, OR-ed together"""
+    words = re.findall(r"\w+", query or "")
+    return " OR ".join('"{}"'.format(word) for word in words)
+
+
+def search_query(dialect, title=None, location=None):
+    """
+    Returns a select of (job_id, score) for the jobs matching title (on
+    job_title and job_description) and location, best first, or None
+    when there is nothing to search for.
+    """
+    if dialect == "mysql":
+        score = None
+        criteria = []
+        for against, columns in (
+            (title, (Job.job_title, Job.job_description)),
+            (location, (Job.location,)),
+        ):
+            if against:
+                relevance = match(*columns, against=against)
+                criteria.append(relevance > 0)
+                score = relevance if score is None else score + relevance
+        if score is None:
+            return None
+        score = score.label("score")
+        return select(Job.id.label("job_id"), score).where(
+                *criteria
+                ).order_by(score.desc(), Job.id)
+
+    if dialect == "sqlite":
+        filters = []
+        if _fts5_terms(title):
+            filters.append(
+                "{job_title job_description} : (%s)" % _fts5_terms(title)
+            )
+        if _fts5_terms(location):
+            filters.append("location : (%s)" % _fts5_terms(location))
+        if not filters:
+            return None
+        # bm25() is lower for better matches
+        score = func.bm25(literal_column("jobs_fts")).label("score")
+        return select(
+                jobs_fts.c.job_id, score
+                ).join(Job, Job.id == jobs_fts.c.job_id).where(
+                literal_column("jobs_fts").op("MATCH")(" AND ".join(filters))
+                ).order_by(score, Job.id)
+
+    raise ValueError(f"No full-text search support for {dialect}")
@@ -0,0 +1,79 @@
+"""
+Named eager-loading profiles for the storage query API
+
+A profile is a set of loader options that fetches, in a fixed number of
+queries, every relationship a view touches; pass its name as `profile=`
+to DBStorage.get, find, get_all_by_attr or paginate.
+"""
+from sqlalchemy.orm import joinedload, selectinload
+
+from server.models.application import Application
+from server.models.candidate import Candidate
+from server.models.job import Job
+from server.models.recruiter import Recruiter
+from server.models.user import User
+
+
+def _job_card():
+    """what a job listing needs: skills, major and company"""
+    return (
+        selectinload(Job.skills),
+        joinedload(Job.major),
+        joinedload(Job.recruiter).joinedload(Recruiter.user),
+    )
+
+
+def _job_detail():
+    """a job card plus every applicant's user and uploaded files"""
+    return _job_card() + (
+        selectinload(Job.applications)
+        .joinedload(Application.candidate)
+        .joinedload(Candidate.user)
+        .selectinload(User.user_files),
+    )
+
+
+def _candidate_card():
+    """everything Candidate.to_dict reads"""
+    return (
+        joinedload(Candidate.user),
+        joinedload(Candidate.major),
+        selectinload(Candidate.skills),
+        selectinload(Candidate.languages),
+        selectinload(Candidate.experiences),
+        selectinload(Candidate.educations),
+    )
+
+
+def _application_scoring():
+    """an application's candidate with everything a match scorer reads"""
+    candidate = joinedload(Application.candidate)
+    return (
+        candidate.selectinload(Candidate.skills),
+        candidate.selectinload(Candidate.experiences),
+        candidate.selectinload(Candidate.educations),
+    )
+
+
+# built lazily: backref attributes (Job.major, Job.recruiter, ...) only
+# exist once the mappers are configured
+profiles = {
+    "job_card": _job_card,
+    "job_detail": _job_detail,
+    "candidate_card": _candidate_card,
+    "application_scoring": _application_scoring,
+}
+
+
+def load_options(profile):
+    """
+    Returns the loader options of a named profile.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile is None:
+        return ()
+    if profile not in profiles:
+        raise ValueError(f"Unknown loading profile '{profile}'")
+    return profiles[profile]()
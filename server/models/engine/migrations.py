@@ -0,0 +1,42 @@
+"""
+Brings tables created before the current models up to date: create_all
+only creates missing tables, and leaves the existing ones as they are.
+"""
+from sqlalchemy import func, inspect, select, text, update
+
+from server.models.application import Application
+from server.models.job import Job
+
+# columns added to jobs since it was first created, with their DDL
+JOB_COLUMNS = (
+    ("applications_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("times_closed", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+def upgrade(connection):
+    """apply the schema changes an existing database is missing; safe to
+    run on every start"""
+    columns = {
+        column["name"]
+        for column in inspect(connection).get_columns(Job.__tablename__)
+    }
+    for name, ddl in JOB_COLUMNS:
+        if name not in columns:
+            connection.execute(
+                    text(f"ALTER TABLE jobs ADD COLUMN {name} {ddl}")
+                    )
+    # jobs created before the denormalized counter, filled from the
+    # applications table
+    if "applications_count" not in columns:
+        connection.execute(update(Job).values(
+            applications_count=select(func.count(Application.id)).where(
+                Application.job_id == Job.id
+                ).scalar_subquery()
+            ))
+
+    # indexes added to jobs since, the FULLTEXT ones full-text search
+    # on MySQL needs included; each index skips the dialects it is not
+    # for
+    for index in Job.__table__.indexes:
+        index.create(connection, checkfirst=True)
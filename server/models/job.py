@@ -5,12 +5,15 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
+    Integer,
     Numeric,
     String,
     Text,
 )
 from sqlalchemy.orm import relationship
 
+from server.models.application import Application
 from server.models.base_model import Base, BaseModel
 from server.models.skill import job_skills
 
@@ -19,13 +22,29 @@ class Job(BaseModel, Base):
     """Job Class"""
 
     __tablename__ = "jobs"
+    # FULLTEXT indexes backing the "fulltext" search engine on MySQL; SQLite
+    # uses the jobs_fts table created by engine.fulltext instead
+    __table_args__ = (
+        Index(
+            "ft_jobs_title_description", "job_title", "job_description",
+            mysql_prefix="FULLTEXT",
+        ).ddl_if(dialect="mysql"),
+        Index(
+            "ft_jobs_location", "location", mysql_prefix="FULLTEXT"
+        ).ddl_if(dialect="mysql"),
+        # the open-jobs listings and the sweep of expired jobs; queries
+        # test is_open == True, as "is_open IS true" cannot use it on MySQL
+        Index("ix_jobs_is_open_deadline", "is_open", "application_deadline"),
+    )
 
     recruiter_id = Column(
             String(60),
             ForeignKey("recruiters.id"),
             nullable=False
             )
-    major_id = Column(String(60), ForeignKey("majors.id"), nullable=False)
+    major_id = Column(
+            String(60), ForeignKey("majors.id"), nullable=False, index=True
+            )
     job_title = Column(String(100), nullable=False)
     job_description = Column(Text, nullable=False)
     location = Column(String(128), nullable=True)
@@ -33,7 +52,16 @@ class Job(BaseModel, Base):
     salary = Column(Numeric(precision=10, scale=2, asdecimal=False))
     application_deadline = Column(DateTime, nullable=True)
     is_open = Column(Boolean, default=True)
+    # closures so far, telling the emails of one closure from those of
+    # the job closed again after a reopening
+    times_closed = Column(
+            Integer, nullable=False, default=0, server_default="0"
+            )
     responsibilities = Column(JSON, nullable=True)
+    # kept in step with the applications table by DBStorage on every flush
+    applications_count = Column(
+            Integer, nullable=False, default=0, server_default="0"
+            )
 
     # Relationship with Skill
     skills = relationship(
@@ -49,8 +77,14 @@ class Job(BaseModel, Base):
 
     @property
     def application_count(self):
-        """Return the number of applications for this job"""
-        return len(self.applications)
+        """Return the number of applications for this job: the stored
+        counter, or a grouped COUNT while it is not set (a job not yet
+        flushed)"""
+        if self.applications_count is not None:
+            return self.applications_count
+        from server.models import storage
+
+        return storage.count_by(Application, "job_id", [self.id])[self.id]
 
     @property
     def to_dict(self):
@@ -9,15 +9,15 @@ candidate_skills = Table(
     "candidate_skills",
     Base.metadata,
     Column("candidate_id", String(60), ForeignKey("candidates.id")),
-    Column("skill_id", String(60), ForeignKey("skills.id")),
+    Column("skill_id", String(60), ForeignKey("skills.id"), index=True),
 )
 
 # Association table for Job-Skill many-to-many relationship
 job_skills = Table(
     "job_skills",
     Base.metadata,
-    Column("job_id", String(60), ForeignKey("jobs.id")),
-    Column("skill_id", String(60), ForeignKey("skills.id")),
+    Column("job_id", String(60), ForeignKey("jobs.id"), index=True),
+    Column("skill_id", String(60), ForeignKey("skills.id"), index=True),
 )
 
 
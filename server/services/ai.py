@@ -3,19 +3,25 @@
 """The module defines AI service that parses a pdf, doc, or docx file,
 generate a dictionary of info using gemini.
 """
+import random
+import time
 from datetime import datetime
-from json import JSONDecodeError, loads
-from os import getenv, getcwd, path
+from json import JSONDecodeError
+from os import getcwd, path
 from typing import Any, Dict
 
-import google.generativeai as genai
 from dateutil.parser import ParserError, parse
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv
 
-from server.exception import UnreadableCVError
+from server.config import ApplicationConfig
+from server.exception import AIResponseError, UnreadableCVError
 from server.prompts import CANDID_PROMPT, JOB_PROMPT, PTA_PROMPT
-from server.services.text_extractor import extract_text
+from server.services.ai_cache import ai_cache
+from server.services.json_repair import loads_lenient
+from server.services.extraction import extractor
+from server.services.gemini import gemini
+from server.services.text_extractor import compact_text
 
 load_dotenv()
 
@@ -24,11 +30,20 @@ class AIService:
     """class AIService
 
     Attrs:
+        model_name: the gemini model asked
         generation_config: gemini config
         safety_settings: safety settings
+        max_attempts: model calls to_dict makes before giving up
+        retry_base_delay: seconds waited after the first failed attempt,
+            doubled after each of the next ones
+        retry_max_delay: cap of the wait between two attempts
+        retry_deadline: seconds after which to_dict stops retrying
+        inline_text: send the document's text in the prompt, and only
+            upload the file itself when no text can be extracted from it
     """
 
     # Set up the model
+    model_name = ApplicationConfig.GEMINI_MODEL
     generation_config = {
         "temperature": 0.9,
         "top_p": 1,
@@ -53,21 +68,29 @@ class AIService:
         },
     ]
 
+    max_attempts = 3
+    retry_base_delay = 1.0
+    retry_max_delay = 8.0
+    retry_deadline = 60.0
+    inline_text = ApplicationConfig.AI_INLINE_TEXT
+
     def __init__(self, file_path=""):
         """Initialize the ai model
 
         Args:
             file_path(str): path to the resume or job description file
         """
-        GOOGLE_API_KEY = getenv("GOOGLE_API_KEY")
-        genai.configure(api_key=GOOGLE_API_KEY)
-
         self.__insights = None
         self.file_path = file_path
-        self.model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=self.generation_config,
-            safety_settings=self.safety_settings,
+        # timings of the model calls made by the last to_dict
+        self.attempts = []
+
+    @property
+    def model(self):
+        """the model of this process, shared by every instance, see
+        services.gemini"""
+        return gemini.model(
+            self.model_name, self.generation_config, self.safety_settings
         )
 
     def prompt(self, line, input_txt=None):
@@ -78,23 +101,52 @@ class AIService:
             line: prompt to provide for gemini
             input_txt: input to extract the info from
         """
-        input_ = input_txt or extract_text(self.file_path)
-        if not input_:
+        document, uploaded = self.__document(input_txt)
+        try:
+            return self.__generate(document, line)
+        except Exception as e:
+            print("Error parsing pdf file:", e)
+        finally:
+            if uploaded is not None:
+                uploaded.delete()  # delete the file from the gemini cache
+
+    def __document(self, input_txt=None):
+        """what gemini is asked about: the text, sent inline, when there
+        is some, otherwise the file uploaded to gemini (a scanned CV has
+        no text layer, but the model can still read it)
+
+        Returns:
+            the prompt part and the uploaded file to delete, or None
+
+        Raises:
+            UnreadableCVError: If there is neither text nor file.
+        """
+        text = input_txt
+        if not text and self.file_path:
+            try:
+                text = extractor.extract(self.file_path)
+            except UnreadableCVError:
+                text = ""
+        # text with no file behind it (AIJobMatcher) can only go inline
+        if text and (self.inline_text or not self.file_path):
+            return compact_text(text), None
+
+        if not self.file_path or not path.isfile(self.file_path):
             print(f'the file "{self.file_path}" is not readable')
-            raise UnreadableCVError() # raise error if the file is not readable
+            raise UnreadableCVError()
+        myfile = gemini.upload_file(self.file_path)
+        return myfile, myfile
 
-        myfile = genai.upload_file(self.file_path)
-        try:
-            
-            resp = self.model.generate_content([myfile, line], stream=True)
+    def __generate(self, document, line):
+        """ask gemini line about a document, text or uploaded file; the
+        call holds a gemini slot until the answer is fully streamed"""
+        model = self.model
+        with gemini.slot():
+            resp = model.generate_content([document, line], stream=True)
             text = ""
             for chunk in resp:
                 text += chunk.text
-            myfile.delete() # delete the file from the gemini cache
-            return text
-        except Exception as e:
-            print("Error parsing pdf file:", e)
-            myfile.delete()
+        return text
 
     def __handle_cv(self, dict_: Dict[str, Any]) -> Dict[str, Any]:
         """clean the dictionary received from ai"""
@@ -149,31 +201,102 @@ class AIService:
     def to_dict(self, prompt_enquiry, text=""):
         """The function translates gemini response to a dictionary
 
+        Results for the service's file are cached by the file content and
+        the prompt, see ai_cache; a re-uploaded document is not sent to
+        gemini again.
+
         Args:
             prompt_enquiry(str): question to feed it to gemini
         Returns:
             dictionary of gemini response
         """
-        if not text:
-            text = self.prompt(prompt_enquiry)
+        cache_key = None
+        if not text and self.file_path and path.isfile(self.file_path):
+            cache_key = ai_cache.key(self.file_path, prompt_enquiry)
+            cached = ai_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        dict_ = self.__parse(prompt_enquiry, text)
+        if cache_key:
+            ai_cache.set(cache_key, dict_)
+        return dict_
+
+    def __parse(self, prompt_enquiry, text=""):
+        """ask gemini, unless text is given, and clean its answer
 
-        # Clean the text to remove unwanted characters
-        cleaned_text = self.clean_json_response(text)
+        Invalid JSON is first repaired locally; when that fails gemini is
+        asked again, reusing the document, up to max_attempts times
+        with exponential backoff and jitter, and never past
+        retry_deadline. Each attempt is timed in self.attempts.
 
+        Raises:
+            UnreadableCVError: If the file has no readable text.
+            AIResponseError: If no attempt gave a usable answer.
+        """
+        self.attempts = []
+        deadline = time.monotonic() + self.retry_deadline
+        document = uploaded = None
         try:
-            # strips out any spaces or new lines or back-slashes
-            dict_ = loads(cleaned_text)
-            if prompt_enquiry == PTA_PROMPT:
-                return dict_
-            if prompt_enquiry == CANDID_PROMPT:
-                dict_ = self.__handle_cv(dict_)
-            if prompt_enquiry == JOB_PROMPT:
-                dict_ = self.__handle_job(dict_)
+            for attempt in range(1, self.max_attempts + 1):
+                start = time.monotonic()
+                try:
+                    if not text:
+                        if document is None:
+                            document, uploaded = self.__document()
+                        text = self.__generate(document, prompt_enquiry)
+                    dict_ = self.__clean(prompt_enquiry, loads_lenient(text))
+                    self.__record(attempt, start, "ok")
+                    return dict_
+                except UnreadableCVError:
+                    raise
+                except JSONDecodeError:
+                    print("---invalid json------>", text)
+                    self.__record(attempt, start, "invalid json")
+                except Exception as e:
+                    print("Error asking gemini:", e)
+                    self.__record(attempt, start, f"error: {e}")
+                text = ""
+
+                delay = min(
+                    self.retry_max_delay,
+                    self.retry_base_delay * 2 ** (attempt - 1),
+                )
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                if (
+                    attempt == self.max_attempts
+                    or time.monotonic() + delay > deadline
+                ):
+                    break
+                time.sleep(delay)
+        finally:
+            if uploaded is not None:
+                uploaded.delete()  # delete the file from the gemini cache
+            # only retries and failures are worth a line
+            if len(self.attempts) > 1 or (
+                self.attempts and self.attempts[-1]["outcome"] != "ok"
+            ):
+                print("gemini attempts:", self.attempts)
+
+        raise AIResponseError()
+
+    def __record(self, attempt, start, outcome):
+        """time one attempt of __parse"""
+        self.attempts.append({
+            "attempt": attempt,
+            "seconds": round(time.monotonic() - start, 3),
+            "outcome": outcome,
+        })
+
+    def __clean(self, prompt_enquiry, dict_):
+        """post-process the parsed answer to a prompt"""
+        if prompt_enquiry == PTA_PROMPT:
             return dict_
-        except JSONDecodeError as e:
-            # retry until we get valid json
-            print("---cleaned text------>", cleaned_text)
-            return self.to_dict(prompt_enquiry)
+        if prompt_enquiry == CANDID_PROMPT:
+            dict_ = self.__handle_cv(dict_)
+        if prompt_enquiry == JOB_PROMPT:
+            dict_ = self.__handle_job(dict_)
+        return dict_
 
     def get_insights(self):
         """Retreive insights about resume"""
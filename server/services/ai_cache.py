@@ -0,0 +1,393 @@
+"""
+Content-addressed cache of AIService.to_dict results.
+
+Visitors often upload the very same CV again and again; parsing it is a
+Gemini round trip of several seconds. Results are keyed by the SHA-256 of
+the uploaded bytes plus the identity of the prompt, so the same document
+asked the same question is only sent to the model once.
+
+Backends, picked by ApplicationConfig.AI_CACHE_BACKEND:
+
+    memory: in-process LRU, the default.
+    disk: one JSON file per entry under AI_CACHE_DIR, shared by the
+        workers of one host.
+    redis: shared by every host.
+    none: caching disabled.
+
+Every backend stores the result serialized to JSON, expires entries after
+AI_CACHE_TTL seconds and keeps at most AI_CACHE_MAX_ENTRIES of them,
+evicting the least recently used first.
+
+match_score_cache memoizes AIJobMatcher scores the same way, keyed by the
+hashes of the candidate and job texts sent to the model. It has its own
+MATCH_CACHE_* settings and is kept on disk by default: a score is only
+worth caching if it outlives the process.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from redis import Redis
+
+from server.config import ApplicationConfig
+from server.prompts import (
+    ATS_FRIENDLY_PROMPT,
+    CANDID_PROMPT,
+    JOB_MATCHING_PROMPT,
+    JOB_PROMPT,
+    PTA_PROMPT,
+)
+
+# prompts named in the cache key, so that entries stay readable
+PROMPT_NAMES = {
+    CANDID_PROMPT: "CANDID",
+    JOB_PROMPT: "JOB",
+    PTA_PROMPT: "PTA",
+    ATS_FRIENDLY_PROMPT: "ATS_FRIENDLY",
+    JOB_MATCHING_PROMPT: "JOB_MATCHING",
+}
+
+
+def file_digest(file_path, chunk_size=1 << 16):
+    """SHA-256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_digest(text):
+    """SHA-256 hex digest of a text"""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def prompt_identity(prompt):
+    """name of a known prompt plus a hash of its text, so that editing a
+    prompt does not serve answers to its previous wording"""
+    text_hash = text_digest(prompt)[:12]
+    return f"{PROMPT_NAMES.get(prompt, 'PROMPT')}:{text_hash}"
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """the stored value, None when missing or expired"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """store value, returns the number of evicted entries"""
+        with self.__lock:
+            self.__entries[key] = (value, time.time() + self.ttl)
+            self.__entries.move_to_end(key)
+            evicted = 0
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        """drop every entry"""
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class DiskBackend:
+    """One file per entry; the modification time is the last access
+
+    The entries are counted once, then the count is kept in memory: the
+    directory is only scanned, and the least recently used entries
+    evicted down to max_entries, once the count passes high_water.
+    Entries written by the other workers of the host are picked up by
+    that scan, so the directory may hold up to high_water entries per
+    worker in between.
+    """
+
+    def __init__(self, directory, max_entries, ttl, high_water=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.high_water = (
+            max_entries + max_entries // 10 if high_water is None
+            else high_water
+        )
+        os.makedirs(directory, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__count = len(self.__scan())
+
+    def __path(self, key):
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, key):
+        """the stored value, None when missing or expired"""
+        path = self.__path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] < time.time():
+            if self.__discard(path):
+                with self.__lock:
+                    self.__count -= 1
+            return None
+        os.utime(path)
+        return entry["value"]
+
+    def set(self, key, value):
+        """store value, returns the number of evicted entries"""
+        path = self.__path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        entry = {"expires_at": time.time() + self.ttl, "value": value}
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        is_new = not os.path.exists(path)
+        os.replace(tmp, path)  # readers never see a half-written entry
+        with self.__lock:
+            self.__count += is_new
+            if self.__count <= self.high_water:
+                return 0
+            return self.__evict()
+
+    def __scan(self):
+        """(last access, path) of every entry in the directory"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+        return entries
+
+    def __evict(self):
+        """remove the least recently used entries beyond max_entries and
+        recount, the lock must be held"""
+        entries = self.__scan()
+        excess = max(0, len(entries) - self.max_entries)
+        entries.sort()
+        for _, path in entries[:excess]:
+            self.__discard(path)
+        self.__count = len(entries) - excess
+        return excess
+
+    @staticmethod
+    def __discard(path):
+        """remove an entry file, returns whether it was there"""
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def clear(self):
+        """drop every entry"""
+        with self.__lock:
+            for _, path in self.__scan():
+                self.__discard(path)
+            self.__count = 0
+
+    def __len__(self):
+        return sum(
+            1 for entry in os.scandir(self.directory)
+            if entry.name.endswith(".json")
+        )
+
+
+class RedisBackend:
+    """Entries expire through Redis TTLs; a sorted set of keys by last
+    access bounds their number"""
+
+    def __init__(self, connection, max_entries, ttl, prefix="ai-cache:"):
+        self.connection = connection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lru_key = f"{prefix}lru"
+
+    def get(self, key):
+        """the stored value, None when missing or expired"""
+        value = self.connection.get(self.prefix + key)
+        if value is None:
+            return None
+        self.connection.zadd(self.lru_key, {key: time.time()})
+        return value.decode()
+
+    def set(self, key, value):
+        """store value, returns the number of evicted entries"""
+        pipe = self.connection.pipeline()
+        pipe.setex(self.prefix + key, self.ttl, value)
+        pipe.zadd(self.lru_key, {key: time.time()})
+        # forget keys Redis already expired
+        pipe.zremrangebyscore(self.lru_key, "-inf", time.time() - self.ttl)
+        pipe.zcard(self.lru_key)
+        size = pipe.execute()[-1]
+        excess = size - self.max_entries
+        if excess <= 0:
+            return 0
+        oldest = [k.decode() for k in self.connection.zrange(
+            self.lru_key, 0, excess - 1)]
+        pipe = self.connection.pipeline()
+        pipe.delete(*[self.prefix + k for k in oldest])
+        pipe.zrem(self.lru_key, *oldest)
+        pipe.execute()
+        return len(oldest)
+
+    def clear(self):
+        """drop every entry"""
+        keys = [
+            k.decode() for k in self.connection.zrange(self.lru_key, 0, -1)
+        ]
+        if keys:
+            self.connection.delete(*[self.prefix + k for k in keys])
+        self.connection.delete(self.lru_key)
+
+    def __len__(self):
+        return self.connection.zcard(self.lru_key)
+
+
+class AIResultCache:
+    """Cache of parsed AI results keyed by document and prompt
+
+    Counts hits, misses, stores and evictions, see stats().
+    """
+
+    def __init__(self, backend):
+        """Initialize the cache over a backend, None disables it"""
+        self.backend = backend
+        self.__lock = threading.Lock()
+        self.__counters = dict.fromkeys(
+                ("hits", "misses", "stores", "evictions", "errors"), 0
+                )
+
+    def __count(self, name, n=1):
+        with self.__lock:
+            self.__counters[name] += n
+
+    @staticmethod
+    def key(file_path, prompt):
+        """cache key of the answer to prompt about the file's content"""
+        return f"{prompt_identity(prompt)}:{file_digest(file_path)}"
+
+    @staticmethod
+    def text_key(prompt, *texts):
+        """cache key of the answer to prompt about texts, each hashed
+        separately so that a key shows which side changed"""
+        digests = ":".join(text_digest(text) for text in texts)
+        return f"{prompt_identity(prompt)}:{digests}"
+
+    def get(self, key):
+        """the cached result for key, or None"""
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # a broken cache must never break an upload
+            print("AI cache read failed:", e)
+            self.__count("errors")
+            value = None
+        if value is None:
+            self.__count("misses")
+            return None
+        self.__count("hits")
+        return json.loads(value)
+
+    def set(self, key, result):
+        """cache a result for key"""
+        if self.backend is None:
+            return
+        try:
+            evicted = self.backend.set(key, json.dumps(result))
+        except Exception as e:
+            print("AI cache write failed:", e)
+            self.__count("errors")
+            return
+        self.__count("stores")
+        self.__count("evictions", evicted)
+
+    def clear(self):
+        """drop every entry"""
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """hit/miss counters of this process, the hit rate and the number
+        of entries in the backend"""
+        with self.__lock:
+            stats = dict(self.__counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["backend"] = type(self.backend).__name__ if self.backend \
+            else None
+        try:
+            stats["entries"] = len(self.backend) if self.backend else 0
+        except Exception:
+            stats["entries"] = None
+        return stats
+
+
+def make_backend(name=None, directory=None, redis_db=None,
+                 prefix="ai-cache:", max_entries=None, ttl=None):
+    """
+    Returns the backend named in ApplicationConfig.AI_CACHE_BACKEND.
+
+    The other arguments default to the AI_CACHE_* settings.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    name = name or ApplicationConfig.AI_CACHE_BACKEND
+    max_entries = max_entries or ApplicationConfig.AI_CACHE_MAX_ENTRIES
+    ttl = ttl or ApplicationConfig.AI_CACHE_TTL
+    if name == "none":
+        return None
+    if name == "memory":
+        return MemoryBackend(max_entries, ttl)
+    if name == "disk":
+        return DiskBackend(
+            directory or ApplicationConfig.AI_CACHE_DIR, max_entries, ttl
+        )
+    if name == "redis":
+        connection = Redis(
+            host=ApplicationConfig.REDIS_HOST,
+            port=ApplicationConfig.REDIS_PORT,
+            db=(ApplicationConfig.AI_CACHE_REDIS_DB if redis_db is None
+                else redis_db),
+        )
+        return RedisBackend(connection, max_entries, ttl, prefix)
+    raise ValueError(f"Unknown AI cache backend '{name}'")
+
+
+ai_cache = AIResultCache(make_backend())
+
+match_score_cache = AIResultCache(make_backend(
+    ApplicationConfig.MATCH_CACHE_BACKEND,
+    directory=ApplicationConfig.MATCH_CACHE_DIR,
+    prefix="match-cache:",
+    max_entries=ApplicationConfig.MATCH_CACHE_MAX_ENTRIES,
+    ttl=ApplicationConfig.MATCH_CACHE_TTL,
+))
@@ -3,12 +3,19 @@
 
 from server.prompts import JOB_MATCHING_PROMPT
 from server.services.ai import AIService
+from server.services.ai_cache import AIResultCache, match_score_cache
 
 
 class AIJobMatcher:
     """
     A class used to match a candidate with a job using AI.
 
+    Scores are memoized in match_score_cache, keyed by the hashes of the
+    candidate's and the job's text: asking again about an unchanged pair,
+    say after a candidate withdraws and re-applies, does not reach the
+    model, while any edit to either side's skills, experiences,
+    educations or description changes its text and so its key.
+
     Attributes
     ----------
     candidate : Candidate
@@ -24,18 +31,8 @@ class AIJobMatcher:
         self.job = job
         self.ai = AIService()
 
-    def calculate_match_score(self):
-        """
-        Calculate the match score between the candidate and the job.
-
-        Concatenate the candidate's experiences, skills, and education and
-        the job's description, skills, and responsibilities into one text,
-        add a prompt to tell the AI to make the comparison, and return a
-        match_score.
-
-        Returns:
-            float: The match score.
-        """
+    def candidate_text(self):
+        """The candidate's experiences, skills, and education as one text"""
         candidate_experiences = " ".join(
             [exp.description for exp in self.candidate.experiences]
         )
@@ -50,7 +47,7 @@ class AIJobMatcher:
             ]
         )
 
-        candidate_info = (
+        return (
             "Candidate's experiences, skills, and education:"
             + candidate_experiences
             + " "
@@ -59,9 +56,12 @@ class AIJobMatcher:
             + candidate_education
         )
 
+    def job_text(self):
+        """The job's description, skills, and responsibilities as one
+        text"""
         job_skills = " ".join([skill.name for skill in self.job.skills])
         job_responsibilities = " ".join(self.job.responsibilities)
-        job_info = (
+        return (
             "Job's description, required skills, and responsibilities:"
             + self.job.job_description
             + " "
@@ -70,6 +70,29 @@ class AIJobMatcher:
             + job_responsibilities
         )
 
+    def calculate_match_score(self):
+        """
+        Calculate the match score between the candidate and the job.
+
+        Concatenate the candidate's experiences, skills, and education and
+        the job's description, skills, and responsibilities into one text,
+        add a prompt to tell the AI to make the comparison, and return a
+        match_score. A score already computed for the same two texts is
+        returned from match_score_cache instead.
+
+        Returns:
+            float: The match score.
+        """
+        candidate_info = self.candidate_text()
+        job_info = self.job_text()
+
+        cache_key = AIResultCache.text_key(
+            JOB_MATCHING_PROMPT, candidate_info, job_info
+        )
+        cached = match_score_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         combined_info = candidate_info + " " + job_info
 
         # Ask the AI to calculate the match score
@@ -86,4 +109,5 @@ class AIJobMatcher:
         if not (0.0 <= match_score <= 1.0):
             raise ValueError("Match score is out of the valid range (0.0 to 1.0)")
 
+        match_score_cache.set(cache_key, match_score)
         return match_score
@@ -0,0 +1,181 @@
+"""
+Text extraction in a pool of worker processes.
+
+pdfminer is pure Python and CPU bound; run in a request thread it holds
+the GIL and stalls every other request of the worker. ExtractionService
+runs text_extractor in separate processes instead, with:
+
+    - a size limit checked before any parsing,
+    - page and character budgets passed down to the parsers, which stop
+      reading once either is spent,
+    - a timeout per document; a document that overruns has its worker
+      process killed, so a pathological file cannot pin a CPU forever,
+    - extract_many, which extracts a batch of files in parallel.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
+
+from server.config import ApplicationConfig
+from server.exception import UnreadableCVError
+
+
+def extract_in_worker(file_path, max_pages, max_chars):
+    """the job run in a worker process"""
+    # imported here so that only the workers load the parsers
+    from server.services.text_extractor import extract_text
+
+    return extract_text(file_path, max_pages, max_chars)
+
+
+class ExtractionService:
+    """Process pool extracting the text of PDF, DOC and DOCX files
+
+    Attrs:
+        workers: number of worker processes
+        timeout: seconds allowed per document
+        max_pages: pages of a PDF that are read, 0 for all
+        max_chars: characters of text kept, 0 for all
+        max_bytes: largest file accepted
+    """
+
+    def __init__(self, workers=2, timeout=30, max_pages=0, max_chars=0,
+                 max_bytes=None, target=extract_in_worker):
+        """Initialize the service; the pool starts on first use
+
+        Args:
+            target: picklable function(file_path, max_pages, max_chars)
+                run in the workers
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.target = target
+        self.__lock = threading.Lock()
+        self.__executor = None
+
+    def __pool(self):
+        """the running executor, started if needed"""
+        with self.__lock:
+            if self.__executor is None:
+                # spawn: never fork the threads and sockets of the app
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self.__executor
+
+    def __restart(self, executor):
+        """kill the workers of executor, the next call starts a new pool;
+        documents still running in it fail with BrokenProcessPool"""
+        with self.__lock:
+            if self.__executor is executor:
+                self.__executor = None
+        # the executor has no public way to stop a running job
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def __check_size(self, file_path):
+        """
+        Raises:
+            ValueError: If the file is larger than max_bytes.
+        """
+        if self.max_bytes and os.path.getsize(file_path) > self.max_bytes:
+            raise ValueError("File is too large to extract")
+
+    def __submit(self, file_path):
+        """(executor, future) of one document"""
+        executor = self.__pool()
+        return executor, executor.submit(
+                self.target, file_path, self.max_pages, self.max_chars
+                )
+
+    def extract(self, file_path, timeout=None):
+        """
+        Returns the text of one document.
+
+        Raises:
+            ValueError: If the file is too large or of an unsupported type.
+            UnreadableCVError: If the file has no text, or takes longer
+                than the timeout to extract.
+        """
+        self.__check_size(file_path)
+        timeout = timeout or self.timeout
+        for retry in (True, False):
+            executor, future = self.__submit(file_path)
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeout:
+                print(f'extracting "{file_path}" timed out after {timeout}s')
+                self.__restart(executor)
+                raise UnreadableCVError("The file took too long to read.")
+            except BrokenProcessPool:
+                # another document's timeout killed the pool: run again
+                self.__restart(executor)
+                if not retry:
+                    raise
+
+    def extract_many(self, file_paths, timeout=None):
+        """
+        Extracts many documents in parallel, for bulk imports.
+
+        Args:
+            file_paths: paths of the documents.
+            timeout: seconds allowed per document.
+
+        Returns:
+            dict of path to its text, or to the exception that prevented
+            its extraction.
+        """
+        timeout = timeout or self.timeout
+        results = {}
+        pending = {}
+        for file_path in file_paths:
+            try:
+                self.__check_size(file_path)
+            except (OSError, ValueError) as e:
+                results[file_path] = e
+                continue
+            executor, future = self.__submit(file_path)
+            pending[future] = (file_path, executor)
+
+        # the batch runs workers at a time, allow each its own timeout
+        batches = -(-len(pending) // max(1, self.workers))
+        done, not_done = wait(pending, timeout=timeout * max(1, batches))
+        for future in done:
+            file_path, _ = pending[future]
+            try:
+                results[file_path] = future.result()
+            except Exception as e:
+                results[file_path] = e
+        if not_done:
+            for future in not_done:
+                file_path, _ = pending[future]
+                results[file_path] = UnreadableCVError(
+                        "The file took too long to read."
+                        )
+            self.__restart(pending[next(iter(not_done))][1])
+        return {path: results[path] for path in file_paths}
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+extractor = ExtractionService(
+    workers=ApplicationConfig.EXTRACT_WORKERS,
+    timeout=ApplicationConfig.EXTRACT_TIMEOUT,
+    max_pages=ApplicationConfig.EXTRACT_MAX_PAGES,
+    max_chars=ApplicationConfig.EXTRACT_MAX_CHARS,
+    max_bytes=ApplicationConfig.EXTRACT_MAX_BYTES,
+)
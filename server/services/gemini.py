@@ -0,0 +1,151 @@
+"""
+Process-wide Gemini client and models.
+
+Configuring the SDK and building a GenerativeModel used to happen in every
+AIService constructor, that is once per upload, per CV parse and per
+application scored. GeminiRegistry does both once per process, on first
+use: importing this module, or constructing an AIService, costs nothing
+until a model is actually called.
+
+Every call to the model, generating or uploading a file, holds one of
+GEMINI_MAX_CONCURRENCY slots, so a burst of uploads or a bulk re-score
+cannot open more requests than the API quota of one worker allows; a
+call waits at most GEMINI_SLOT_TIMEOUT seconds for a slot.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from server.config import ApplicationConfig
+from server.exception import AIResponseError
+
+
+class GeminiRegistry:
+    """Lazily configured Gemini SDK and cache of its models
+
+    Attrs:
+        max_concurrency: model calls in flight at once in this process
+        slot_timeout: seconds a call waits for a free slot
+    """
+
+    def __init__(self, api_key=None, max_concurrency=4, slot_timeout=30):
+        """Initialize the registry; the SDK is only imported and
+        configured on first use
+
+        Args:
+            api_key: the Google API key, GOOGLE_API_KEY when None
+        """
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.slot_timeout = slot_timeout
+        self.__lock = threading.Lock()
+        self.__genai = None
+        self.__models = {}
+        self.__slots = threading.BoundedSemaphore(max_concurrency)
+        self.__counters = dict.fromkeys(
+                ("calls", "in_flight", "waiting", "timeouts"), 0
+                )
+        self.__waited = 0.0
+
+    def __count(self, name, n=1):
+        with self.__lock:
+            self.__counters[name] += n
+
+    @property
+    def genai(self):
+        """the configured google.generativeai module"""
+        with self.__lock:
+            if self.__genai is None:
+                # imported here: the SDK is slow to import and only
+                # workers that call the model need it
+                import google.generativeai as genai
+
+                genai.configure(
+                    api_key=self.api_key or ApplicationConfig.GOOGLE_API_KEY
+                )
+                self.__genai = genai
+            return self.__genai
+
+    def model(self, model_name, generation_config=None,
+              safety_settings=None):
+        """
+        Returns the shared GenerativeModel of these settings, built on
+        first request.
+        """
+        key = (
+            model_name,
+            json.dumps(generation_config, sort_keys=True),
+            json.dumps(safety_settings, sort_keys=True),
+        )
+        model = self.__models.get(key)
+        if model is None:
+            genai = self.genai
+            with self.__lock:
+                model = self.__models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel(
+                        model_name=model_name,
+                        generation_config=generation_config,
+                        safety_settings=safety_settings,
+                    )
+                    self.__models[key] = model
+        return model
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds one of the max_concurrency call slots for the duration of
+        the block.
+
+        Raises:
+            AIResponseError: If no slot frees up within slot_timeout.
+        """
+        self.__count("waiting")
+        start = time.monotonic()
+        acquired = self.__slots.acquire(timeout=self.slot_timeout)
+        waited = time.monotonic() - start
+        with self.__lock:
+            self.__counters["waiting"] -= 1
+            self.__waited += waited
+        if not acquired:
+            self.__count("timeouts")
+            raise AIResponseError(
+                "The AI service is busy. Please try again later."
+            )
+        self.__count("calls")
+        self.__count("in_flight")
+        try:
+            yield
+        finally:
+            self.__count("in_flight", -1)
+            self.__slots.release()
+
+    def upload_file(self, file_path):
+        """upload a file to Gemini, within a slot"""
+        genai = self.genai
+        with self.slot():
+            return genai.upload_file(file_path)
+
+    def stats(self):
+        """calls made, calls in flight and waiting for a slot, slot
+        timeouts, seconds spent waiting and models built"""
+        with self.__lock:
+            stats = dict(self.__counters)
+            stats["wait_seconds"] = round(self.__waited, 3)
+            stats["models"] = len(self.__models)
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
+
+    def reset(self):
+        """forget the configured SDK and the models, e.g. after the API
+        key was rotated"""
+        with self.__lock:
+            self.__genai = None
+            self.__models.clear()
+
+
+gemini = GeminiRegistry(
+    max_concurrency=ApplicationConfig.GEMINI_MAX_CONCURRENCY,
+    slot_timeout=ApplicationConfig.GEMINI_SLOT_TIMEOUT,
+)
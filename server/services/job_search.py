@@ -0,0 +1,77 @@
+"""
+Pluggable search engines behind /jobs/search.
+
+Both engines take the same query and return the ids of the open jobs
+that match it, the most relevant first, one window of results at a
+time:
+
+    fuzzy: the in-process trigram index with fuzzy scoring on the job
+        title and location, see search_index.
+    fulltext: the database's native full-text search (FULLTEXT on MySQL,
+        FTS5 on SQLite) on the job title, description and location.
+
+ApplicationConfig.JOB_SEARCH_ENGINE picks the one in use. An engine's
+discard(ids) drops the jobs its results held that are no longer open.
+"""
+from server.config import ApplicationConfig
+from server.models import storage
+from server.services.search_index import job_index
+
+
+class FuzzySearchEngine:
+    """Fuzzy matching through the in-process JobSearchIndex"""
+
+    def __init__(self, index=None):
+        """Initialize the engine over index, the shared one by default"""
+        self.index = index or job_index
+
+    def search(self, location=None, title=None, offset=0, limit=None,
+               newest_first=False):
+        """Returns up to limit matching job ids, skipping offset"""
+        ids = self.index.search(location, title, newest_first=newest_first)
+        end = offset + limit if limit else None
+        return ids[offset:end]
+
+    def discard(self, ids):
+        """Drop jobs found closed or deleted since they were indexed;
+        returns True, as they leave the results"""
+        for job_id in ids:
+            self.index.remove(job_id)
+        return True
+
+
+class FullTextSearchEngine:
+    """Native full-text search in the database"""
+
+    def search(self, location=None, title=None, offset=0, limit=None,
+               newest_first=False):
+        """Returns up to limit matching job ids, skipping offset"""
+        return storage.search_jobs(
+                title, location, offset=offset, limit=limit,
+                newest_first=newest_first
+                )
+
+    def discard(self, ids):
+        """Nothing to drop, the database is searched as it is; returns
+        False"""
+        return False
+
+
+engines = {
+    "fuzzy": FuzzySearchEngine,
+    "fulltext": FullTextSearchEngine,
+}
+
+
+def get_search_engine(name=None):
+    """
+    Returns an instance of the named search engine, by default the one
+    set in ApplicationConfig.JOB_SEARCH_ENGINE.
+
+    Raises:
+        ValueError: If the engine is unknown.
+    """
+    name = name or ApplicationConfig.JOB_SEARCH_ENGINE
+    if name not in engines:
+        raise ValueError(f"Unknown job search engine '{name}'")
+    return engines[name]()
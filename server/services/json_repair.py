@@ -0,0 +1,97 @@
+"""
+Best-effort repair of almost-JSON model output.
+
+Gemini sometimes wraps its answer in prose or code fences, leaves a
+trailing comma, or stops mid-object when it runs out of tokens. Fixing
+those locally is much cheaper than asking the model again.
+"""
+import re
+from json import JSONDecodeError, loads
+
+CLOSERS = {"{": "}", "[": "]"}
+
+# a comma directly before a closing bracket, outside of strings
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def strip_fences(text):
+    """text without a surrounding ``` or ```json fence"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text[3:]
+        if text.startswith("json"):
+            text = text[4:]
+        if text.endswith("```"):
+            text = text[:-3]
+    return text.strip()
+
+
+def repair_json(text):
+    """
+    Returns text trimmed to its first JSON object or array, with trailing
+    commas dropped and any brackets or string left open closed again.
+    The result may still not be valid JSON.
+    """
+    text = strip_fences(text or "")
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    text = text[min(starts):]
+
+    stack = []
+    in_string = escaped = False
+    out = []
+    for char in text:
+        out.append(char)
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+        elif char in "}]":
+            if stack and stack[-1] == char:
+                stack.pop()
+            if not stack:
+                break  # drop whatever follows the outermost value
+
+    repaired = "".join(out)
+    if stack:
+        # the output was cut short: close the string, drop a dangling
+        # separator or key, and close every open bracket
+        if in_string:
+            repaired += '"'
+        if stack[-1] == "}":
+            # inside an object a trailing string is a key with no value
+            repaired = re.sub(r'([{,])\s*"[^"]*"\s*:?\s*$', r"\1", repaired)
+        repaired = re.sub(r"[,:]\s*$", "", repaired.rstrip())
+        repaired += "".join(reversed(stack))
+    return _drop_trailing_commas(repaired)
+
+
+def _drop_trailing_commas(text):
+    """remove commas before a closing bracket, leaving strings alone"""
+    parts = re.split(r'("(?:[^"\\]|\\.)*")', text)
+    return "".join(
+        part if i % 2 else TRAILING_COMMA.sub(r"\1", part)
+        for i, part in enumerate(parts)
+    )
+
+
+def loads_lenient(text):
+    """
+    Returns the JSON value in text, repairing it if needed.
+
+    Raises:
+        JSONDecodeError: If the text cannot be repaired.
+    """
+    text = strip_fences(text or "")
+    try:
+        return loads(text, strict=False)
+    except JSONDecodeError:
+        return loads(repair_json(text), strict=False)
@@ -1,47 +1,547 @@
+import atexit
+import logging
 import smtplib
+import socket
+import sqlite3
 import ssl
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import queue
 import threading
 from dotenv import load_dotenv
 import os
 import time
 
+from server.config import ApplicationConfig
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+
+class MailOutbox:
+    '''Emails to send, in a SQLite database
+
+    An email is added `pending`, claimed `sending` by a worker for `lease`
+    seconds, and ends `sent`, or `dead` once its last attempt failed. A
+    failed attempt puts it back `pending` with the time of its next
+    attempt. The claim of a worker that died expires and the email is
+    claimed again, so an email is sent at least once; an idempotency key
+    keeps the same email from being added twice.
+    '''
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS outbox (
+            id TEXT PRIMARY KEY,
+            idempotency_key TEXT UNIQUE,
+            receiver_email TEXT NOT NULL,
+            name TEXT,
+            subject TEXT NOT NULL,
+            template TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_until REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS outbox_due"
+        " ON outbox (status, next_attempt_at)",
+    )
+
+    def __init__(self, path):
+        '''Open (and create) the outbox at path, ":memory:" for tests'''
+        self.path = path
+        self.__lock = threading.Lock()
+        # one connection shared by the threads of this process; sqlite
+        # serializes writers across processes
+        self.__conn = sqlite3.connect(
+                path, check_same_thread=False, timeout=30,
+                isolation_level=None,
+                )
+        self.__conn.row_factory = sqlite3.Row
+        with self.__lock:
+            for statement in self.SCHEMA:
+                self.__conn.execute(statement)
+
+    @contextmanager
+    def __transaction(self):
+        '''the connection, in a write transaction taken at once, so that
+        two processes never claim the same email'''
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.__conn
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            self.__conn.execute("COMMIT")
+
+    def add(self, emails):
+        '''
+        Insert emails in one transaction.
+
+        Args:
+            emails: dicts of template, receiver_email, name, subject and
+                an optional idempotency_key.
+
+        Returns:
+            list: The id of each email, None where its idempotency key
+            was already in the outbox.
+        '''
+        now = time.time()
+        stamp = datetime.utcnow().isoformat()
+        ids = []
+        with self.__transaction() as conn:
+            for email in emails:
+                email_id = str(uuid.uuid4())
+                cursor = conn.execute(
+                    "INSERT INTO outbox (id, idempotency_key, receiver_email,"
+                    " name, subject, template, status, next_attempt_at,"
+                    " created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (idempotency_key) DO NOTHING",
+                    (email_id, email.get("idempotency_key"),
+                     email["receiver_email"], email.get("name"),
+                     email["subject"], email["template"], PENDING, now,
+                     stamp, stamp),
+                )
+                ids.append(email_id if cursor.rowcount else None)
+        return ids
+
+    def claim(self, limit, lease):
+        '''
+        Claim up to limit emails due now, the oldest first, for lease
+        seconds; each claim counts as an attempt.
+
+        Returns:
+            list: The claimed emails, as dicts.
+        '''
+        now = time.time()
+        stamp = datetime.utcnow().isoformat()
+        with self.__transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM outbox"
+                " WHERE (status = ? AND next_attempt_at <= ?)"
+                " OR (status = ? AND claimed_until < ?)"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, SENDING, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1,"
+                " claimed_until = ?, updated_at = ? WHERE id = ?",
+                [(SENDING, now + lease, stamp, row["id"]) for row in rows],
+            )
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def __set(self, ids, sql, *params):
+        '''run an UPDATE setting sql on the emails of ids'''
+        if not ids:
+            return
+        stamp = datetime.utcnow().isoformat()
+        with self.__transaction() as conn:
+            conn.executemany(
+                f"UPDATE outbox SET {sql}, claimed_until = NULL,"
+                " updated_at = ? WHERE id = ?",
+                [(*params, stamp, email_id) for email_id in ids],
+            )
+
+    def mark_sent(self, ids):
+        '''the emails of ids were sent'''
+        self.__set(ids, "status = ?, last_error = NULL", SENT)
+
+    def retry(self, email_id, error, at):
+        '''the email failed, try it again at the epoch time at'''
+        self.__set(
+            [email_id], "status = ?, last_error = ?, next_attempt_at = ?",
+            PENDING, error, at,
+        )
+
+    def bury(self, email_id, error):
+        '''the last attempt of the email failed, give up on it'''
+        self.__set([email_id], "status = ?, last_error = ?", DEAD, error)
+
+    def release(self, ids):
+        '''give back claimed emails that were not attempted'''
+        self.__set(ids, "status = ?, attempts = attempts - 1", PENDING)
+
+    def requeue_dead(self):
+        '''give every dead email a new set of attempts, returns how many'''
+        stamp = datetime.utcnow().isoformat()
+        with self.__transaction() as conn:
+            return conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0,"
+                " next_attempt_at = ?, updated_at = ? WHERE status = ?",
+                (PENDING, time.time(), stamp, DEAD),
+            ).rowcount
+
+    def purge(self, before):
+        '''delete the emails sent before the datetime before; their
+        idempotency keys can be used again'''
+        with self.__transaction() as conn:
+            return conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND updated_at < ?",
+                (SENT, before.isoformat()),
+            ).rowcount
+
+    def next_due(self):
+        '''epoch time at which the next email falls due, None if none'''
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT MIN(CASE WHEN status = ? THEN next_attempt_at"
+                " ELSE claimed_until END) FROM outbox"
+                " WHERE status IN (?, ?)",
+                (PENDING, PENDING, SENDING),
+            ).fetchone()
+        return row[0]
+
+    def counts(self):
+        '''number of emails in each status, and of pending ones due'''
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT status, COUNT(*), SUM(next_attempt_at <= ?)"
+                " FROM outbox GROUP BY status",
+                (time.time(),),
+            ).fetchall()
+        counts = dict.fromkeys((PENDING, SENDING, SENT, DEAD, "due"), 0)
+        for status, count, due in rows:
+            counts[status] = count
+            if status == PENDING:
+                counts["due"] = due
+        return counts
+
+
 class MailService:
-    '''Mail service with a queue for non-blocking email sending.'''
-    def __init__(self, max_retries=3, retry_delay=5):
+    '''Mail service with a durable outbox for non-blocking email sending.
+
+    One instance, mail_service, serves the whole process: its pool of
+    `workers` threads is started by create_app and stays the same size
+    however many controllers send through it. Creating the service opens
+    nothing: its outbox is opened at outbox_path on first use.
+
+    send_mail adds the email to the outbox and returns; the workers claim
+    due emails batch_size at a time. A failed attempt is rescheduled
+    retry_delay seconds later, doubling with each attempt, rather than
+    slept on, and after max_retries attempts the email is dead-lettered.
+
+    Each worker keeps its own logged-in SMTP connection and sends up to
+    max_per_connection emails through it. While idle the worker sends a
+    NOOP every `keepalive` seconds, and hangs up after `idle_timeout`
+    seconds without an email; a connection found broken is dropped and
+    the email is sent again on a new one.
+    '''
+    connect_timeout = 30
+    retry_max_delay = 3600
+    # sent emails are deleted from the outbox after this long
+    retention = timedelta(days=7)
+
+    def __init__(self, max_retries=5, retry_delay=5, workers=2,
+                 max_per_connection=100, keepalive=30, idle_timeout=300,
+                 outbox=None, batch_size=10, lease=300, outbox_path=None,
+                 drain_timeout=10):
+        '''
+        Args:
+            outbox: the MailOutbox to use; by default one is opened at
+                outbox_path, or in memory without one, on first use.
+        '''
         self.smtp_server = os.getenv("SMTP_SERVER")
         self.port = int(os.getenv("SMTP_PORT"))
         self.password = os.getenv("SMTP_PASSWORD")
         self.sender_email = os.getenv("SENDER_EMAIL")
+        self.use_ssl = os.getenv("SMTP_USE_SSL", "true").lower() == "true"
         self.context = ssl.create_default_context()
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.workers = workers
+        self.max_per_connection = max_per_connection
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.outbox_path = outbox_path
+        self.__outbox = outbox
+        self.batch_size = batch_size
+        self.lease = lease
+        self.drain_timeout = drain_timeout
 
-        self.email_queue = queue.Queue()
-        self.start_workers()
+        self.__lock = threading.Lock()
+        self.__threads = []
+        self.__closed = False
+        self.__stopping = threading.Event()
+        self.__wakeup = threading.Event()
+        self.__purged_at = 0.0
+        # the SMTP connection of each worker thread
+        self.__local = threading.local()
+        self.__counters = dict.fromkeys(
+                ("queued", "duplicates", "sent", "failed", "dead",
+                 "in_flight", "connections", "open_connections"), 0
+                )
+
+    def __count(self, name, n=1):
+        with self.__lock:
+            self.__counters[name] += n
+
+    @property
+    def outbox(self):
+        '''the MailOutbox, opened on first use'''
+        with self.__lock:
+            if self.__outbox is None:
+                self.__outbox = MailOutbox(self.outbox_path or ":memory:")
+            return self.__outbox
 
     def start_workers(self):
-        '''Start worker threads to process email sending tasks.'''
-        for _ in range(2):  # Number of worker threads two
-            threading.Thread(target=self.worker, daemon=True).start()
+        '''Start the worker threads, once; they also send what an earlier
+        process left in the outbox. At exit they keep sending what is
+        due for drain_timeout seconds at most.'''
+        with self.__lock:
+            if self.__threads or self.__closed:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                        target=self.worker, name=f"mail-{i}", daemon=True
+                        )
+                thread.start()
+                self.__threads.append(thread)
+        atexit.register(self.shutdown, self.drain_timeout)
 
     def worker(self):
-        '''Worker thread to process email sending tasks from the queue.'''
+        '''Worker thread sending the emails it claims from the outbox.'''
+        while not self.__stopping.is_set():
+            self.__wakeup.clear()
+            batch = self.outbox.claim(self.batch_size, self.lease)
+            if batch:
+                self.__send_batch(batch)
+            else:
+                self.__idle()
+        self._disconnect()
+
+    def __idle(self):
+        '''wait for a new email or the next retry, keeping the connection
+        alive and the outbox trimmed meanwhile'''
+        due = self.outbox.next_due()
+        timeout = self.keepalive
+        if due is not None:
+            timeout = min(timeout, max(0.0, due - time.time()))
+        if not self.__wakeup.wait(timeout):
+            self._keep_alive()
+        if time.monotonic() - self.__purged_at > 3600:
+            self.__purged_at = time.monotonic()
+            self.outbox.purge(datetime.utcnow() - self.retention)
+
+    def __send_batch(self, batch):
+        '''attempt each claimed email once'''
+        sent = []
+        for i, email in enumerate(batch):
+            if self.__stopping.is_set():
+                self.outbox.release([e["id"] for e in batch[i:]])
+                break
+            self.__count("in_flight")
+            try:
+                self._send_mail(email["template"], email["receiver_email"],
+                                email["name"], email["subject"])
+            except Exception as e:
+                self.__count("failed")
+                self.__reschedule(email, e)
+            else:
+                self.__count("sent")
+                sent.append(email["id"])
+            finally:
+                self.__count("in_flight", -1)
+        self.outbox.mark_sent(sent)
+
+    def __reschedule(self, email, error):
+        '''retry a failed email later, or dead-letter it'''
+        attempts = email["attempts"]
+        print(f"Attempt {attempts} failed: {error}")
+        if attempts >= self.max_retries:
+            print(
+                f"Failed to send email to {email['receiver_email']}"
+                f" after {attempts} attempts."
+            )
+            self.__count("dead")
+            self.outbox.bury(email["id"], str(error))
+            return
+        delay = min(self.retry_max_delay,
+                    self.retry_delay * 2 ** (attempts - 1))
+        self.outbox.retry(email["id"], str(error), time.time() + delay)
+
+    def send_mail(self, template, receiver_email, name, subject,
+                  idempotency_key=None):
+        '''Add an email to the outbox.
+
+        Args:
+            idempotency_key: a key naming this email, e.g. the event it
+                tells about; an email whose key was already added is
+                dropped.
+
+        Returns:
+            str: The id of the email, None if it was a duplicate.
+        '''
+        if self.__closed:
+            raise RuntimeError("The mail service is shut down")
+        email_id, = self.outbox.add([{
+            "template": template, "receiver_email": receiver_email,
+            "name": name, "subject": subject,
+            "idempotency_key": idempotency_key,
+        }])
+        self.__count("queued" if email_id else "duplicates")
+        self.__wakeup.set()
+        return email_id
+
+    def send_many(self, emails):
+        '''Add many emails to the outbox in one transaction.
+
+        Args:
+            emails: dicts of template, receiver_email, name, subject and
+                an optional idempotency_key.
+
+        Returns:
+            list: The id of each email, None for duplicates.
+        '''
+        if self.__closed:
+            raise RuntimeError("The mail service is shut down")
+        ids = self.outbox.add(emails)
+        added = sum(1 for email_id in ids if email_id)
+        self.__count("queued", added)
+        self.__count("duplicates", len(ids) - added)
+        if added:
+            self.__wakeup.set()
+        return ids
+
+    def drain(self, timeout=None):
+        '''Wait until every email due is sent or rescheduled; emails
+        waiting for a later retry are not waited for.
+
+        Returns:
+            bool: False if emails were still due after timeout seconds.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
         while True:
-            template, receiver_email, name, subject = self.email_queue.get()
-            self._send_mail(template, receiver_email, name, subject)
-            self.email_queue.task_done()
+            counts = self.outbox.counts()
+            if not counts["due"] and not counts[SENDING]:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def shutdown(self, timeout=0):
+        '''Stop accepting emails and stop the workers once they have sent
+        what is due, or after timeout seconds; what is left stays in the
+        outbox for the next start.
+
+        Returns:
+            int: The number of emails left unsent.
+        '''
+        with self.__lock:
+            self.__closed = True
+            threads, self.__threads = self.__threads, []
+        if threads:
+            self.drain(timeout)
+        self.__stopping.set()
+        self.__wakeup.set()
+        for thread in threads:
+            # a worker finishes the email it is sending
+            thread.join(self.connect_timeout)
+        counts = self.outbox.counts()
+        return counts[PENDING] + counts[SENDING]
+
+    def stats(self):
+        '''Emails waiting in the outbox (queue_depth), due now, being sent
+        and dead-lettered; worker threads alive; emails queued, dropped
+        as duplicates, sent, failed and dead-lettered by this process, SMTP
+        connections opened in all and open now, and the threads of the
+        process.'''
+        with self.__lock:
+            stats = dict(self.__counters)
+            stats["workers"] = sum(1 for t in self.__threads if t.is_alive())
+        counts = self.outbox.counts()
+        stats["queue_depth"] = counts[PENDING]
+        stats["due"] = counts["due"]
+        stats["sending"] = counts[SENDING]
+        stats["dead_letters"] = counts[DEAD]
+        stats["process_threads"] = threading.active_count()
+        return stats
+
+    def _connect(self):
+        '''Open and log in a new SMTP connection.'''
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(
+                    self.smtp_server, self.port, context=self.context,
+                    timeout=self.connect_timeout
+                    )
+        else:
+            server = smtplib.SMTP(
+                    self.smtp_server, self.port, timeout=self.connect_timeout
+                    )
+        try:
+            if self.password:
+                server.login(self.sender_email, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.__count("connections")
+        self.__count("open_connections")
+        return server
+
+    def _connection(self):
+        '''The SMTP connection of the current thread, opened if needed
+        and renewed after max_per_connection emails.'''
+        local = self.__local
+        if (
+            getattr(local, "server", None) is not None
+            and local.sent >= self.max_per_connection
+        ):
+            self._disconnect()
+        if getattr(local, "server", None) is None:
+            local.server = self._connect()
+            local.sent = 0
+            local.last_used = time.monotonic()
+        return local.server
 
-    def send_mail(self, template, receiver_email, name, subject):
-        '''Enqueue email sending task.'''
-        self.email_queue.put((template, receiver_email, name, subject))
+    def _disconnect(self):
+        '''Hang up the SMTP connection of the current thread, if any.'''
+        server = getattr(self.__local, "server", None)
+        if server is None:
+            return
+        self.__local.server = None
+        self.__count("open_connections", -1)
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _keep_alive(self):
+        '''NOOP on the idle connection of the current thread, or hang it
+        up once idle for idle_timeout seconds.'''
+        server = getattr(self.__local, "server", None)
+        if server is None:
+            return
+        if time.monotonic() - self.__local.last_used > self.idle_timeout:
+            self._disconnect()
+            return
+        try:
+            code, _ = server.noop()
+        except Exception:
+            code = None
+        if code != 250:
+            self._disconnect()
 
     def _send_mail(self, template, receiver_email, name, subject):
-        '''Internal method to send an email with retry mechanism.'''
+        '''Internal method to send one email.
+
+        A pooled connection found closed is replaced and the email sent
+        again once. An email the server refuses fails at once, on a
+        connection kept for the next one.
+
+        Raises:
+            Exception: What smtplib raised if the email was not sent.
+        '''
         message = MIMEMultipart('alternative')
         message["Subject"] = subject
         message["From"] = self.sender_email
@@ -62,15 +562,38 @@ class MailService:
         message.attach(part1)
         message.attach(part2)
 
-        for attempt in range(self.max_retries):
+        for retry in (True, False):
             try:
-                with smtplib.SMTP_SSL(self.smtp_server, self.port, context=self.context) as server:
-                    server.login(self.sender_email, self.password)
-                    server.sendmail(self.sender_email, receiver_email, message.as_string())
-                break
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt + 1 < self.max_retries:
-                    time.sleep(self.retry_delay)  # Wait
-                else:
-                    print(f"Failed to send email to {receiver_email} after {self.max_retries} attempts.")
+                server = self._connection()
+                server.sendmail(
+                    self.sender_email, receiver_email, message.as_string()
+                )
+                self.__local.sent += 1
+                self.__local.last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError,
+                    socket.timeout) as e:
+                logger.warning("SMTP connection lost: %s", e)
+                self._disconnect()
+                if not retry:
+                    raise
+            except (smtplib.SMTPResponseException,
+                    smtplib.SMTPRecipientsRefused):
+                # refused by a server still connected: fail this email
+                # only, keeping the connection
+                raise
+            except Exception:
+                self._disconnect()
+                raise
+
+
+mail_service = MailService(
+        workers=ApplicationConfig.MAIL_WORKERS,
+        max_per_connection=ApplicationConfig.SMTP_MAX_PER_CONNECTION,
+        keepalive=ApplicationConfig.SMTP_KEEPALIVE,
+        idle_timeout=ApplicationConfig.SMTP_IDLE_TIMEOUT,
+        outbox_path=ApplicationConfig.MAIL_OUTBOX_DB,
+        batch_size=ApplicationConfig.MAIL_BATCH_SIZE,
+        max_retries=ApplicationConfig.MAIL_MAX_ATTEMPTS,
+        drain_timeout=ApplicationConfig.MAIL_DRAIN_TIMEOUT,
+        )
@@ -0,0 +1,297 @@
+"""
+Local, deterministic candidate/job match scoring.
+
+A cheap alternative to asking Gemini for every application. The score,
+between 0.0 and 1.0, is a weighted mean of:
+
+    skills: share of the job's skills the candidate has, both sides
+        normalized through SKILL_SYNONYMS
+    major: whether the candidate studied the job's major
+    experience: the candidate's years of experience against the range
+        parsed from Job.exper_years
+    text: TF-IDF cosine similarity between the job description and the
+        candidate's experience
+
+A component that cannot be computed (a job listing no skills, an
+unparseable exper_years, ...) is left out and the weights of the others
+are rescaled.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from server.models import storage
+from server.models.job import Job
+from server.skill_synonyms import SKILL_SYNONYMS
+
+SYNONYMS = {k.lower(): v.lower() for k, v in SKILL_SYNONYMS.items()}
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our"
+    " the their this to we will with you your".split()
+)
+
+WORD = re.compile(r"[a-z0-9+#]+")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_skill(name):
+    """canonical, lower-cased name of a skill"""
+    name = " ".join((name or "").lower().split())
+    return SYNONYMS.get(name, name)
+
+
+def words(text):
+    """content words of text"""
+    return [
+        w for w in WORD.findall((text or "").lower()) if w not in STOP_WORDS
+    ]
+
+
+def parse_years(exper_years):
+    """(minimum, maximum) years parsed from strings like "3-5 years",
+    "5+ years" or "6 months"; maximum is None when open-ended, and the
+    whole is None when no number is found"""
+    numbers = [float(n) for n in NUMBER.findall(exper_years or "")]
+    if not numbers:
+        return None
+    if "month" in exper_years.lower():
+        numbers = [n / 12 for n in numbers]
+    low = numbers[0]
+    high = numbers[1] if len(numbers) > 1 else None
+    return low, high
+
+
+def experience_years(experiences, now=None):
+    """years covered by work experiences, overlapping periods counted
+    once"""
+    now = now or datetime.utcnow()
+    periods = sorted(
+        (xp.start_date, min(xp.end_date or now, now))
+        for xp in experiences if xp.start_date
+    )
+    total = 0.0
+    current_start = current_end = None
+    for start, end in periods:
+        if end <= start:
+            continue
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += (current_end - current_start).days
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += (current_end - current_start).days
+    return total / 365.25
+
+
+def experience_fit(candidate_years, required):
+    """1.0 when the candidate has the minimum years asked for, in
+    proportion below it"""
+    if required is None:
+        return None
+    low, _ = required
+    if low <= 0:
+        return 1.0
+    return min(1.0, candidate_years / low)
+
+
+class LocalMatchScorer:
+    """Scores candidates against jobs without calling a model
+
+    Only the first score waits for the IDF table to be fitted; once
+    REFIT_INTERVAL has passed, a score starts a refit in a background
+    thread and the current table is used until the new one is swapped
+    in.
+
+    Attrs:
+        WEIGHTS: weight of each component of the score
+        REFIT_INTERVAL: seconds after which the IDF table is rebuilt
+            from the job descriptions in the database
+    """
+
+    WEIGHTS = {"skills": 0.45, "major": 0.15, "experience": 0.15, "text": 0.25}
+    REFIT_INTERVAL = 3600
+
+    def __init__(self, loader=None):
+        """Initialize the scorer
+
+        Args:
+            loader: callable returning the texts the IDF table is fitted
+                on, the job descriptions by default
+        """
+        self.__loader = loader
+        # one fit at a time
+        self.__lock = threading.Lock()
+        self.__refitting = False
+        self.__fitted_at = None
+        # (idf of each word, idf of unknown words), replaced as a whole
+        self.__table = ({}, 1.0)
+
+    def fit(self, texts=None):
+        """(Re)build the IDF table from texts, or from the loader"""
+        with self.__lock:
+            self.__fit(texts)
+
+    def __fit(self, texts):
+        """build the IDF table and swap it in, the lock must be held"""
+        if texts is None:
+            texts = self.__loader() if self.__loader else []
+        df = Counter()
+        n = 0
+        for text in texts:
+            df.update(set(words(text)))
+            n += 1
+        # smoothed idf, as sklearn's TfidfVectorizer
+        idf = {
+            w: math.log((1 + n) / (1 + count)) + 1
+            for w, count in df.items()
+        }
+        self.__table = (idf, math.log(1 + n) + 1)
+        self.__fitted_at = time.monotonic()
+
+    def __ensure_fitted(self):
+        """fit on first use; refit in the background, scoring with the
+        current table meanwhile, whenever it is too old"""
+        if self.__fitted_at is None:
+            with self.__lock:
+                # fitted by a concurrent score while waiting
+                if self.__fitted_at is None:
+                    self.__fit(None)
+            return
+        if (
+            self.__loader is None
+            or self.__refitting
+            or time.monotonic() - self.__fitted_at <= self.REFIT_INTERVAL
+        ):
+            return
+        self.__refitting = True
+        threading.Thread(
+                target=self.__refit, name="match-scorer-fit", daemon=True
+                ).start()
+
+    def __refit(self):
+        """background thread: refit the IDF table"""
+        try:
+            self.fit()
+        except Exception as e:
+            print("Match scorer refit failed:", e)
+        finally:
+            self.__refitting = False
+            # the loader ran on this thread's own session
+            storage.close()
+
+    def vector(self, text):
+        """unit-length TF-IDF vector of text, as a dict"""
+        counts = Counter(words(text))
+        idf, default = self.__table
+        vec = {w: c * idf.get(w, default) for w, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values()))
+        return {w: v / norm for w, v in vec.items()} if norm else {}
+
+    @staticmethod
+    def cosine(a, b):
+        """cosine of two unit vectors"""
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(v * b.get(w, 0.0) for w, v in a.items())
+
+    def job_features(self, job):
+        """the parts of a job the score needs, computed once per job"""
+        self.__ensure_fitted()
+        text = " ".join(
+            [job.job_description or ""] + list(job.responsibilities or [])
+        )
+        return {
+            "skills": {normalize_skill(s.name) for s in job.skills},
+            "major_id": job.major_id,
+            "years": parse_years(job.exper_years),
+            "vector": self.vector(text),
+        }
+
+    def candidate_features(self, candidate, now=None):
+        """the parts of a candidate the score needs"""
+        self.__ensure_fitted()
+        experiences = list(candidate.experiences)
+        text = " ".join(
+            f"{xp.title or ''} {xp.description or ''}" for xp in experiences
+        )
+        return {
+            "skills": {normalize_skill(s.name) for s in candidate.skills},
+            "major_id": candidate.major_id,
+            "years": experience_years(experiences, now),
+            "vector": self.vector(text),
+        }
+
+    def components(self, candidate_features, job_features):
+        """each component of the score, None when not computable"""
+        job_skills = job_features["skills"]
+        return {
+            "skills": (
+                len(job_skills & candidate_features["skills"])
+                / len(job_skills) if job_skills else None
+            ),
+            "major": (
+                float(candidate_features["major_id"]
+                      == job_features["major_id"])
+                if job_features["major_id"] else None
+            ),
+            "experience": experience_fit(
+                candidate_features["years"], job_features["years"]
+            ),
+            "text": (
+                self.cosine(candidate_features["vector"],
+                            job_features["vector"])
+                if candidate_features["vector"] and job_features["vector"]
+                else None
+            ),
+        }
+
+    def combine(self, components):
+        """weighted mean of the computable components, in [0, 1]"""
+        total = weight = 0.0
+        for name, value in components.items():
+            if value is not None:
+                total += self.WEIGHTS[name] * value
+                weight += self.WEIGHTS[name]
+        return round(total / weight, 4) if weight else 0.0
+
+    def score(self, candidate, job):
+        """
+        Returns the match score of a candidate for a job.
+
+        Args:
+            candidate (Candidate): with skills and experiences.
+            job (Job): with skills.
+
+        Returns:
+            float: The match score, between 0.0 and 1.0.
+        """
+        return self.combine(self.components(
+            self.candidate_features(candidate), self.job_features(job)
+        ))
+
+    def score_many(self, job, candidates):
+        """Scores of many candidates for one job, in order; the job's
+        features are computed once."""
+        features = self.job_features(job)
+        now = datetime.utcnow()
+        return [
+            self.combine(self.components(
+                self.candidate_features(candidate, now), features
+            ))
+            for candidate in candidates
+        ]
+
+
+def load_job_texts():
+    """the descriptions of every job, streamed from one query of that
+    column only"""
+    return storage.iter_column(Job.job_description)
+
+
+match_scorer = LocalMatchScorer(loader=load_job_texts)
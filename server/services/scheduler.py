@@ -0,0 +1,126 @@
+"""
+Periodic background jobs of a process.
+
+One thread runs every registered job at its interval, the earliest due
+first; a job is run again `interval` seconds after its last run ended,
+so a slow run never overlaps the next one.
+
+    @scheduler.every("sweep", 60)
+    def sweep():
+        ...
+
+    scheduler.start()
+
+Every web worker runs its own scheduler: a job must be safe to run in
+several processes at once, by claiming the rows it works on.
+"""
+import atexit
+import threading
+import time
+
+
+class Scheduler:
+    """Thread running registered jobs at fixed intervals"""
+
+    def __init__(self):
+        """Initialize a scheduler with no jobs; the thread only starts
+        with start()"""
+        self.__lock = threading.Lock()
+        self.__jobs = {}
+        self.__thread = None
+        self.__stopping = threading.Event()
+
+    def every(self, name, interval, fn=None):
+        """
+        Register fn to run every interval seconds, first interval
+        seconds after start; usable as a decorator. An interval of 0 or
+        less disables the job.
+        """
+        def register(fn):
+            if interval > 0:
+                with self.__lock:
+                    self.__jobs[name] = {
+                        "fn": fn, "interval": interval, "due": None,
+                        "runs": 0, "failures": 0, "last_error": None,
+                        "last_result": None, "last_seconds": None,
+                    }
+            return fn
+        return register(fn) if fn is not None else register
+
+    def start(self):
+        """Start the thread, once"""
+        with self.__lock:
+            if self.__thread is not None or not self.__jobs:
+                return
+            now = time.monotonic()
+            for job in self.__jobs.values():
+                job["due"] = now + job["interval"]
+            self.__stopping.clear()
+            self.__thread = threading.Thread(
+                    target=self.loop, name="scheduler", daemon=True
+                    )
+            self.__thread.start()
+        atexit.register(self.shutdown)
+
+    def loop(self):
+        """Scheduler thread: sleep until the next job is due, run it"""
+        while not self.__stopping.is_set():
+            with self.__lock:
+                name, job = min(
+                        self.__jobs.items(), key=lambda item: item[1]["due"]
+                        )
+            delay = job["due"] - time.monotonic()
+            if delay > 0:
+                # woken early by shutdown
+                self.__stopping.wait(delay)
+                continue
+            self.run(name)
+
+    def run(self, name):
+        """Run one job now, recording its outcome; returns its result"""
+        job = self.__jobs[name]
+        start = time.monotonic()
+        result = None
+        try:
+            result = job["fn"]()
+        except Exception as e:
+            print(f"Scheduled job {name} failed:", e)
+            with self.__lock:
+                job["failures"] += 1
+                job["last_error"] = str(e) or type(e).__name__
+        else:
+            with self.__lock:
+                job["last_result"] = result
+        end = time.monotonic()
+        with self.__lock:
+            job["runs"] += 1
+            job["last_seconds"] = round(end - start, 3)
+            job["due"] = end + job["interval"]
+        return result
+
+    def shutdown(self, timeout=5):
+        """Stop the thread, waiting timeout seconds at most for a job
+        being run"""
+        self.__stopping.set()
+        thread = self.__thread
+        if thread is not None:
+            thread.join(timeout)
+        with self.__lock:
+            self.__thread = None
+
+    def stats(self):
+        """interval, runs, failures, last error, result and duration of
+        every job"""
+        with self.__lock:
+            return {
+                name: {
+                    key: job[key] for key in (
+                        "interval", "runs", "failures", "last_error",
+                        "last_result", "last_seconds",
+                    )
+                }
+                for name, job in self.__jobs.items()
+            }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,251 @@
+"""
+In-process search index over the open jobs, used by /jobs/search.
+
+Title and location are indexed by word token and by character trigram,
+so a search only runs fuzzy scoring on the jobs that share enough of the
+query's trigrams instead of on the whole table.
+"""
+import threading
+import time
+
+from fuzzywuzzy import fuzz
+
+from server.models import storage
+from server.models.job import Job
+
+
+def tokenize(text):
+    """lower-cased word tokens of text"""
+    return (text or "").lower().split()
+
+
+def keys(text):
+    """posting keys of text: its trigrams, and its tokens as
+    ("token", word) so they never collide with a trigram"""
+    return trigrams(text) | {("token", token) for token in tokenize(text)}
+
+
+def trigrams(text):
+    """character trigrams of every token, padded with spaces so that
+    short words and word boundaries are indexed too"""
+    grams = set()
+    for token in tokenize(text):
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def document(job):
+    """the indexed fields of a job"""
+    return {
+        "job_title": (job.job_title or "").lower(),
+        "location": (job.location or "").lower(),
+        "created_at": job.created_at,
+    }
+
+
+def index_doc(docs, postings, job_id, doc):
+    """add one job's document to docs and postings"""
+    docs[job_id] = doc
+    for field, field_postings in postings.items():
+        for key in keys(doc[field]):
+            field_postings.setdefault(key, set()).add(job_id)
+
+
+def unindex_doc(docs, postings, job_id):
+    """drop one job from docs and postings"""
+    doc = docs.pop(job_id, None)
+    if doc is None:
+        return
+    for field, field_postings in postings.items():
+        for key in keys(doc[field]):
+            ids = field_postings.get(key)
+            if ids is not None:
+                ids.discard(job_id)
+                if not ids:
+                    del field_postings[key]
+
+
+class JobSearchIndex:
+    """Token/trigram index of the open jobs
+
+    A (re)build indexes the jobs into new dicts without holding the
+    lock and swaps them in once done, replaying the changes made in the
+    meantime, so searches keep being served from the old index. Only
+    the very first search waits for a build; once REBUILD_INTERVAL has
+    passed, a search starts a rebuild in a background thread.
+
+    Attrs:
+        MATCH_THRESHOLD: minimum fuzzy score of a match, for each field
+        MIN_OVERLAP: share of the query trigrams a job must contain to be
+            scored at all
+        REBUILD_INTERVAL: seconds after which the index is rebuilt from
+            the database, to pick up writes made by other workers
+    """
+
+    MATCH_THRESHOLD = 70
+    MIN_OVERLAP = 0.25
+    REBUILD_INTERVAL = 300
+
+    def __init__(self, loader=None):
+        """Initialize an empty index
+
+        Args:
+            loader: callable returning every open job, used to (re)build
+        """
+        self.__loader = loader
+        # guards the index itself, held only for short reads and writes
+        self.__lock = threading.RLock()
+        # one build at a time
+        self.__build_lock = threading.Lock()
+        self.__rebuilding = False
+        self.__built_at = None
+        # job id -> document (None once removed) of the changes made
+        # while a build runs, replayed onto the new index
+        self.__pending = None
+        self.__jobs = {}
+        self.__postings = {"job_title": {}, "location": {}}
+
+    def build(self, jobs=None):
+        """(Re)build the index from jobs, or from the loader"""
+        with self.__build_lock:
+            self.__build(jobs)
+
+    def __build(self, jobs):
+        """index jobs into new dicts and swap them in, the build lock
+        must be held"""
+        with self.__lock:
+            self.__pending = {}
+        try:
+            if jobs is None:
+                jobs = self.__loader() if self.__loader else []
+            docs, postings = {}, {"job_title": {}, "location": {}}
+            for job in jobs:
+                index_doc(docs, postings, job.id, document(job))
+        except BaseException:
+            with self.__lock:
+                self.__pending = None
+            raise
+        with self.__lock:
+            for job_id, doc in self.__pending.items():
+                unindex_doc(docs, postings, job_id)
+                if doc is not None:
+                    index_doc(docs, postings, job_id, doc)
+            self.__jobs, self.__postings = docs, postings
+            self.__pending = None
+            self.__built_at = time.monotonic()
+
+    def __ensure_built(self):
+        """build on first use; rebuild in the background, serving the
+        current index meanwhile, whenever it is too old"""
+        if self.__built_at is None:
+            with self.__build_lock:
+                # built by a concurrent search while waiting
+                if self.__built_at is None:
+                    self.__build(None)
+            return
+        if time.monotonic() - self.__built_at <= self.REBUILD_INTERVAL:
+            return
+        with self.__lock:
+            if self.__rebuilding:
+                return
+            self.__rebuilding = True
+        threading.Thread(
+                target=self.__rebuild, name="job-index", daemon=True
+                ).start()
+
+    def __rebuild(self):
+        """background thread: rebuild the index"""
+        try:
+            self.build()
+        except Exception as e:
+            print("Job index rebuild failed:", e)
+        finally:
+            self.__rebuilding = False
+            # the loader ran on this thread's own session
+            storage.close()
+
+    def __change(self, job_id, doc):
+        """index doc as the job's document, or drop the job if None"""
+        with self.__lock:
+            if self.__pending is not None:
+                self.__pending[job_id] = doc
+            if self.__built_at is None:
+                return  # the first search builds the index from scratch
+            unindex_doc(self.__jobs, self.__postings, job_id)
+            if doc is not None:
+                index_doc(self.__jobs, self.__postings, job_id, doc)
+
+    def add(self, job):
+        """Index a new job if it is open"""
+        self.update(job)
+
+    def update(self, job):
+        """Re-index a job after a change; closed jobs are dropped"""
+        self.__change(job.id, document(job) if job.is_open else None)
+
+    def remove(self, job_id):
+        """Drop a deleted job from the index"""
+        self.__change(job_id, None)
+
+    def __candidates(self, field, query):
+        """ids of the jobs sharing a whole token, or enough trigrams,
+        with query"""
+        postings = self.__postings[field]
+        found = set()
+        for token in tokenize(query):
+            found |= postings.get(("token", token), set())
+
+        grams = trigrams(query)
+        hits = {}
+        for key in grams:
+            for job_id in postings.get(key, ()):
+                hits[job_id] = hits.get(job_id, 0) + 1
+        needed = max(1, int(len(grams) * self.MIN_OVERLAP))
+        found.update(job_id for job_id, n in hits.items() if n >= needed)
+        return found
+
+    def search(self, location=None, title=None, newest_first=False):
+        """
+        Returns the ids of the open jobs whose title and location
+        fuzzily match the query, as the linear scan did, the best match
+        first (or the newest first); expired jobs are closed, and
+        dropped, by the sweeper.
+        """
+        self.__ensure_built()
+        with self.__lock:
+            ids = None
+            for field, query in (("job_title", title), ("location", location)):
+                if query:
+                    found = self.__candidates(field, query)
+                    ids = found if ids is None else ids & found
+            if ids is None:
+                ids = set(self.__jobs)
+                newest_first = True
+            docs = {job_id: self.__jobs[job_id] for job_id in ids}
+
+        matched = []
+        for job_id, doc in docs.items():
+            score = 0
+            for field, query in (("job_title", title), ("location", location)):
+                if query:
+                    ratio = fuzz.token_set_ratio(query.lower(), doc[field])
+                    if ratio <= self.MATCH_THRESHOLD:
+                        break
+                    score += ratio
+            else:
+                matched.append((job_id, score, doc["created_at"]))
+
+        if newest_first:
+            matched.sort(key=lambda m: (m[2], m[0]), reverse=True)
+        else:
+            matched.sort(key=lambda m: (-m[1], m[0]))
+        return [job_id for job_id, _, _ in matched]
+
+
+def load_open_jobs():
+    """every open job, read from the database one page at a time"""
+    return storage.iter_all(Job, Job.is_open == True)  # noqa: E712
+
+
+job_index = JobSearchIndex(loader=load_open_jobs)
@@ -0,0 +1,353 @@
+"""
+Background task queue with a SQLite-backed status store.
+
+Slow work (an AI parse of an upload, for example) is submitted as a task
+and run by a small pool of worker threads; callers get a task id back at
+once and poll its status. Task state lives in a SQLite file, so every web
+worker of the host can answer a status request.
+
+A worker claims a task with an atomic UPDATE, so each task runs once
+even when several processes share the file, and holds it for a lease
+it renews while the task runs. On start a queue picks up the queued
+tasks, and the running ones whose lease expired: their process died.
+Finished tasks are purged after ApplicationConfig.TASK_RETENTION.
+
+    @task_queue.handler("kind")
+    def run(payload, progress):
+        progress("halfway")
+        return {"some": "result"}
+
+    task_queue.start()
+    task_id = task_queue.submit("kind", {"some": "input"})
+    task_queue.status(task_id)
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from server.config import ApplicationConfig
+from server.services.scheduler import scheduler
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class TaskStore:
+    """Task rows in a SQLite database"""
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            owner_id TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            lease_until REAL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS tasks_status"
+        " ON tasks (status, updated_at)",
+    )
+
+    def __init__(self, path):
+        """Open (and create) the store at path, ":memory:" for tests"""
+        self.path = path
+        self.__lock = threading.Lock()
+        # one connection shared by the threads of this process; sqlite
+        # serializes writers across processes
+        self.__conn = sqlite3.connect(
+                path, check_same_thread=False, timeout=30,
+                isolation_level=None,
+                )
+        self.__conn.row_factory = sqlite3.Row
+        with self.__lock:
+            self.__conn.execute(self.SCHEMA[0])
+            columns = {
+                row["name"] for row in
+                self.__conn.execute("PRAGMA table_info(tasks)")
+            }
+            # files created before leases
+            if "lease_until" not in columns:
+                self.__conn.execute(
+                        "ALTER TABLE tasks ADD COLUMN lease_until REAL"
+                        )
+            for statement in self.SCHEMA[1:]:
+                self.__conn.execute(statement)
+
+    def create(self, kind, payload, owner_id=None, coalesce=False):
+        """
+        Insert a queued task; with coalesce, only if no task of the same
+        kind and payload is queued yet, in one transaction.
+
+        Returns:
+            str: The id of the task inserted, or of the one queued.
+        """
+        task_id = str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
+        payload = json.dumps(payload, sort_keys=True)
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = coalesce and self.__conn.execute(
+                    "SELECT id FROM tasks WHERE status = ? AND kind = ?"
+                    " AND payload = ? LIMIT 1",
+                    (QUEUED, kind, payload),
+                ).fetchone()
+                if not row:
+                    self.__conn.execute(
+                        "INSERT INTO tasks (id, kind, owner_id, payload,"
+                        " status, created_at, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (task_id, kind, owner_id, payload, QUEUED, now, now),
+                    )
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            self.__conn.execute("COMMIT")
+        return row["id"] if row else task_id
+
+    def update(self, task_id, **fields):
+        """set some columns of a task; result is stored as JSON"""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.__lock:
+            self.__conn.execute(
+                f"UPDATE tasks SET {columns} WHERE id = ?",
+                (*fields.values(), task_id),
+            )
+
+    def get(self, task_id):
+        """the task as a dict, None if unknown"""
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT * FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        task = dict(row)
+        task["payload"] = json.loads(task["payload"])
+        if task["result"] is not None:
+            task["result"] = json.loads(task["result"])
+        return task
+
+    def claim(self, task_id, lease):
+        """
+        Mark a queued task running for lease seconds, in one UPDATE so
+        that a single worker of all the processes gets it.
+
+        Returns:
+            bool: Whether this call claimed the task.
+        """
+        with self.__lock:
+            cursor = self.__conn.execute(
+                "UPDATE tasks SET status = ?, lease_until = ?,"
+                " progress = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time() + lease, "started",
+                 datetime.utcnow().isoformat(), task_id, QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def renew(self, task_id, lease):
+        """extend the lease of a running task to lease seconds from now"""
+        with self.__lock:
+            self.__conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND status = ?",
+                (time.time() + lease, task_id, RUNNING),
+            )
+
+    def recover(self):
+        """
+        Queue the running tasks whose lease expired again, their worker
+        is gone; those of live workers are left alone.
+
+        Returns:
+            list: The ids of the queued tasks, oldest first.
+        """
+        with self.__lock:
+            self.__conn.execute(
+                "UPDATE tasks SET status = ?, lease_until = NULL"
+                " WHERE status = ?"
+                " AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, time.time()),
+            )
+            rows = self.__conn.execute(
+                "SELECT id FROM tasks WHERE status = ? ORDER BY created_at",
+                (QUEUED,),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def purge(self, before):
+        """
+        Delete the tasks done or failed before the datetime before.
+
+        Returns:
+            int: The number of tasks deleted.
+        """
+        with self.__lock:
+            cursor = self.__conn.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?)"
+                " AND updated_at < ?",
+                (DONE, FAILED, before.isoformat()),
+            )
+        return cursor.rowcount
+
+
+class TaskQueue:
+    """Worker pool running the tasks recorded in a TaskStore
+
+    Attrs:
+        workers: number of worker threads, started by start()
+        lease: seconds a claim holds a task without being renewed; it is
+            renewed every third of it while the task runs
+    """
+
+    def __init__(self, store, workers=2, lease=60):
+        """Initialize the queue over a store"""
+        self.store = store
+        self.workers = workers
+        self.lease = lease
+        self.__handlers = {}
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__started = False
+
+    def handler(self, kind):
+        """decorator registering the function that runs tasks of kind;
+        it is called with (payload, progress) and returns the result"""
+        def register(fn):
+            self.__handlers[kind] = fn
+            return fn
+        return register
+
+    def start(self):
+        """Start the workers, once, and queue the tasks waiting in the
+        store or left running by a process that died"""
+        with self.__lock:
+            if self.__started:
+                return
+            self.__started = True
+            for task_id in self.store.recover():
+                self.__queue.put(task_id)
+            for _ in range(self.workers):
+                threading.Thread(target=self.worker, daemon=True).start()
+
+    def submit(self, kind, payload, owner_id=None, coalesce=False):
+        """
+        Queue a task, returns its id; it runs once the queue is
+        started.
+
+        With coalesce, a task of the same kind and payload still queued,
+        by any process, stands for this one and its id is returned: for
+        tasks reading their input when they run, such as a re-score of a
+        job, one run after the last submit is enough.
+
+        Raises:
+            ValueError: If no handler runs tasks of this kind.
+        """
+        if kind not in self.__handlers:
+            raise ValueError(f"No handler for '{kind}' tasks")
+        task_id = self.store.create(
+                kind, payload, owner_id, coalesce=coalesce
+                )
+        # a coalesced task put twice is claimed, and run, once
+        self.__queue.put(task_id)
+        return task_id
+
+    def status(self, task_id):
+        """the public state of a task, None if unknown"""
+        task = self.store.get(task_id)
+        if task is None:
+            return None
+        return {
+            key: task[key] for key in (
+                "id", "kind", "owner_id", "status", "progress", "result",
+                "error", "created_at", "updated_at",
+            )
+        }
+
+    def worker(self):
+        """Worker thread running queued tasks one at a time"""
+        while True:
+            task_id = self.__queue.get()
+            try:
+                self.run(task_id)
+            finally:
+                self.__queue.task_done()
+
+    def run(self, task_id):
+        """Run one task, unless another worker claimed it, and record its
+        outcome"""
+        if not self.store.claim(task_id, self.lease):
+            return
+        task = self.store.get(task_id)
+        handler = self.__handlers.get(task["kind"])
+        if handler is None:
+            self.store.update(
+                    task_id, status=FAILED, lease_until=None,
+                    error=f"No handler for '{task['kind']}' tasks"
+                    )
+            return
+
+        def progress(stage):
+            self.store.update(task_id, progress=stage)
+
+        finished = threading.Event()
+        heartbeat = threading.Thread(
+                target=self.__renew, args=(task_id, finished), daemon=True
+                )
+        heartbeat.start()
+        try:
+            result = handler(task["payload"], progress)
+        except Exception as e:
+            print(f"Task {task_id} failed:", e)
+            outcome = {"status": FAILED, "error": str(e) or type(e).__name__}
+        else:
+            outcome = {
+                "status": DONE, "progress": "finished", "result": result
+            }
+        finally:
+            finished.set()
+            heartbeat.join()
+        self.store.update(task_id, lease_until=None, **outcome)
+
+    def __renew(self, task_id, finished):
+        """heartbeat of a running task: renew its lease until finished"""
+        while not finished.wait(self.lease / 3):
+            try:
+                self.store.renew(task_id, self.lease)
+            except sqlite3.Error as e:
+                print(f"Task {task_id} lease not renewed:", e)
+
+    def purge(self, age):
+        """Delete the tasks finished more than age seconds ago, returns
+        their number"""
+        return self.store.purge(datetime.utcnow() - timedelta(seconds=age))
+
+    def join(self):
+        """Block until every queued task has run"""
+        self.__queue.join()
+
+
+task_queue = TaskQueue(
+        TaskStore(ApplicationConfig.TASK_DB),
+        workers=ApplicationConfig.TASK_WORKERS,
+        lease=ApplicationConfig.TASK_LEASE,
+        )
+
+
+@scheduler.every("purge_tasks", ApplicationConfig.TASK_PURGE_INTERVAL)
+def purge_tasks():
+    """Delete the tasks finished more than TASK_RETENTION seconds ago"""
+    return task_queue.purge(ApplicationConfig.TASK_RETENTION)
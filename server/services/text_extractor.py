@@ -2,18 +2,62 @@
 Module to handle Text Extracting logic
 """
 
+from io import StringIO
+
 import textract
 from docx import Document
-from pdfminer.high_level import extract_text as extract_pdf_text
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
 from pdfminer.pdfparser import PDFSyntaxError
 
 from server.exception import UnreadableCVError
 
+# pages without any text after which a PDF is taken to have no text layer
+PROBE_PAGES = 2
+
 
-def parse_pdf(file_path: str) -> str:
-    """Extract text from a PDF file."""
+def iter_pdf_pages(file_path: str, max_pages: int = 0):
+    """Yield the text of each page of a PDF, parsing a page only when
+    the next one is asked for; stops after max_pages pages if set."""
+    resources = PDFResourceManager()
+    out = StringIO()
+    device = TextConverter(resources, out, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resources, device)
     try:
-        txt = extract_pdf_text(file_path).strip()
+        with open(file_path, "rb") as fp:
+            for page in PDFPage.get_pages(fp, maxpages=max_pages or 0):
+                interpreter.process_page(page)
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+    finally:
+        device.close()
+
+
+def parse_pdf(file_path: str, max_pages: int = 0, max_chars: int = 0) -> str:
+    """Extract text from a PDF file, page by page, stopping after
+    max_pages pages or max_chars characters when set.
+
+    A PDF whose first PROBE_PAGES pages have no text has no text layer
+    (a scan): it is reported unreadable without parsing the rest.
+    """
+    try:
+        pages = []
+        size = 0
+        for number, page in enumerate(iter_pdf_pages(file_path, max_pages), 1):
+            page = page.strip()
+            if page:
+                pages.append(page)
+                size += len(page)
+            elif not pages and number >= PROBE_PAGES:
+                raise UnreadableCVError()
+            if max_chars and size >= max_chars:
+                break
+        txt = "\n".join(pages)
+        if max_chars:
+            txt = txt[:max_chars]
         if not txt:
             raise UnreadableCVError()
         return txt
@@ -25,12 +69,21 @@ def parse_pdf(file_path: str) -> str:
         raise
 
 
-def parse_docx(file_path: str) -> str:
-    """Extract text from a DOCX file."""
+def parse_docx(file_path: str, max_chars: int = 0) -> str:
+    """Extract text from a DOCX file, up to max_chars characters when
+    set."""
     try:
         doc = Document(file_path)
-        txt = "\n".join(
-            [paragraph.text for paragraph in doc.paragraphs]).strip()
+        paragraphs = []
+        size = 0
+        for paragraph in doc.paragraphs:
+            paragraphs.append(paragraph.text)
+            size += len(paragraph.text) + 1
+            if max_chars and size >= max_chars:
+                break
+        txt = "\n".join(paragraphs).strip()
+        if max_chars:
+            txt = txt[:max_chars]
         if not txt:
             raise UnreadableCVError()
         return txt
@@ -42,10 +95,13 @@ def parse_docx(file_path: str) -> str:
         raise
 
 
-def parse_doc(file_path: str) -> str:
-    """Extract text from a DOC file."""
+def parse_doc(file_path: str, max_chars: int = 0) -> str:
+    """Extract text from a DOC file, up to max_chars characters when
+    set."""
     try:
         txt = textract.process(file_path).decode("utf-8").strip()
+        if max_chars:
+            txt = txt[:max_chars]
         if not txt:
             raise UnreadableCVError()
         return txt
@@ -57,13 +113,26 @@ def parse_doc(file_path: str) -> str:
         raise
 
 
-def extract_text(file_path: str) -> str:
-    """Extract text from a file based on its extension."""
+def extract_text(
+    file_path: str, max_pages: int = 0, max_chars: int = 0
+) -> str:
+    """Extract text from a file based on its extension.
+
+    max_pages limits how many pages of a PDF are read, max_chars how
+    much text is kept; parsing stops as soon as either is reached.
+    """
     if file_path.endswith(".pdf"):
-        return parse_pdf(file_path)
+        return parse_pdf(file_path, max_pages, max_chars)
     elif file_path.endswith(".docx"):
-        return parse_docx(file_path)
+        return parse_docx(file_path, max_chars)
     elif file_path.endswith(".doc"):
-        return parse_doc(file_path)
+        return parse_doc(file_path, max_chars)
     else:
         raise ValueError("Unsupported file format")
+
+
+def compact_text(text: str) -> str:
+    """Collapse runs of whitespace and drop blank lines, to send fewer
+    tokens to the model."""
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
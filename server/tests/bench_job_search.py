@@ -0,0 +1,108 @@
+'''Benchmark /jobs/search: trigram index vs the old linear fuzzy scan
+
+Usage:
+    python -m server.tests.bench_job_search [size ...]
+
+Builds a synthetic corpus of open jobs, runs the same queries through the
+linear `fuzz.token_set_ratio` scan that search_jobs used to do and through
+JobSearchIndex, checks that both return the same jobs and prints the
+average latency of each.
+'''
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from server.tests.environment import configure
+
+SCRATCH = configure('joblinker_bench_search')
+
+from fuzzywuzzy import fuzz  # noqa: E402
+
+from server.services.search_index import JobSearchIndex  # noqa: E402
+
+SIZES = [1_000, 10_000, 50_000]
+SENIORITY = ['', 'junior', 'senior', 'lead', 'principal', 'staff']
+ROLES = ['software engineer', 'frontend developer', 'backend developer',
+         'data scientist', 'product manager', 'devops engineer',
+         'machine learning engineer', 'qa tester', 'ui designer',
+         'mobile developer', 'data analyst', 'security engineer']
+STACKS = ['', 'python', 'java', 'react', 'node.js', 'go', 'flutter', 'aws']
+CITIES = ['cairo, egypt', 'alexandria, egypt', 'dubai, uae', 'riyadh, ksa',
+          'london, uk', 'berlin, germany', 'remote', 'new york, ny',
+          'san francisco, ca', 'amman, jordan']
+QUERIES = [('software engineer', None), ('frontend', 'cairo'),
+           ('senior python developer', None), (None, 'dubai'),
+           ('data scientst', 'london'), ('devops', 'remote'),
+           ('machine learning', None), ('product manager', 'berlin')]
+
+
+def make_jobs(n):
+    '''n random open jobs, a tenth of them already expired'''
+    now = datetime.utcnow()
+    jobs = []
+    for _ in range(n):
+        title = ' '.join(w for w in (random.choice(SENIORITY),
+                                     random.choice(STACKS),
+                                     random.choice(ROLES)) if w)
+        expired = random.random() < 0.1
+        jobs.append(SimpleNamespace(
+            id=str(uuid.uuid4()), job_title=title,
+            location=random.choice(CITIES), is_open=True, created_at=now,
+            application_deadline=now - timedelta(days=1) if expired
+            else now + timedelta(days=30)))
+    return jobs
+
+
+def linear_search(jobs, location, title):
+    '''the previous search_jobs body, minus the serialization'''
+    matched = []
+    for v in jobs:
+        if not v.is_open:
+            continue
+        if v.application_deadline and datetime.utcnow() > \
+                v.application_deadline:
+            continue
+        location_score = (
+            fuzz.token_set_ratio(location.lower(), v.location.lower())
+            if location else 100
+        )
+        title_score = (
+            fuzz.token_set_ratio(title.lower(), v.job_title.lower())
+            if title else 100
+        )
+        if location_score > 70 and title_score > 70:
+            matched.append(v.id)
+    return matched
+
+
+def timed(fn, *args):
+    '''(result, seconds)'''
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    sizes = [int(s) for s in sys.argv[1:]] or SIZES
+    print(f'{"jobs":>8} {"linear ms":>10} {"index ms":>10} {"speedup":>8} '
+          f'{"same results":>13}')
+    for size in sizes:
+        jobs = make_jobs(size)
+        index = JobSearchIndex()
+        index.build(jobs)
+        linear_total = index_total = 0
+        same = True
+        for title, location in QUERIES:
+            expected, t_linear = timed(linear_search, jobs, location, title)
+            got, t_index = timed(index.search, location, title)
+            linear_total += t_linear
+            index_total += t_index
+            same = same and set(expected) == set(got)
+        n = len(QUERIES)
+        print(f'{size:>8} {linear_total / n * 1e3:>10.1f} '
+              f'{index_total / n * 1e3:>10.1f} '
+              f'{linear_total / index_total:>7.1f}x {str(same):>13}')
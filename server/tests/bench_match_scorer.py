@@ -0,0 +1,69 @@
+'''Benchmark the local match scorer
+
+Usage:
+    python -m server.tests.bench_match_scorer [pairs]
+
+Scores synthetic candidates with realistic CV-sized experience text
+against one job, pair by pair and through score_many, and prints the
+average time per pair.
+'''
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace as NS
+
+from server.tests.environment import configure
+
+SCRATCH = configure('joblinker_bench_scorer')
+
+from server.services.match_scorer import LocalMatchScorer  # noqa: E402
+
+VOCABULARY = ('python sql aws react docker kubernetes pipelines etl api '
+              'design testing agile scrum data analysis dashboards cloud '
+              'microservices performance security mentoring roadmap '
+              'stakeholders migration monitoring latency caching').split()
+SKILLS = ['Python', 'SQL', 'AWS specialist', 'React', 'Docker', 'Java',
+          'data analyst', 'Kubernetes', 'Go', 'Terraform']
+
+
+def sentence(n):
+    '''n random words'''
+    return ' '.join(random.choice(VOCABULARY) for _ in range(n))
+
+
+def make_candidate(now):
+    '''a candidate with 3 experiences of ~80 words each'''
+    experiences = []
+    for i in range(3):
+        start = now - timedelta(days=365 * (3 * i + 3))
+        experiences.append(NS(title='Engineer', description=sentence(80),
+                              start_date=start,
+                              end_date=start + timedelta(days=900)))
+    return NS(skills=[NS(name=s) for s in random.sample(SKILLS, 5)],
+              major_id=random.choice(['cs', 'is']), experiences=experiences)
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    now = datetime.utcnow()
+    job = NS(job_description=sentence(250), responsibilities=[sentence(10)],
+             skills=[NS(name=s) for s in SKILLS[:4]], major_id='cs',
+             exper_years='3-5 years')
+    candidates = [make_candidate(now) for _ in range(pairs)]
+
+    scorer = LocalMatchScorer()
+    scorer.fit(sentence(200) for _ in range(1_000))
+
+    start = time.perf_counter()
+    for c in candidates:
+        scorer.score(c, job)
+    one_by_one = (time.perf_counter() - start) / pairs
+
+    start = time.perf_counter()
+    scorer.score_many(job, candidates)
+    batched = (time.perf_counter() - start) / pairs
+
+    print(f'{pairs} pairs: score {one_by_one * 1e6:.0f} µs/pair, '
+          f'score_many {batched * 1e6:.0f} µs/pair')
@@ -0,0 +1,74 @@
+'''Benchmark DBStorage.get primary-key lookups as the tables grow
+
+Usage:
+    python -m server.tests.bench_storage_get [size ...]
+
+Seeds a throw-away SQLite database with `users` and `jobs` rows, then
+times random `storage.get(User, id)` / `storage.get(Job, id)` calls at
+every size. The latency should stay flat from 1k to 1M rows.
+'''
+import random
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from server.tests.environment import configure
+
+SCRATCH = configure('joblinker_bench_get')
+
+from sqlalchemy import insert  # noqa: E402
+
+from server.models import storage  # noqa: E402
+from server.models.job import Job  # noqa: E402
+from server.models.user import User  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+LOOKUPS = 2_000
+CHUNK = 10_000
+
+
+def seed(size, user_ids, job_ids):
+    '''grow the users and jobs tables up to `size` rows'''
+    session = storage._DBStorage__session
+    now = datetime.utcnow()
+    while len(user_ids) < size:
+        n = min(CHUNK, size - len(user_ids))
+        users = [{'id': str(uuid.uuid4()), 'name': 'bench',
+                  'email': f'{uuid.uuid4()}@bench.io', 'password': 'x',
+                  'role': 'recruiter', 'created_at': now, 'updated_at': now}
+                 for _ in range(n)]
+        jobs = [{'id': str(uuid.uuid4()), 'recruiter_id': 'r',
+                 'major_id': 'm', 'job_title': 'bench',
+                 'job_description': 'bench', 'created_at': now,
+                 'updated_at': now}
+                for _ in range(n)]
+        session.execute(insert(User), users)
+        session.execute(insert(Job), jobs)
+        session.commit()
+        user_ids.extend(u['id'] for u in users)
+        job_ids.extend(j['id'] for j in jobs)
+
+
+def time_gets(cls, ids):
+    '''average latency of cold primary-key lookups, in microseconds'''
+    sample = random.sample(ids, min(LOOKUPS, len(ids)))
+    storage.close()  # start from an empty identity map
+    start = time.perf_counter()
+    for id_ in sample:
+        assert storage.get(cls, id_) is not None
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return elapsed / len(sample) * 1e6
+
+
+if __name__ == '__main__':
+    sizes = [int(s) for s in sys.argv[1:]] or SIZES
+    user_ids, job_ids = [], []
+    print(f'{"rows":>10} {"get(User) us":>14} {"get(Job) us":>14}')
+    for size in sorted(sizes):
+        seed(size, user_ids, job_ids)
+        print(f'{size:>10} {time_gets(User, user_ids):>14.1f} '
+              f'{time_gets(Job, job_ids):>14.1f}')
+    shutil.rmtree(SCRATCH)
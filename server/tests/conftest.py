@@ -0,0 +1,27 @@
+'''Fixtures shared by the server tests
+
+The environment is set up here, before pytest imports any test module,
+so that every module of a session shares one scratch database.
+'''
+import sys
+
+import pytest
+
+from server.tests.environment import configure
+
+SCRATCH = configure()
+
+
+@pytest.fixture(scope='session')
+def scratch_dir():
+    '''the directory holding the database and the local stores'''
+    return SCRATCH
+
+
+@pytest.fixture(autouse=True)
+def close_session():
+    '''release the database session after each test, once a module has
+    opened the storage'''
+    yield
+    if 'server.models' in sys.modules:
+        sys.modules['server.models'].storage.close()
@@ -0,0 +1,38 @@
+'''Environment of the tests and benchmarks
+
+The server reads its settings when it is imported, and DBStorage opens
+ENGINE then, so configure() must run before anything under server is:
+conftest.py calls it for the tests, each benchmark at its very top.
+
+Usage:
+    from server.tests.environment import configure
+    SCRATCH = configure('joblinker_bench_x')
+'''
+import os
+import shutil
+import tempfile
+
+# settings without which the server cannot be imported; a value already
+# in the environment wins
+DEFAULTS = (('SECRET_KEY', 'test'), ('REDIS_HOST', 'localhost'),
+            ('REDIS_PORT', '6379'), ('REDIS_DB_JWT', '0'),
+            ('REDIS_DB_LIMITER', '1'), ('SMTP_PORT', '465'))
+
+
+def configure(name='joblinker_test'):
+    '''point the database and every local store of the server at a fresh
+    scratch directory of the temp dir, returns its path'''
+    scratch = os.path.join(tempfile.gettempdir(), name)
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    # never a real database
+    os.environ['ENGINE'] = 'sqlite:///' + os.path.join(
+        scratch, 'joblinker.db')
+    os.environ['DATA_PATH'] = scratch
+    os.environ['TASK_DB'] = os.path.join(scratch, 'tasks.db')
+    os.environ['MAIL_OUTBOX_DB'] = os.path.join(scratch, 'mail_outbox.db')
+    os.environ['AI_CACHE_DIR'] = os.path.join(scratch, 'ai_cache')
+    os.environ['MATCH_CACHE_DIR'] = os.path.join(scratch, 'match_cache')
+    for var, default in DEFAULTS:
+        os.environ.setdefault(var, default)
+    return scratch
@@ -0,0 +1,144 @@
+'''test the AI result cache backends
+
+Run with:
+    python -m pytest server/tests/test_ai_cache.py
+'''
+import time
+
+import pytest
+
+from server.prompts import CANDID_PROMPT, JOB_MATCHING_PROMPT, JOB_PROMPT
+from server.services.ai_cache import (
+    AIResultCache, DiskBackend, MemoryBackend, make_backend)
+
+
+@pytest.fixture(scope='module')
+def redis_up():
+    '''whether a redis server answers'''
+    try:
+        return make_backend('redis').connection.ping()
+    except Exception:
+        return False
+
+
+def redis_backend(max_entries, ttl, up):
+    '''a RedisBackend on a scratch database, skipping without a server'''
+    if not up:
+        pytest.skip('no redis server')
+    backend = make_backend('redis')
+    backend.max_entries, backend.ttl = max_entries, ttl
+    backend.clear()
+    return backend
+
+
+@pytest.fixture(params=['memory', 'disk', 'redis'])
+def make(request, tmp_path, redis_up):
+    '''factory of a backend of each kind'''
+    def factory(max_entries=10, ttl=60):
+        if request.param == 'memory':
+            return MemoryBackend(max_entries, ttl)
+        if request.param == 'disk':
+            return DiskBackend(str(tmp_path), max_entries, ttl)
+        return redis_backend(max_entries, ttl, redis_up)
+    return factory
+
+
+def test_key_covers_content_and_prompt(tmp_path):
+    '''same bytes under another name hit, another prompt misses'''
+    a, b, c = (tmp_path / name for name in ('a.pdf', 'b.pdf', 'c.pdf'))
+    a.write_bytes(b'%PDF cv')
+    b.write_bytes(b'%PDF cv')
+    c.write_bytes(b'%PDF other cv')
+    key = AIResultCache.key(str(a), CANDID_PROMPT)
+    assert key == AIResultCache.key(str(b), CANDID_PROMPT)
+    assert key.startswith('CANDID:')
+    assert key != AIResultCache.key(str(c), CANDID_PROMPT)
+    assert key != AIResultCache.key(str(a), JOB_PROMPT)
+
+
+def test_text_key_follows_each_side(tmp_path):
+    '''a match score is found again while neither text changes, and
+    survives the process through the disk backend'''
+    candidate, job = 'Candidate: python', 'Job: python developer'
+    key = AIResultCache.text_key(JOB_MATCHING_PROMPT, candidate, job)
+    assert key.startswith('JOB_MATCHING:')
+    assert key == AIResultCache.text_key(JOB_MATCHING_PROMPT, candidate, job)
+    edited = AIResultCache.text_key(JOB_MATCHING_PROMPT, candidate + ' sql',
+                                    job)
+    assert edited != key
+    assert edited.split(':')[-1] == key.split(':')[-1]  # same job hash
+
+    AIResultCache(DiskBackend(str(tmp_path), 10, 60)).set(key, 0.75)
+    restarted = AIResultCache(DiskBackend(str(tmp_path), 10, 60))
+    assert restarted.get(key) == 0.75
+    assert restarted.get(edited) is None
+
+
+def test_hits_and_misses(make):
+    '''results round-trip as copies and are counted'''
+    cache = AIResultCache(make())
+    assert cache.get('k') is None
+    cache.set('k', {'skills': ['python']})
+    result = cache.get('k')
+    assert result == {'skills': ['python']}
+    result['skills'].append('mutated')
+    assert cache.get('k') == {'skills': ['python']}
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores']) == (2, 1, 1)
+    assert stats['entries'] == 1
+
+
+def test_lru_eviction(make):
+    '''the least recently used entry goes first'''
+    cache = AIResultCache(make(max_entries=2))
+    cache.set('a', 1)
+    time.sleep(0.01)
+    cache.set('b', 2)
+    time.sleep(0.01)
+    assert cache.get('a') == 1  # b is now the oldest
+    time.sleep(0.01)
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disk_evicts_above_the_high_water_mark(tmp_path, monkeypatch):
+    '''writes only scan the directory past the high-water mark, which
+    brings the entries back to max_entries'''
+    from server.services import ai_cache
+
+    backend = DiskBackend(str(tmp_path), 10, 60)
+    assert backend.high_water == 11
+    scans = []
+    scandir = ai_cache.os.scandir
+    monkeypatch.setattr(ai_cache.os, 'scandir',
+                        lambda path: scans.append(path) or scandir(path))
+    evicted = [backend.set(f'k{i}', 'v') for i in range(11)]
+    backend.set('k0', 'again')  # no new entry
+    assert scans == [] and sum(evicted) == 0 and len(backend) == 11
+
+    scans.clear()
+    assert backend.set('k11', 'v') == 2
+    assert len(scans) == 1 and len(backend) == 10
+    # another worker's entries are only seen by the next scan
+    DiskBackend(str(tmp_path), 10, 60, high_water=100).set('other', 'v')
+    assert backend.set('k12', 'v') == 0 and len(backend) == 12
+    assert backend.set('k13', 'v') == 3 and len(backend) == 10
+
+
+def test_ttl(make):
+    '''expired entries are misses'''
+    cache = AIResultCache(make(ttl=1))
+    cache.set('k', 'v')
+    assert cache.get('k') == 'v'
+    time.sleep(1.1)
+    assert cache.get('k') is None
+
+
+def test_disabled():
+    '''without a backend everything misses quietly'''
+    cache = AIResultCache(None)
+    cache.set('k', 'v')
+    assert cache.get('k') is None
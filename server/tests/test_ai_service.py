@@ -0,0 +1,110 @@
+'''test AIService against a stub Gemini model
+
+Run with:
+    python -m pytest server/tests/test_ai_service.py
+'''
+import os
+import uuid
+
+import pytest
+
+from server.config import ApplicationConfig
+from server.exception import AIResponseError
+from server.services import ai
+from server.services.ai import AIService
+
+CV_DIR = os.path.join(os.path.dirname(__file__), '..', 'cv')
+CV = os.path.join(CV_DIR, 'john_doe.pdf')
+# no text layer
+SCANNED_CV = os.path.join(CV_DIR, 'fola_inv.pdf')
+
+
+class StubModel:
+    '''answers each prompt with the next of its replies, and keeps the
+    documents it was asked about'''
+
+    def __init__(self):
+        self.replies = []
+        self.documents = []
+
+    def generate_content(self, parts, stream=False):
+        self.documents.append(parts[0])
+        return [type('Chunk', (), {'text': self.replies.pop(0)})]
+
+
+class StubUpload:
+    '''a file uploaded to the stub Gemini'''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+@pytest.fixture
+def model(monkeypatch):
+    '''a stub model in place of Gemini; model.uploads holds the files
+    uploaded to it'''
+    stub = StubModel()
+    stub.uploads = []
+
+    def upload_file(file_path):
+        stub.uploads.append(StubUpload(file_path))
+        return stub.uploads[-1]
+
+    monkeypatch.setattr(ai.gemini, 'model', lambda *args: stub)
+    monkeypatch.setattr(ai.gemini, 'upload_file', upload_file)
+    return stub
+
+
+def ask(file_path=CV, inline_text=True):
+    '''to_dict on file_path with a prompt never asked before, so never
+    answered from the cache, retrying at once'''
+    service = AIService(file_path=file_path)
+    service.retry_base_delay = 0
+    service.inline_text = inline_text
+    return service, service.to_dict(f'prompt {uuid.uuid4()}')
+
+
+def test_attempts_are_logged_on_retries_only(model, capsys):
+    '''a good first answer is quiet; a retry or a failure is logged'''
+    model.replies = ['{"a": 1}']
+    service, answer = ask()
+    assert answer == {'a': 1} and len(service.attempts) == 1
+    assert 'gemini attempts' not in capsys.readouterr().out
+
+    model.replies = ['not json', '{"a": 2}']
+    service, answer = ask()
+    assert answer == {'a': 2}
+    assert [a['outcome'] for a in service.attempts] == ['invalid json', 'ok']
+    assert 'gemini attempts' in capsys.readouterr().out
+
+    model.replies = ['no'] * AIService.max_attempts
+    with pytest.raises(AIResponseError):
+        ask()
+    assert 'gemini attempts' in capsys.readouterr().out
+
+
+def test_text_is_sent_inline(model):
+    '''the extracted text goes in the prompt, nothing is uploaded'''
+    model.replies = ['{"name": "John"}']
+    _, answer = ask()
+    assert answer == {'name': 'John'}
+    document, = model.documents
+    assert isinstance(document, str) and 'john' in document.lower()
+    assert model.uploads == []
+    assert AIService.inline_text is ApplicationConfig.AI_INLINE_TEXT
+
+
+def test_file_is_uploaded_without_text(model):
+    '''a scanned CV, or AI_INLINE_TEXT off, falls back to uploading the
+    file, deleted once answered'''
+    model.replies = ['{"name": "Fola"}', '{"name": "John"}']
+    for file_path, inline_text in ((SCANNED_CV, True), (CV, False)):
+        ask(file_path, inline_text)
+        upload = model.uploads[-1]
+        assert model.documents[-1] is upload
+        assert upload.file_path == file_path and upload.deleted
+    assert len(model.uploads) == 2
@@ -0,0 +1,33 @@
+'''test the application factory
+
+Run with:
+    python -m pytest server/tests/test_app.py
+'''
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def threads_after(factory):
+    '''the names of the threads running once factory built the app, in a
+    fresh interpreter'''
+    for module in ('flasgger', 'flask_jwt_extended', 'google.generativeai'):
+        pytest.importorskip(module)
+    code = ('import threading; from server.api.v1.app import create_app; '
+            f'{factory}; '
+            'print(",".join(t.name for t in threading.enumerate()))')
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+    env = dict(os.environ, PYTHONPATH=root)
+    out = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return out.split()[-1].split(',')
+
+
+def test_commands_app_starts_no_background_work():
+    '''the app of the maintenance commands runs no worker, queue nor
+    scheduler thread; the server's runs them'''
+    assert threads_after('create_app(start_background=False)') == [
+            'MainThread']
+    assert len(threads_after('create_app()')) > 1
@@ -0,0 +1,76 @@
+'''test the process-pool text extraction service
+
+Run with:
+    python -m pytest server/tests/test_extraction.py
+'''
+import glob
+import os
+import time
+
+import pytest
+
+from server.exception import UnreadableCVError
+from server.services.extraction import ExtractionService, extract_in_worker
+from server.services.text_extractor import extract_text
+
+CV_DIR = os.path.join(os.path.dirname(__file__), '..', 'cv')
+CV = os.path.join(CV_DIR, 'john_doe.pdf')
+SCANNED_CV = os.path.join(CV_DIR, 'fola_inv.pdf')
+
+
+def slow_on_sleepy(file_path, max_pages, max_chars):
+    '''worker target hanging on files named "sleepy"'''
+    if 'sleepy' in file_path:
+        time.sleep(60)
+    return extract_in_worker(file_path, max_pages, max_chars)
+
+
+@pytest.fixture(scope='module')
+def service():
+    '''a two-process service reading the first page only'''
+    service = ExtractionService(workers=2, timeout=20, max_pages=1,
+                                max_bytes=2_000_000, target=slow_on_sleepy)
+    yield service
+    service.shutdown()
+
+
+def test_extract(service):
+    '''same text as in process, page limit applied'''
+    assert service.extract(CV) == extract_text(CV, max_pages=1)
+    assert len(service.extract(CV)) < len(extract_text(CV))
+
+
+def test_errors_cross_the_process_boundary(service, tmp_path):
+    '''unreadable, unsupported and oversized files fail as in process'''
+    with pytest.raises(UnreadableCVError):
+        service.extract(SCANNED_CV)
+    odd = tmp_path / 'cv.txt'
+    odd.write_text('plain text')
+    with pytest.raises(ValueError):
+        service.extract(str(odd))
+    big = tmp_path / 'big.pdf'
+    big.write_bytes(b'0' * 2_000_001)
+    with pytest.raises(ValueError, match='too large'):
+        service.extract(str(big))
+
+
+def test_timeout_kills_the_worker(service, tmp_path):
+    '''an overrunning document times out, the pool recovers'''
+    sleepy = tmp_path / 'sleepy.pdf'
+    sleepy.write_bytes(open(CV, 'rb').read())
+    start = time.monotonic()
+    with pytest.raises(UnreadableCVError, match='too long'):
+        service.extract(str(sleepy), timeout=1)
+    assert time.monotonic() - start < 10
+    assert service.extract(CV)
+
+
+def test_extract_many(service):
+    '''a batch returns a text or an error per file, in order'''
+    paths = sorted(glob.glob(os.path.join(CV_DIR, '*.pdf')))
+    results = service.extract_many(paths)
+    assert list(results) == paths
+    assert isinstance(results[SCANNED_CV], UnreadableCVError)
+    for path in paths:
+        if path != SCANNED_CV:
+            assert results[path] == extract_text(path, max_pages=1)
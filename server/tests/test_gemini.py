@@ -0,0 +1,61 @@
+'''test the Gemini call slots
+
+Run with:
+    python -m pytest server/tests/test_gemini.py
+'''
+import threading
+import time
+
+import pytest
+
+from server.exception import AIResponseError
+from server.services.gemini import GeminiRegistry
+
+
+def test_slots_cap_calls_in_flight():
+    '''never more than max_concurrency calls at once'''
+    registry = GeminiRegistry(max_concurrency=2, slot_timeout=5)
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with registry.slot():
+            with lock:
+                peak.append(registry.stats()['in_flight'])
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = registry.stats()
+    assert max(peak) == 2
+    assert stats['calls'] == 6
+    assert stats['in_flight'] == stats['waiting'] == 0
+    assert stats['wait_seconds'] > 0
+
+
+def test_slot_timeout():
+    '''a call finding every slot taken gives up after slot_timeout'''
+    registry = GeminiRegistry(max_concurrency=1, slot_timeout=0.05)
+    with registry.slot():
+        with pytest.raises(AIResponseError):
+            with registry.slot():
+                pass
+    assert registry.stats()['timeouts'] == 1
+    with registry.slot():  # released again
+        pass
+
+
+def test_models_are_shared():
+    '''one model per settings, built on first request'''
+    pytest.importorskip('google.generativeai')
+    registry = GeminiRegistry(api_key='test')
+    config = {'temperature': 0.9, 'top_p': 1}
+    model = registry.model('gemini-1.5-flash', config)
+    assert registry.model('gemini-1.5-flash', dict(reversed(config.items()))) \
+        is model
+    assert registry.model('gemini-1.5-flash', {'temperature': 0}) \
+        is not model
+    assert registry.stats()['models'] == 2
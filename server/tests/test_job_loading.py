@@ -0,0 +1,293 @@
+'''test that job listings run a fixed number of queries
+
+Run with:
+    python -m pytest server/tests/test_job_loading.py
+'''
+
+from server.controllers.job_controller import JobController
+from server.models import storage
+from server.models.application import Application
+from server.models.candidate import Candidate
+from server.models.job import Job
+from server.models.major import Major
+from server.models.recruiter import Recruiter
+from server.models.skill import Skill
+from server.models.user import User
+
+
+def seed(n_jobs):
+    '''create a recruiter posting n_jobs jobs, each with skills and an
+    application, and return the recruiter's user id'''
+    major = Major(name=f'major-{n_jobs}')
+    skills = [Skill(name=f'skill-{n_jobs}-{i}') for i in range(3)]
+    rec_user = User(name='rec', email=f'rec-{n_jobs}@t.io', password='x',
+                    role='recruiter', contact_info='{"company_name": "T"}')
+    cand_user = User(name='cand', email=f'cand-{n_jobs}@t.io', password='x',
+                     role='candidate')
+    recruiter = Recruiter(user=rec_user)
+    candidate = Candidate(user=cand_user, major=major)
+    for obj in (major, *skills, rec_user, cand_user, recruiter, candidate):
+        storage.new(obj)
+    for i in range(n_jobs):
+        job = Job(recruiter=recruiter, major=major, job_title=f'job {i}',
+                  job_description='desc', skills=skills[:2],
+                  responsibilities=[])
+        storage.new(job)
+        storage.new(Application(job=job, candidate=candidate))
+    storage.save()
+    return rec_user.id
+
+
+def count_queries(fn, *args, **kwargs):
+    '''number of statements issued by fn on a cold session'''
+    storage.close()
+    storage.reset_request_stats()
+    result = fn(*args, **kwargs)
+    return storage.request_stats()['queries'], result
+
+
+def test_job_listing_query_count_is_constant():
+    '''1 job and 500 jobs cost the same number of queries'''
+    controller = JobController()
+    one = seed(1)
+    many = seed(500)
+
+    queries_one, jobs_one = count_queries(controller.get_jobs, one)
+    queries_many, jobs_many = count_queries(controller.get_jobs, many)
+    assert len(jobs_one) == 1 and len(jobs_many) == 500
+    assert jobs_many[0]['applications_count'] == 1
+    assert len(jobs_many[0]['skills']) == 2
+    assert queries_one == queries_many
+
+    # a page fetches limit + 1 rows, and selectinload batches 500 keys
+    # per IN clause, so stay under that to compare like for like
+    queries_one, (jobs, _) = count_queries(
+            controller.get_all_jobs_sorted_by_date, limit=1)
+    queries_many, (jobs, _) = count_queries(
+            controller.get_all_jobs_sorted_by_date, limit=400)
+    assert len(jobs) == 400
+    assert queries_one == queries_many
+
+
+def test_rescore_loads_in_few_queries_and_writes_once(monkeypatch):
+    '''re-scoring a job costs the same queries for 1 or 300 applicants'''
+    from server.config import ApplicationConfig
+    from server.services.match_scorer import match_scorer
+
+    monkeypatch.setattr(ApplicationConfig, 'MATCH_SCORER', 'local')
+    match_scorer.fit(['python work'])  # not counted: once per hour
+    major = Major(name='rescore')
+    skill = Skill(name='rescore-python')
+    rec_user = User(name='rec', email='rec-rescore@t.io', password='x',
+                    role='recruiter')
+    recruiter = Recruiter(user=rec_user)
+    jobs = [Job(recruiter=recruiter, major=major, job_title=f'rescore {n}',
+                job_description='python work', skills=[skill],
+                responsibilities=[]) for n in (1, 300)]
+    for obj in (major, skill, rec_user, recruiter, *jobs):
+        storage.new(obj)
+    for job, n in zip(jobs, (1, 300)):
+        for i in range(n):
+            user = User(name='c', email=f'c-{n}-{i}@rescore.io',
+                        password='x', role='candidate')
+            candidate = Candidate(user=user, major=major,
+                                  skills=[skill] if i % 2 else [])
+            storage.new(candidate)
+            storage.new(Application(job=job, candidate=candidate,
+                                    match_score=0.0))
+    storage.save()
+    job_ids = [job.id for job in jobs]
+
+    counts = []
+    for job_id in job_ids:
+        storage.close()
+        job = storage.get(Job, job_id, profile='job_card')
+        storage.reset_request_stats()
+        stats = JobController.rescore_job(job)
+        counts.append(storage.request_stats()['queries'])
+    assert stats['applications'] == stats['updated'] == 300
+    # applications with candidates, skills, experiences, educations,
+    # then the UPDATE
+    assert counts[0] == counts[1] == 5
+
+    scores = [a.match_score for a in
+              storage.get_all_by_attr(Application, 'job_id', job_ids[1])]
+    assert all(0.0 < s <= 1.0 for s in scores)
+    assert len(set(scores)) == 2  # with and without the skill
+
+
+def test_rescores_of_a_job_are_queued_once():
+    '''edits and manual re-scores share the re-score still queued; the
+    recruiter who posted the job polls it'''
+    import pytest
+
+    from server.exception import UnauthorizedError
+    from server.services.task_queue import task_queue
+
+    major = Major(name='coalesce')
+    skill = Skill(name='coalesce-python')
+    rec_user = User(name='rec', email='rec-coalesce@t.io', password='x',
+                    role='recruiter')
+    recruiter = Recruiter(user=rec_user)
+    jobs = [Job(recruiter=recruiter, major=major, job_title='coalesce',
+                job_description='desc', responsibilities=[])
+            for _ in range(2)]
+    for obj in (major, skill, rec_user, recruiter, *jobs):
+        storage.new(obj)
+    storage.save()
+    controller = JobController()
+    user_id = rec_user.id
+
+    # the queue is not started in the tests: tasks stay queued
+    first = controller.rescore_applications(user_id, jobs[0].id)
+    controller.add_skill(user_id, jobs[0].id, skill.id)
+    controller.update_job(user_id, jobs[0].id, {'job_description': 'new'})
+    controller.remove_skill(user_id, jobs[0].id, skill.id)
+    assert controller.rescore_applications(user_id, jobs[0].id) == first
+    other = controller.rescore_applications(user_id, jobs[1].id)
+    assert other != first
+
+    task = controller.get_rescore_task(user_id, jobs[0].id, first)
+    assert task['id'] == first and task['status'] == 'queued'
+    assert controller.get_rescore_task(user_id, jobs[0].id, other) is None
+    with pytest.raises(UnauthorizedError):
+        controller.rescore_applications(jobs[0].id, jobs[0].id)
+
+    # once running, a new edit queues a new re-score
+    assert task_queue.store.claim(first, lease=60)
+    assert controller.rescore_applications(user_id, jobs[0].id) != first
+
+
+def test_closing_a_job_is_a_fixed_number_of_statements():
+    '''closing a job with 10k applicants: one SELECT, two UPDATEs, one
+    commit and one batch of emails, well under a second'''
+    import time
+
+    from server.services.mail import MailOutbox, MailService
+
+    n = 10_000
+    major = Major(name='closure')
+    rec_user = User(name='rec', email='rec-closure@t.io', password='x',
+                    role='recruiter', contact_info='{"company_name": "T"}')
+    recruiter = Recruiter(user=rec_user)
+    job = Job(recruiter=recruiter, major=major, job_title='closure',
+              job_description='desc', responsibilities=[])
+    for obj in (major, rec_user, recruiter, job):
+        storage.new(obj)
+    for i in range(n):
+        user = User(name='c', email=f'c-{i}@closure.io', password='x',
+                    role='candidate', contact_info='{}')
+        candidate = Candidate(user=user, major=major)
+        storage.new(candidate)
+        # every third unscored, the others on either side of 0.5
+        score = None if i % 3 == 0 else (0.9 if i % 3 == 1 else 0.2)
+        storage.new(Application(job=job, candidate=candidate,
+                                match_score=score))
+    storage.save()
+    job_id, user_id = job.id, rec_user.id
+
+    controller = JobController()
+    controller.email_service = MailService(
+            workers=0, outbox=MailOutbox(':memory:'))
+    storage.close()
+    storage.reset_request_stats()
+    start = time.perf_counter()
+    controller.update_job(user_id, job_id, {'is_open': False})
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.0
+    assert storage.request_stats()['queries'] < 10
+
+    statuses = [a.application_status for a in
+                storage.get_all_by_attr(Application, 'job_id', job_id)]
+    shortlisted = statuses.count(JobController.STATUS_SHORTLISTED)
+    assert shortlisted == n // 3
+    assert statuses.count(JobController.STATUS_REJECTED) == n - shortlisted
+    assert storage.get(Job, job_id).is_open is False
+    # one email per applicant and the recruiter's summary
+    assert controller.email_service.stats()['queue_depth'] == n + 1
+
+
+def test_sweeper_closes_expired_jobs_in_batches():
+    '''expired open jobs are closed and shortlisted, a batch at a time,
+    each claimed by one worker only'''
+    from datetime import datetime, timedelta
+
+    from server.services.mail import MailOutbox, MailService
+
+    now = datetime.utcnow()
+    major = Major(name='sweep')
+    rec_user = User(name='rec', email='rec-sweep@t.io', password='x',
+                    role='recruiter', contact_info='{"company_name": "T"}')
+    recruiter = Recruiter(user=rec_user)
+    for obj in (major, rec_user, recruiter):
+        storage.new(obj)
+    expired, current = [], []
+    for i in range(5):
+        for jobs, deadline in ((expired, now - timedelta(days=1)),
+                               (current, now + timedelta(days=1))):
+            jobs.append(Job(recruiter=recruiter, major=major,
+                            job_title=f'sweep {i}', job_description='desc',
+                            responsibilities=[],
+                            application_deadline=deadline))
+            storage.new(jobs[-1])
+            user = User(name='c', email=f'c-{len(jobs)}-{deadline}@sweep.io',
+                        password='x', role='candidate', contact_info='{}')
+            storage.new(Application(job=jobs[-1], match_score=0.9,
+                                    candidate=Candidate(user=user,
+                                                        major=major)))
+    storage.save()
+    expired_ids = [job.id for job in expired]
+    current_ids = [job.id for job in current]
+
+    # a second worker's claim of the same job fails
+    assert storage.claim_job_closure(expired_ids[0])
+    assert not storage.claim_job_closure(expired_ids[0])
+    storage.rollback()
+
+    controller = JobController()
+    controller.email_service = MailService(
+            workers=0, outbox=MailOutbox(':memory:'))
+    stats = controller.close_expired_jobs(now=now, batch_size=2)
+    assert (stats['closed'], stats['failed']) == (5, 0)
+    assert controller.close_expired_jobs(now=now)['closed'] == 0
+
+    storage.close()
+    for job_id in expired_ids:
+        assert storage.get(Job, job_id).is_open is False
+        application, = storage.get_all_by_attr(
+                Application, 'job_id', job_id)
+        assert application.application_status == 'shortlisted'
+    for job_id in current_ids:
+        assert storage.get(Job, job_id).is_open is True
+    # an applicant and the recruiter per job closed
+    assert controller.email_service.stats()['queue_depth'] == 10
+
+
+def test_a_reopened_job_emails_its_next_closure():
+    '''closure emails are de-duplicated per closure, not per job'''
+    from server.services.mail import MailOutbox, MailService
+
+    major = Major(name='reclosure')
+    rec_user = User(name='rec', email='rec-reclosure@t.io', password='x',
+                    role='recruiter', contact_info='{"company_name": "T"}')
+    cand_user = User(name='c', email='c@reclosure.io', password='x',
+                     role='candidate', contact_info='{}')
+    job = Job(recruiter=Recruiter(user=rec_user), major=major,
+              job_title='reclosure', job_description='desc',
+              responsibilities=[])
+    application = Application(job=job, match_score=0.9,
+                              candidate=Candidate(user=cand_user,
+                                                  major=major))
+    for obj in (major, rec_user, cand_user, job, application):
+        storage.new(obj)
+    storage.save()
+
+    controller = JobController()
+    controller.email_service = MailService(
+            workers=0, outbox=MailOutbox(':memory:'))
+    for is_open in (False, True, False):
+        controller.update_job(rec_user.id, job.id, {'is_open': is_open})
+    assert storage.get(Job, job.id).times_closed == 2
+    stats = controller.email_service.stats()
+    # the applicant's and the recruiter's, for each closure
+    assert (stats['queue_depth'], stats['duplicates']) == (4, 0)
@@ -0,0 +1,209 @@
+'''test both /jobs/search engines against the same corpus
+
+Run with:
+    python -m pytest server/tests/test_job_search.py
+'''
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from server.config import ApplicationConfig
+from server.controllers.job_controller import JobController
+from server.models import storage
+from server.models.job import Job
+from server.models.major import Major
+from server.models.recruiter import Recruiter
+from server.models.user import User
+from server.services import job_search
+from server.services.job_search import get_search_engine
+from server.services.mail import MailOutbox, MailService
+from server.services.search_index import JobSearchIndex, load_open_jobs
+
+# (title, location, open, expired)
+CORPUS = [
+    ('Senior Python Developer', 'Cairo, Egypt', True, False),
+    ('Python Developer', 'Berlin, Germany', True, False),
+    ('Java Backend Engineer', 'Cairo, Egypt', True, False),
+    ('Data Scientist', 'London, UK', True, False),
+    ('Frontend React Developer', 'Dubai, UAE', True, False),
+    ('DevOps Engineer', 'Remote', True, False),
+    ('Python Data Engineer', 'Cairo, Egypt', False, False),
+    ('Python Tester', 'Cairo, Egypt', True, True),
+]
+
+# (title, location) -> titles expected from every engine
+QUERIES = [
+    (('python', None), {'Senior Python Developer', 'Python Developer'}),
+    ((None, 'cairo'), {'Senior Python Developer', 'Java Backend Engineer'}),
+    (('engineer', 'cairo'), {'Java Backend Engineer'}),
+    (('data scientist', 'london'), {'Data Scientist'}),
+    (('devops', None), {'DevOps Engineer'}),
+    (('cobol', None), set()),
+]
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    '''the CORPUS jobs, posted by one recruiter'''
+    now = datetime.utcnow()
+    major = Major(name='search')
+    user = User(name='rec', email='rec-search@t.io', password='x',
+                role='recruiter')
+    recruiter = Recruiter(user=user)
+    for obj in (major, user, recruiter):
+        storage.new(obj)
+    jobs = []
+    for i, (title, location, is_open, expired) in enumerate(CORPUS):
+        jobs.append(Job(
+            recruiter=recruiter, major=major, job_title=title,
+            job_description=f'{title} wanted in {location}.',
+            location=location, is_open=is_open, responsibilities=[],
+            created_at=now - timedelta(hours=len(CORPUS) - i),
+            application_deadline=now - timedelta(days=1) if expired
+            else now + timedelta(days=30)))
+        storage.new(jobs[-1])
+    storage.save()
+    # listings only filter on is_open: the sweeper closes expired jobs
+    controller = JobController()
+    controller.email_service = MailService(
+            workers=0, outbox=MailOutbox(':memory:'))
+    assert controller.close_expired_jobs()['closed'] == 1
+    return {job.id: job.job_title for job in jobs}
+
+
+@pytest.fixture(params=['fuzzy', 'fulltext'])
+def engine(request, corpus):
+    '''each search engine, the fuzzy one over a freshly built index'''
+    engine = get_search_engine(request.param)
+    if request.param == 'fuzzy':
+        engine.index = JobSearchIndex(loader=load_open_jobs)
+    return engine
+
+
+@pytest.mark.parametrize('query, expected', QUERIES)
+def test_matches(engine, corpus, query, expected):
+    '''open jobs matching the query, and only those'''
+    title, location = query
+    ids = engine.search(location, title)
+    # other test modules post jobs to the same database
+    assert {corpus[id] for id in ids if id in corpus} == expected
+
+
+def test_relevance(engine, corpus):
+    '''the job matching both title words ranks first'''
+    ids = engine.search(None, 'senior python')
+    ours = [id for id in ids if id in corpus]
+    assert corpus[ours[0]] == 'Senior Python Developer'
+
+
+def test_pages(engine, corpus):
+    '''walking the pages returns every match once, in order'''
+    everything = engine.search(None, None)
+    ours = [id for id in everything if id in corpus]
+    assert len(ours) == 6
+    assert [corpus[id] for id in ours[:2]] == [
+            'DevOps Engineer', 'Frontend React Developer']
+
+    walked, offset = [], 0
+    while True:
+        page = engine.search(None, None, offset=offset, limit=4)
+        if not page:
+            break
+        walked += page
+        offset += 4
+    assert walked == everything
+
+
+def test_newest_first(engine, corpus):
+    '''sorting by date overrides relevance'''
+    ids = engine.search('cairo', None, newest_first=True)
+    assert [corpus[id] for id in ids] == [
+            'Java Backend Engineer', 'Senior Python Developer']
+
+
+def posting(id, title, is_open=True):
+    '''a job as the index reads it'''
+    return SimpleNamespace(id=id, job_title=title, location='Cairo',
+                           created_at=datetime(2024, 1, id), is_open=is_open)
+
+
+class SlowLoader:
+    '''loader returning the current jobs, blocking while held'''
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.released = threading.Event()
+        self.released.set()
+        self.started = threading.Event()
+
+    def __call__(self):
+        self.started.set()
+        self.released.wait(5)
+        return list(self.jobs)
+
+
+def test_changes_made_during_a_build_are_kept():
+    '''jobs added or removed while the loader runs survive the swap'''
+    loader = SlowLoader([posting(1, 'python'), posting(2, 'python')])
+    index = JobSearchIndex(loader=loader)
+    loader.released.clear()
+    build = threading.Thread(target=index.build)
+    build.start()
+    assert loader.started.wait(5)
+    index.add(posting(3, 'python'))
+    index.remove(2)
+    loader.released.set()
+    build.join(5)
+    assert index.search(title='python') == [1, 3]
+
+
+def test_a_stale_index_is_served_while_rebuilt():
+    '''an old index answers at once, the rebuilt one is swapped in'''
+    loader = SlowLoader([posting(1, 'python')])
+    index = JobSearchIndex(loader=loader)
+    assert index.search(title='python') == [1]
+
+    index.REBUILD_INTERVAL = 0
+    loader.jobs = [posting(1, 'python'), posting(2, 'python')]
+    loader.released.clear()
+    loader.started.clear()
+    assert index.search(title='python') == [1]
+    assert loader.started.wait(5)
+    assert index.search(title='python') == [1]
+    index.REBUILD_INTERVAL = 300
+    loader.released.set()
+    deadline = time.monotonic() + 5
+    while index.search(title='python') != [1, 2]:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_jobs_closed_elsewhere_leave_the_results(monkeypatch):
+    '''a job closed behind the index's back is not served and is dropped
+    from the index; the page is filled from the next matches'''
+    index = JobSearchIndex(loader=load_open_jobs)
+    monkeypatch.setattr(job_search, 'job_index', index)
+    monkeypatch.setattr(ApplicationConfig, 'JOB_SEARCH_ENGINE', 'fuzzy')
+    now = datetime.utcnow()
+    user = User(name='rec', email='rec-stale@t.io', password='x',
+                role='recruiter')
+    recruiter, major = Recruiter(user=user), Major(name='stale')
+    jobs = [Job(recruiter=recruiter, major=major, job_title='Quokka Keeper',
+                job_description='d', responsibilities=[],
+                created_at=now - timedelta(hours=i)) for i in range(3)]
+    for obj in (user, recruiter, major, *jobs):
+        storage.new(obj)
+    storage.save()
+    assert len(index.search(title='quokka keeper')) == 3
+
+    # closed by another worker
+    storage.bulk_update(Job, [{'id': jobs[0].id, 'is_open': False}])
+    found, cursor = JobController().search_jobs(
+            title='quokka keeper', sort='date', limit=2)
+    assert [job['id'] for job in found] == [jobs[1].id, jobs[2].id]
+    assert cursor is None
+    assert set(index.search(title='quokka keeper')) == {
+            jobs[1].id, jobs[2].id}
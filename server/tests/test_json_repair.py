@@ -0,0 +1,33 @@
+'''test the local repair of model JSON output
+
+Run with:
+    python -m pytest server/tests/test_json_repair.py
+'''
+from json import JSONDecodeError
+
+import pytest
+
+from server.services.json_repair import loads_lenient
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": 1}', {'a': 1}),
+    ('```json\n{"a": 1}\n```', {'a': 1}),
+    ('Here is the JSON:\n{"a": [1, 2,],}\nHope it helps!', {'a': [1, 2]}),
+    ('{"skills": ["python", "sql"', {'skills': ['python', 'sql']}),
+    ('{"name": "Ada", "bio": "wrote the first', {'name': 'Ada',
+                                                  'bio': 'wrote the first'}),
+    ('{"name": "Ada", "age"', {'name': 'Ada'}),
+    ('{"note": "a, } and ]"}', {'note': 'a, } and ]'}),
+    ('{"text": "line\none"}', {'text': 'line\none'}),
+])
+def test_repairs(text, expected):
+    '''usual model slips are fixed without asking again'''
+    assert loads_lenient(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', 'I cannot read this CV.', '{"a": tru'])
+def test_unrepairable(text):
+    '''hopeless output still raises, to trigger a retry'''
+    with pytest.raises(JSONDecodeError):
+        loads_lenient(text)
@@ -0,0 +1,296 @@
+'''test the mail service worker pool
+
+Run with:
+    python -m pytest server/tests/test_mail.py
+'''
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from server.services.mail import MailOutbox, MailService, mail_service
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    '''just enough of an SMTP server for smtplib, counting connections,
+    messages and NOOPs; greeting_delay stands in for the TLS handshake
+    and login a real server costs'''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, greeting_delay=0.0):
+        super().__init__(('127.0.0.1', 0), SMTPSession)
+        self.greeting_delay = greeting_delay
+        self.connections = self.messages = self.noops = 0
+        self.sessions = set()
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def drop_all(self):
+        '''hang up on every client, as a restarted server would'''
+        for session in list(self.sessions):
+            session.request.shutdown(socket.SHUT_RDWR)
+
+
+class SMTPSession(socketserver.StreamRequestHandler):
+    '''one client connection'''
+
+    def handle(self):
+        self.server.count('connections')
+        self.server.sessions.add(self)
+        time.sleep(self.server.greeting_delay)
+        reply = self.wfile.write
+        reply(b'220 stand-in ESMTP\r\n')
+        try:
+            for line in self.rfile:
+                verb = line[:4].upper()
+                if verb == b'DATA':
+                    reply(b'354 go ahead\r\n')
+                    for data in self.rfile:
+                        if data == b'.\r\n':
+                            break
+                    self.server.count('messages')
+                    reply(b'250 queued\r\n')
+                elif verb == b'RCPT' and b'refused@' in line:
+                    reply(b'550 no such mailbox\r\n')
+                elif verb == b'QUIT':
+                    reply(b'221 bye\r\n')
+                    return
+                else:
+                    if verb == b'NOOP':
+                        self.server.count('noops')
+                    reply(b'250 ok\r\n')
+        except (OSError, ValueError):
+            pass  # dropped
+        finally:
+            self.server.sessions.discard(self)
+
+
+@pytest.fixture
+def smtp_server():
+    '''a local SMTP stand-in'''
+    server = SMTPStandIn(greeting_delay=0.005)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def smtp_service(server, **kwargs):
+    '''a MailService sending in clear to the stand-in'''
+    service = MailService(retry_delay=0.01, **kwargs)
+    service.smtp_server, service.port = server.server_address
+    service.use_ssl = False
+    service.password = None
+    service.sender_email = 'noreply@t.io'
+    service.start_workers()
+    return service
+
+
+@pytest.fixture
+def service():
+    '''a service whose emails take 10 ms each to "send"'''
+    service = MailService(workers=3)
+    sent = []
+
+    def send(template, receiver_email, name, subject):
+        time.sleep(0.01)
+        if receiver_email == 'bounce@t.io':
+            raise OSError('mailbox unavailable')
+        sent.append(receiver_email)
+
+    service._send_mail = send
+    service.sent = sent
+    service.start_workers()
+    yield service
+    service.shutdown(timeout=1)
+
+
+def test_import_opens_nothing(tmp_path):
+    '''importing the service neither opens the outbox nor starts a
+    thread; both wait for create_app'''
+    path = tmp_path / 'outbox.db'
+    code = ('import threading; from server.services.mail import '
+            'mail_service; print(threading.active_count())')
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+    env = dict(os.environ, MAIL_OUTBOX_DB=str(path), PYTHONPATH=root)
+    out = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    assert out.split()[-1] == '1' and not path.exists()
+
+
+def test_controllers_share_one_pool():
+    '''building controllers starts no thread'''
+    from server.controllers.application_controller import (
+        ApplicationsController)
+    from server.controllers.job_controller import JobController
+
+    before = threading.active_count()
+    controllers = [cls() for cls in (JobController, ApplicationsController)
+                   for _ in range(50)]
+    assert threading.active_count() == before
+    assert all(c.email_service is mail_service for c in controllers)
+
+
+def test_pool_stays_bounded(service):
+    '''however many emails, `workers` threads send them all'''
+    for i in range(60):
+        service.send_mail('t', f'{i}@t.io', 'n', 's')
+    service.send_mail('t', 'bounce@t.io', 'n', 's')
+    assert service.stats()['workers'] == 3
+    assert service.drain(timeout=5)
+
+    stats = service.stats()
+    assert stats['due'] == stats['in_flight'] == stats['sending'] == 0
+    assert stats['queue_depth'] == 1  # the bounce, waiting for its retry
+    assert (stats['queued'], stats['sent'], stats['failed']) == (61, 60, 1)
+
+
+def test_shutdown_sends_what_is_queued(service):
+    '''queued emails go out, then the workers stop'''
+    for i in range(20):
+        service.send_mail('t', f'{i}@t.io', 'n', 's')
+    assert service.shutdown(timeout=5) == 0
+    assert len(service.sent) == 20
+    assert service.stats()['workers'] == 0
+    with pytest.raises(RuntimeError):
+        service.send_mail('t', 'late@t.io', 'n', 's')
+
+
+def test_shutdown_timeout_reports_unsent(service):
+    '''a drain cut short says how many emails were left'''
+    for i in range(100):
+        service.send_mail('t', f'{i}@t.io', 'n', 's')
+    unsent = service.shutdown(timeout=0.05)
+    assert 0 < unsent < 100
+
+
+def test_persistent_connections(smtp_server):
+    '''emails per second, a connection per email against one kept per
+    worker'''
+    n, rates = 200, {}
+    for label, per_connection in (('before', 1), ('after', 100)):
+        connections = smtp_server.connections
+        service = smtp_service(smtp_server, workers=2,
+                               max_per_connection=per_connection)
+        start = time.perf_counter()
+        for i in range(n):
+            service.send_mail('t', f'{i}@t.io', 'n', 's')
+        assert service.drain(timeout=30)
+        rates[label] = n / (time.perf_counter() - start)
+        service.shutdown(timeout=5)
+        rates[label + '_connections'] = smtp_server.connections - connections
+        assert service.stats()['sent'] == n
+        assert service.stats()['open_connections'] == 0
+    print(f"\n{n} emails: {rates['before']:.0f}/s with "
+          f"{rates['before_connections']} connections, "
+          f"{rates['after']:.0f}/s with {rates['after_connections']}")
+    assert smtp_server.messages == 2 * n
+    assert rates['before_connections'] == n
+    assert rates['after_connections'] <= 2 * 2  # a worker, twice per 100
+    assert rates['after'] > rates['before']
+
+
+def test_reconnect_and_keepalive(smtp_server):
+    '''a dropped connection is replaced at once; an idle one gets NOOPs,
+    then is closed'''
+    service = smtp_service(smtp_server, workers=1, keepalive=0.05,
+                           idle_timeout=0.5)
+    service.send_mail('t', 'a@t.io', 'n', 's')
+    assert service.drain(timeout=5)
+    time.sleep(0.2)
+    assert smtp_server.noops >= 2
+    assert service.stats()['open_connections'] == 1
+
+    smtp_server.drop_all()
+    service.send_mail('t', 'b@t.io', 'n', 's')
+    assert service.drain(timeout=5)
+    stats = service.stats()
+    assert (stats['sent'], stats['failed']) == (2, 0)
+    assert smtp_server.messages == 2
+    assert smtp_server.connections == 2
+
+    time.sleep(0.8)
+    assert service.stats()['open_connections'] == 0
+    service.shutdown(timeout=5)
+
+
+def test_refused_email_keeps_the_connection(smtp_server):
+    '''a recipient the server refuses fails that email only, with no
+    reconnect nor second attempt'''
+    service = smtp_service(smtp_server, workers=1, max_retries=1)
+    for to in ('a@t.io', 'refused@t.io', 'b@t.io'):
+        service.send_mail('t', to, 'n', 's')
+    assert service.drain(timeout=5)
+    stats = service.stats()
+    assert (stats['sent'], stats['failed'], stats['dead']) == (2, 1, 1)
+    assert smtp_server.messages == 2
+    assert smtp_server.connections == 1
+    service.shutdown(timeout=5)
+
+
+def test_outbox_survives_a_restart(tmp_path):
+    '''emails added by one process are sent by the next'''
+    path = str(tmp_path / 'outbox.db')
+    MailOutbox(path).add([{'template': 't', 'receiver_email': f'{i}@t.io',
+                           'name': 'n', 'subject': 's'} for i in range(5)])
+    service = MailService(outbox=MailOutbox(path))
+    sent = []
+    service._send_mail = lambda t, to, n, s: sent.append(to)
+    service.start_workers()
+    assert service.drain(timeout=5)
+    service.shutdown()
+    assert sorted(sent) == [f'{i}@t.io' for i in range(5)]
+    assert MailOutbox(path).counts()['sent'] == 5
+
+
+def test_idempotency_key(service):
+    '''the same event is emailed once'''
+    assert service.send_mail('t', 'a@t.io', 'n', 's', idempotency_key='k')
+    assert service.send_mail('t', 'a@t.io', 'n', 's',
+                             idempotency_key='k') is None
+    assert service.drain(timeout=5)
+    assert service.sent == ['a@t.io']
+    assert service.stats()['duplicates'] == 1
+
+
+def test_failures_are_rescheduled_then_dead_lettered(service):
+    '''a failing email neither blocks the others nor retries forever'''
+    service.workers, service.max_retries, service.retry_delay = 1, 2, 0.2
+    service.send_mail('t', 'bounce@t.io', 'n', 's')
+    for i in range(20):
+        service.send_mail('t', f'{i}@t.io', 'n', 's')
+    start = time.monotonic()
+    assert service.drain(timeout=5)
+    assert time.monotonic() - start < 0.5  # no worker slept on the bounce
+    assert len(service.sent) == 20
+
+    time.sleep(0.3)  # the retry falls due, and fails for good
+    assert service.drain(timeout=5)
+    stats = service.stats()
+    assert (stats['failed'], stats['dead'], stats['dead_letters']) == (2, 1, 1)
+    assert stats['queue_depth'] == 0
+    assert service.outbox.requeue_dead() == 1
+
+
+def test_expired_claims_are_claimed_again():
+    '''an email claimed by a worker that died is sent by another'''
+    outbox = MailOutbox(':memory:')
+    outbox.add([{'template': 't', 'receiver_email': f'{i}@t.io',
+                 'subject': 's'} for i in range(3)])
+    assert len(outbox.claim(2, lease=60)) == 2
+    assert [e['receiver_email'] for e in outbox.claim(5, lease=0)] \
+        == ['2@t.io']
+    time.sleep(0.01)
+    again = outbox.claim(5, lease=60)
+    assert [(e['receiver_email'], e['attempts']) for e in again] \
+        == [('2@t.io', 2)]
@@ -0,0 +1,111 @@
+'''test the local match scorer
+
+Run with:
+    python -m pytest server/tests/test_match_scorer.py
+'''
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace as NS
+
+import pytest
+
+from server.services.match_scorer import (
+    LocalMatchScorer, experience_years, normalize_skill, parse_years)
+
+JOB = NS(
+    job_description='We build data pipelines in Python and SQL on AWS. '
+                    'You will design ETL jobs and tune warehouse queries.',
+    responsibilities=['Maintain Airflow DAGs', 'Review pull requests'],
+    skills=[NS(name='Python'), NS(name='SQL'), NS(name='AWS specialist')],
+    major_id='cs', exper_years='3-5 years')
+
+
+def candidate(skills, major_id, years, description):
+    '''a candidate with one experience of the given length'''
+    start = datetime(2020, 1, 1)
+    end = start.replace(year=start.year + years)
+    return NS(skills=[NS(name=s) for s in skills], major_id=major_id,
+              experiences=[NS(title='Engineer', description=description,
+                              start_date=start, end_date=end)])
+
+
+@pytest.fixture
+def scorer():
+    '''a scorer fitted on a few job descriptions'''
+    scorer = LocalMatchScorer()
+    scorer.fit([JOB.job_description,
+                'We are hiring a React developer for our web shop.',
+                'Nurses wanted for the night shift in our clinic.'])
+    return scorer
+
+
+def test_helpers():
+    '''synonyms, experience ranges and merged periods'''
+    assert normalize_skill(' Python  Developer ') == 'python'
+    assert normalize_skill('AWS specialist') == 'aws'
+    assert parse_years('3-5 years') == (3, 5)
+    assert parse_years('5+ Years') == (5, None)
+    assert parse_years('6 months') == (0.5, None)
+    assert parse_years('senior') is None
+    xps = [NS(start_date=datetime(2020, 1, 1), end_date=datetime(2022, 1, 1)),
+           NS(start_date=datetime(2021, 1, 1), end_date=datetime(2023, 1, 1))]
+    assert round(experience_years(xps)) == 3
+
+
+def test_ranking(scorer):
+    '''a better fit always scores higher, everything in [0, 1]'''
+    strong = candidate(['python developer', 'SQL', 'aws'], 'cs', 4,
+                       'Built ETL pipelines in Python and tuned SQL '
+                       'warehouse queries on AWS, with Airflow.')
+    partial = candidate(['Python'], 'cs', 1,
+                        'Wrote Python scripts for a web shop.')
+    unrelated = candidate(['Nursing'], 'med', 2,
+                          'Night shift nurse in a busy clinic.')
+    scores = [scorer.score(c, JOB) for c in (strong, partial, unrelated)]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] > 0.8 and scores[2] < 0.15
+    assert all(0.0 <= s <= 1.0 for s in scores)
+    assert scorer.score_many(JOB, [strong, partial, unrelated]) == scores
+
+
+def test_missing_components_are_left_out(scorer):
+    '''no job skills and no exper_years: major and text decide'''
+    job = NS(job_description='Python data work', responsibilities=None,
+             skills=[], major_id='cs', exper_years=None)
+    cand = NS(skills=[], major_id='cs', experiences=[])
+    components = scorer.components(scorer.candidate_features(cand),
+                                   scorer.job_features(job))
+    assert components == {'skills': None, 'major': 1.0,
+                          'experience': None, 'text': None}
+    assert scorer.combine(components) == 1.0
+
+
+def test_a_stale_table_is_used_while_refitted():
+    '''only the first fit is waited for; a refit runs in the
+    background and is swapped in once done'''
+    texts = ['python sql', 'python react']
+    release, started = threading.Event(), threading.Event()
+
+    def loader():
+        started.set()
+        release.wait(5)
+        return list(texts)
+
+    scorer = LocalMatchScorer(loader=loader)
+    release.set()
+    first = scorer.job_features(JOB)['vector']
+
+    scorer.REFIT_INTERVAL = 0
+    texts.append('nursing clinic')
+    release.clear()
+    started.clear()
+    assert scorer.job_features(JOB)['vector'] == first
+    assert started.wait(5)
+    assert scorer.job_features(JOB)['vector'] == first
+    scorer.REFIT_INTERVAL = 3600
+    release.set()
+    deadline = time.monotonic() + 5
+    while scorer.job_features(JOB)['vector'] == first:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
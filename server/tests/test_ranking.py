@@ -0,0 +1,123 @@
+'''test the skill-overlap rankings of candidates and jobs
+
+Run with:
+    python -m pytest server/tests/test_ranking.py
+'''
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from server.controllers.candidate_controller import CandidateController
+from server.exception import UnauthorizedError
+from server.models import storage
+from server.models.application import Application
+from server.models.candidate import Candidate
+from server.models.job import Job
+from server.models.major import Major
+from server.models.recruiter import Recruiter
+from server.models.skill import Skill
+from server.models.user import User
+
+
+def add(obj):
+    '''obj, added to the session'''
+    storage.new(obj)
+    return obj
+
+
+def user(role):
+    '''a new user of the role'''
+    return add(User(name='u', email=f'{uuid.uuid4()}@rank.io',
+                    password='x', role=role))
+
+
+@pytest.fixture(scope='module')
+def world():
+    '''skills a to e, two majors, a recruiter and a job needing a, b
+    and c'''
+    tag = uuid.uuid4().hex
+    skills = {name: add(Skill(name=f'{name}-{tag}')) for name in 'abcde'}
+    major, other = (add(Major(name=f'{name}-{tag}'))
+                    for name in ('major', 'other'))
+    recruiter = add(Recruiter(user=user('recruiter')))
+    job = add(Job(recruiter=recruiter, major=major, job_title='job',
+                  job_description='d', responsibilities=[],
+                  skills=[skills[name] for name in 'abc']))
+    storage.save()
+    return SimpleNamespace(skills=skills, major=major, other=other,
+                           recruiter=recruiter, job=job)
+
+
+def candidate(world, names, major=None):
+    '''a saved candidate of the major (the job's by default) knowing the
+    named skills'''
+    found = add(Candidate(user=user('candidate'),
+                          major=major or world.major,
+                          skills=[world.skills[name] for name in names]))
+    storage.save()
+    return found
+
+
+def test_rank_candidates(world):
+    '''best overlap first, ties by id; no shared skill or another major
+    is no match'''
+    best = candidate(world, 'abcd')
+    tied = [candidate(world, 'ad'), candidate(world, 'b'),
+            candidate(world, 'ce')]
+    candidate(world, 'de')
+    candidate(world, 'abc', major=world.other)
+
+    ranked = storage.rank_candidates(world.job)
+    assert ranked == [(best, 3)] + [
+            (found, 1) for found in sorted(tied, key=lambda c: c.id)]
+    assert storage.rank_candidates(world.job, limit=2) == ranked[:2]
+
+
+@pytest.fixture(scope='module')
+def jobs(world):
+    '''a candidate of the other major knowing a and b, who applied for
+    the second of the open jobs of that major sharing skills with them'''
+    def job(names, major=world.other, is_open=True):
+        return add(Job(recruiter=world.recruiter, major=major,
+                       job_title='job', job_description='d',
+                       responsibilities=[], is_open=is_open,
+                       skills=[world.skills[name] for name in names]))
+    matches = [job('abc'), job('ae'), job('bd')]
+    job('b', is_open=False)
+    job('cde')
+    job('ab', major=world.major)
+    applicant = candidate(world, 'ab', major=world.other)
+    add(Application(job=matches[1], candidate=applicant))
+    storage.save()
+    return SimpleNamespace(applicant=applicant, matches=matches)
+
+
+def test_rank_jobs(jobs):
+    '''open jobs of the major by overlap then id, flagged when applied
+    for, or dropped with exclude_applied'''
+    first, applied, other = jobs.matches
+    tied = sorted([applied, other], key=lambda j: j.id)
+    ranked = storage.rank_jobs(jobs.applicant)
+    assert ranked == [(first, 2, False)] + [
+            (job, 1, job is applied) for job in tied]
+    assert storage.rank_jobs(jobs.applicant, limit=1) == ranked[:1]
+    assert storage.rank_jobs(jobs.applicant, exclude_applied=True) == [
+            (first, 2, False), (other, 1, False)]
+
+
+def test_recommend_jobs(jobs):
+    '''the controller reports the overlap as skill_overlap; only
+    candidates get recommendations'''
+    controller = CandidateController()
+    user_id = jobs.applicant.user_id
+    recommended = controller.recommend_jobs(user_id, exclude_applied=True)
+    assert [(r['job'].id, r['skill_overlap'], r['has_applied'])
+            for r in recommended] == [
+            (job.id, overlap, False)
+            for job, overlap, _ in storage.rank_jobs(
+                jobs.applicant, exclude_applied=True)]
+    assert recommended[0]['skill_overlap'] == 2
+    assert len(controller.recommend_jobs(user_id, limit=1)) == 1
+    with pytest.raises(UnauthorizedError):
+        controller.recommend_jobs(user('recruiter').id)
@@ -0,0 +1,286 @@
+'''test the DBStorage query helpers
+
+Run with:
+    python -m pytest server/tests/test_storage.py
+'''
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from server.api.utils import get_page_args, make_page_response_
+from server.models import storage
+from server.models.application import Application
+from server.models.base_model import Base
+from server.models.candidate import Candidate
+from server.models.engine import migrations
+from server.models.job import Job
+from server.models.major import Major
+from server.models.recruiter import Recruiter
+from server.models.user import User
+
+
+def make_users(n, role='candidate'):
+    '''n saved users with unique emails'''
+    users = [User(name='u', email=f'{uuid.uuid4()}@storage.io',
+                  password='x', role=role) for _ in range(n)]
+    for user in users:
+        storage.new(user)
+    storage.save()
+    return users
+
+
+def test_request_stats_count_queries_and_rows():
+    '''one SELECT loading 3 rows, counted on this thread only'''
+    emails = [user.email for user in make_users(3)]
+    storage.close()
+    storage.reset_request_stats()
+    storage.find(User, User.email.in_(emails))
+    assert storage.request_stats() == {'queries': 1, 'rows': 3}
+
+    other = {}
+    thread = threading.Thread(
+            target=lambda: other.update(storage.request_stats()))
+    thread.start()
+    thread.join()
+    assert other == {'queries': 0, 'rows': 0}
+
+    storage.reset_request_stats()
+    assert storage.request_stats() == {'queries': 0, 'rows': 0}
+
+
+def test_get_by_attr_is_cached_until_a_write():
+    '''a hit is served from the cache, a commit drops it, a miss is
+    never cached'''
+    user, = make_users(1)
+    storage.close()
+    storage.reset_request_stats()
+    first = storage.get_by_attr(User, 'email', user.email)
+    assert storage.get_by_attr(User, 'email', user.email) is first
+    assert storage.request_stats()['queries'] == 1
+
+    first.name = 'renamed'
+    storage.save()
+    storage.reset_request_stats()
+    assert storage.get_by_attr(User, 'email', user.email).name == 'renamed'
+    assert storage.request_stats()['queries'] == 1
+
+    storage.reset_request_stats()
+    for _ in range(2):
+        assert storage.get_by_attr(User, 'email', 'nobody@x.io') is None
+    assert storage.request_stats()['queries'] == 2
+
+
+def test_iter_column_builds_no_objects():
+    '''one query streams the values, no row is loaded as an object'''
+    emails = {user.email for user in make_users(5)}
+    storage.close()
+    storage.reset_request_stats()
+    found = storage.iter_column(
+            User.email, User.email.in_(emails), batch_size=2)
+    assert set(found) == emails
+    assert storage.request_stats() == {'queries': 1, 'rows': 0}
+
+
+def walk(*criteria, limit, **kwargs):
+    '''every page of users matching criteria, and the number of pages'''
+    seen, pages, cursor = [], 0, None
+    while True:
+        users, cursor = storage.paginate(
+                User, *criteria, cursor=cursor, limit=limit, **kwargs)
+        seen += users
+        pages += 1
+        if cursor is None:
+            return seen, pages
+
+
+@pytest.fixture(scope='module')
+def tied_users():
+    '''7 users of two roles, 4 of them created at the same instant, and
+    the filter matching them'''
+    tag = uuid.uuid4().hex
+    now = datetime(2024, 1, 1)
+    stamps = [now] * 4 + [now + timedelta(seconds=i) for i in (1, 2, 3)]
+    for i, stamp in enumerate(stamps):
+        storage.new(User(name='u', email=f'{i}-{tag}@page.io', password='x',
+                         role='recruiter' if i % 2 else 'candidate',
+                         created_at=stamp))
+    storage.save()
+    return User.email.like(f'%-{tag}@page.io')
+
+
+def test_paginate_breaks_ties_on_id(tied_users):
+    '''pages of 3 walk every row once, in (created_at, id) order, both
+    ways; the last page holds no cursor'''
+    everything = storage.find(User, tied_users)
+    expected = sorted(everything, key=lambda u: (u.created_at, u.id))
+    seen, pages = walk(tied_users, limit=3)
+    assert seen == expected and pages == 3
+    seen, _ = walk(tied_users, limit=3, newest_first=True)
+    assert seen == expected[::-1]
+    # the page ending on the last row has no next one
+    seen, pages = walk(tied_users, limit=7)
+    assert len(seen) == 7 and pages == 1
+
+
+def test_paginate_sort_by_orders_across_pages(tied_users):
+    '''sort_by leads the keyset, so the order holds over page breaks'''
+    everything = storage.find(User, tied_users)
+    seen, pages = walk(tied_users, limit=2, sort_by='role')
+    assert seen == sorted(
+            everything, key=lambda u: (u.role, u.created_at, u.id))
+    assert pages == 4
+
+
+def test_cursors():
+    '''a cursor round-trips; anything else is refused'''
+    stamp = datetime(2024, 1, 1, 12, 30, 15, 250)
+    user = User(role='x|y', created_at=stamp)
+    assert storage.decode_cursor(storage.encode_cursor(user)) == (
+            stamp, user.id)
+    # the sort_by value may hold the separator
+    cursor = storage.encode_cursor(user, sort_by='role')
+    assert storage.decode_cursor(cursor, sort_by='role') == (
+            'x|y', stamp, user.id)
+    for bad in ('bogus', '!!!', storage.encode_cursor(user)):
+        with pytest.raises(ValueError):
+            storage.decode_cursor(bad, sort_by='role')
+    with pytest.raises(ValueError):
+        storage.paginate(User, cursor='bogus')
+
+
+def test_page_args_and_response():
+    '''cursor and limit are read from the query string, the next cursor
+    is sent in a header left out on the last page'''
+    assert get_page_args({}) == (None, None)
+    assert get_page_args({'cursor': 'abc', 'limit': '20'}) == ('abc', 20)
+    for limit in ('x', '0', '-3'):
+        with pytest.raises(ValueError):
+            get_page_args({'limit': limit})
+    assert make_page_response_('ok', [], 'abc').headers['X-Next-Cursor'] \
+        == 'abc'
+    assert 'X-Next-Cursor' not in make_page_response_('ok', [], None).headers
+
+
+def make_job(applicants):
+    '''a saved job with one application from each of `applicants` new
+    candidates, and the candidates'''
+    users = make_users(applicants)
+    major = Major(name=uuid.uuid4().hex)
+    recruiter = Recruiter(user=make_users(1, role='recruiter')[0])
+    job = Job(recruiter=recruiter, major=major, job_title='count',
+              job_description='d', responsibilities=[])
+    candidates = [Candidate(user=user, major=major) for user in users]
+    for obj in (major, recruiter, job, *candidates):
+        storage.new(obj)
+    for candidate in candidates:
+        storage.new(Application(job=job, candidate=candidate))
+    storage.save()
+    return job, candidates
+
+
+def stored_count(job_id):
+    '''applications_count as stored, and the applications of the job'''
+    storage.close()
+    return (storage.get(Job, job_id).applications_count,
+            len(storage.get_all_by_attr(Application, 'job_id', job_id)))
+
+
+def test_applications_count_follows_inserts_and_deletes():
+    '''applying and withdrawing move the counter, in memory as well'''
+    job, candidates = make_job(3)
+    assert job.applications_count == 3
+    assert stored_count(job.id) == (3, 3)
+
+    application, = storage.get_all_by_attr(
+            Application, 'candidate_id', candidates[0].id)
+    storage.delete(application)
+    storage.save()
+    assert storage.get(Job, job.id).applications_count == 2
+    assert stored_count(job.id) == (2, 2)
+
+
+def test_applications_count_follows_orphans_and_cascades():
+    '''applications removed from their job, or deleted along with their
+    candidate\'s user, are counted out'''
+    job, _ = make_job(3)
+    storage.close()
+    job = storage.get(Job, job.id)
+    job.applications.remove(job.applications[0])
+    storage.save()
+    assert stored_count(job.id) == (2, 2)
+
+    user = storage.get(Job, job.id).applications[0].candidate.user
+    storage.delete(user)
+    storage.save()
+    assert stored_count(job.id) == (1, 1)
+
+
+def test_count_by():
+    '''applications per job from one query, 0 for a job with none; the
+    fallback of a job whose counter is not set yet'''
+    (job, _), (other, _) = make_job(2), make_job(0)
+    storage.reset_request_stats()
+    assert storage.count_by(Application, 'job_id', [job.id, other.id]) == {
+            job.id: 2, other.id: 0}
+    assert storage.request_stats()['queries'] == 1
+    assert storage.count_by(Application, 'job_id', []) == {}
+    unsaved = Job()
+    unsaved.id = job.id
+    assert unsaved.applications_count is None
+    assert unsaved.application_count == 2
+
+
+def test_reconcile_application_counts():
+    '''a counter drifted by a bulk write is recomputed'''
+    job, _ = make_job(2)
+    storage.bulk_update(Job, [{'id': job.id, 'applications_count': 9}])
+    assert stored_count(job.id) == (9, 2)
+    assert storage.reconcile_application_counts(batch_size=2) == 1
+    assert stored_count(job.id) == (2, 2)
+    assert storage.reconcile_application_counts() == 0
+
+
+def test_upgrade_adds_and_fills_applications_count(tmp_path):
+    '''a jobs table from before the counters gets them, counting the
+    applications already there; a second upgrade changes nothing'''
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for column in ('applications_count', 'times_closed'):
+            connection.execute(text(f'ALTER TABLE jobs DROP COLUMN {column}'))
+        for job_id, applicants in (('j1', 2), ('j2', 0)):
+            connection.execute(text(
+                "INSERT INTO jobs (id, recruiter_id, major_id, job_title,"
+                " job_description) VALUES (:id, 'r', 'm', 't', 'd')"),
+                {'id': job_id})
+            for i in range(applicants):
+                connection.execute(text(
+                    "INSERT INTO applications (id, job_id, candidate_id)"
+                    " VALUES (:id, :job_id, 'c')"),
+                    {'id': f'{job_id}-{i}', 'job_id': job_id})
+
+    for _ in range(2):
+        with engine.begin() as connection:
+            migrations.upgrade(connection)
+    with engine.connect() as connection:
+        assert dict(connection.execute(text(
+            'SELECT id, applications_count FROM jobs')).all()) == {
+            'j1': 2, 'j2': 0}
+    assert {'applications_count', 'times_closed'} <= {
+        column['name'] for column in inspect(engine).get_columns('jobs')}
+
+
+def test_upgrade_creates_missing_job_indexes(tmp_path):
+    '''indexes a jobs table was created without are added, those of
+    other dialects left out'''
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text('DROP INDEX ix_jobs_is_open_deadline'))
+        migrations.upgrade(connection)
+    names = {index['name'] for index in inspect(engine).get_indexes('jobs')}
+    assert 'ix_jobs_is_open_deadline' in names
+    assert not any(name.startswith('ft_') for name in names)
@@ -0,0 +1,186 @@
+'''test the background task queue
+
+Run with:
+    python -m pytest server/tests/test_task_queue.py
+'''
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from server.services.task_queue import TaskQueue, TaskStore
+
+
+@pytest.fixture
+def tasks():
+    '''a queue over an in-memory store, with an "echo" and a "fail"
+    handler'''
+    tasks = TaskQueue(TaskStore(':memory:'), workers=2)
+
+    @tasks.handler('echo')
+    def echo(payload, progress):
+        progress('echoing')
+        return {'echo': payload}
+
+    @tasks.handler('fail')
+    def fail(payload, progress):
+        raise RuntimeError('model unavailable')
+
+    tasks.start()
+    return tasks
+
+
+def test_task_runs_in_the_background(tasks):
+    '''submit answers at once, status follows the task to its result'''
+    release = threading.Event()
+
+    @tasks.handler('slow')
+    def slow(payload, progress):
+        progress('waiting')
+        release.wait(5)
+        return payload
+
+    task_id = tasks.submit('slow', {'n': 1}, owner_id='u1')
+    assert tasks.status(task_id)['status'] in ('queued', 'running')
+    release.set()
+    tasks.join()
+
+    task = tasks.status(task_id)
+    assert task['status'] == 'done'
+    assert task['progress'] == 'finished'
+    assert task['result'] == {'n': 1}
+    assert task['owner_id'] == 'u1'
+
+
+def test_failures_are_recorded(tasks):
+    '''an exception fails the task, the workers keep going'''
+    failed = tasks.submit('fail', {})
+    echoed = tasks.submit('echo', [1, 2])
+    tasks.join()
+    assert tasks.status(failed)['status'] == 'failed'
+    assert tasks.status(failed)['error'] == 'model unavailable'
+    assert tasks.status(echoed)['result'] == {'echo': [1, 2]}
+
+
+def test_coalesced_tasks_run_once():
+    '''a task submitted again while queued is not queued twice'''
+    tasks = TaskQueue(TaskStore(':memory:'), workers=2)
+    runs = []
+    tasks.handler('count')(lambda payload, progress: runs.append(payload))
+    ids = [tasks.submit('count', {'job': 'a', 'n': 1}, coalesce=True),
+           tasks.submit('count', {'n': 1, 'job': 'a'}, coalesce=True),
+           tasks.submit('count', {'job': 'b', 'n': 1}, coalesce=True),
+           tasks.submit('count', {'job': 'a', 'n': 1})]
+    assert ids[0] == ids[1] and len(set(ids)) == 3
+    tasks.start()
+    tasks.join()
+    assert len(runs) == 3
+    # finished tasks are not coalesced with
+    assert tasks.submit('count', {'job': 'a', 'n': 1}, coalesce=True) \
+        not in ids
+
+
+def test_unknown_tasks(tasks):
+    '''unknown kinds are refused, unknown ids have no status'''
+    with pytest.raises(ValueError):
+        tasks.submit('nope', {})
+    assert tasks.status('missing') is None
+
+
+def test_unfinished_tasks_resume(tmp_path):
+    '''tasks queued by a process that stopped, or running when it died,
+    run on the next start; those of a live worker are left to it'''
+    path = str(tmp_path / 'tasks.db')
+    store = TaskStore(path)
+    queued = store.create('echo', 'queued')
+    died = store.create('echo', 'died')
+    assert store.claim(died, lease=-1)
+    alive = store.create('echo', 'alive')
+    assert store.claim(alive, lease=60)
+
+    tasks = TaskQueue(TaskStore(path), workers=1)
+    tasks.handler('echo')(lambda payload, progress: payload.upper())
+    tasks.start()
+    tasks.join()
+    assert tasks.status(queued)['result'] == 'QUEUED'
+    assert tasks.status(died)['result'] == 'DIED'
+    assert tasks.status(alive)['status'] == 'running'
+
+
+def test_a_task_runs_once_across_queues(tmp_path):
+    '''two queues over one file (two processes) never run a task
+    twice'''
+    path = str(tmp_path / 'tasks.db')
+    store = TaskStore(path)
+    ids = [store.create('count', i) for i in range(20)]
+    runs = []
+    queues = [TaskQueue(TaskStore(path), workers=3) for _ in range(2)]
+    for tasks in queues:
+        @tasks.handler('count')
+        def count(payload, progress):
+            runs.append(payload)
+            time.sleep(0.001)
+            return payload
+    for tasks in queues:
+        tasks.start()
+    for tasks in queues:
+        tasks.join()
+    assert sorted(runs) == list(range(20))
+    assert {store.get(id)['status'] for id in ids} == {'done'}
+
+
+def test_the_lease_is_renewed_while_running():
+    '''a slow task keeps its claim past the first lease'''
+    tasks = TaskQueue(TaskStore(':memory:'), workers=1, lease=0.3)
+    release = threading.Event()
+    tasks.handler('slow')(lambda payload, progress: release.wait(5))
+    tasks.start()
+    task_id = tasks.submit('slow', None)
+    time.sleep(0.6)
+    assert tasks.store.get(task_id)['lease_until'] > time.time()
+    assert tasks.store.recover() == []
+    release.set()
+    tasks.join()
+    task = tasks.store.get(task_id)
+    assert task['status'] == 'done' and task['lease_until'] is None
+
+
+def test_finished_tasks_are_purged(tasks):
+    '''only finished tasks past the retention are deleted'''
+    done = tasks.submit('echo', 1)
+    failed = tasks.submit('fail', 2)
+    tasks.join()
+    waiting = tasks.store.create('echo', 3)
+    assert tasks.purge(3600) == 0
+    assert tasks.store.purge(datetime.utcnow() + timedelta(hours=1)) == 2
+    assert tasks.status(done) is None and tasks.status(failed) is None
+    assert tasks.status(waiting)['status'] == 'queued'
+
+
+def test_scheduler_runs_jobs_at_their_interval():
+    '''each job runs every interval, a failure does not stop it'''
+    from server.services.scheduler import Scheduler
+
+    scheduler = Scheduler()
+    ran = threading.Event()
+    calls = []
+
+    @scheduler.every('tick', 0.01)
+    def tick():
+        calls.append(1)
+        if len(calls) == 3:
+            ran.set()
+        if len(calls) == 2:
+            raise RuntimeError('database is locked')
+        return len(calls)
+
+    scheduler.every('disabled', 0, lambda: calls.append('never'))
+    scheduler.start()
+    assert ran.wait(5)
+    scheduler.shutdown()
+    stats = scheduler.stats()
+    assert set(stats) == {'tick'}
+    assert stats['tick']['runs'] >= 3 and stats['tick']['failures'] == 1
+    assert stats['tick']['last_error'] == 'database is locked'
+    assert 'never' not in calls
@@ -0,0 +1,60 @@
+'''test the streaming, budgeted text extraction
+
+Run with:
+    python -m pytest server/tests/test_text_extractor.py
+'''
+import os
+
+import pytest
+
+from server.exception import UnreadableCVError
+from server.services import text_extractor
+from server.services.text_extractor import extract_text, iter_pdf_pages
+
+CV_DIR = os.path.join(os.path.dirname(__file__), '..', 'cv')
+CV = os.path.join(CV_DIR, 'john_doe.pdf')
+SCANNED_CV = os.path.join(CV_DIR, 'fola_inv.pdf')
+
+
+@pytest.fixture
+def parsed_pages(monkeypatch):
+    '''list filled with the number of each page parse_pdf parses'''
+    parsed = []
+
+    def counting(file_path, max_pages=0):
+        for number, page in enumerate(
+                iter_pdf_pages(file_path, max_pages), 1):
+            parsed.append(number)
+            yield page
+
+    monkeypatch.setattr(text_extractor, 'iter_pdf_pages', counting)
+    return parsed
+
+
+def test_pages_are_streamed():
+    '''one text per page, the whole document when read to the end'''
+    pages = list(iter_pdf_pages(CV))
+    assert len(pages) == 2
+    assert all(page.strip() for page in pages)
+    assert '\n'.join(page.strip() for page in pages) == extract_text(CV)
+    assert len(list(iter_pdf_pages(CV, max_pages=1))) == 1
+
+
+def test_character_budget_stops_parsing(parsed_pages):
+    '''pages past the budget are never parsed'''
+    assert len(extract_text(CV, max_chars=100)) == 100
+    assert parsed_pages == [1]
+
+
+def test_page_budget(parsed_pages):
+    '''max_pages is honoured'''
+    assert extract_text(CV, max_pages=1)
+    assert parsed_pages == [1]
+
+
+def test_no_text_layer_is_detected_early(parsed_pages, monkeypatch):
+    '''a scan is unreadable after the probe pages, the rest unparsed'''
+    monkeypatch.setattr(text_extractor, 'PROBE_PAGES', 1)
+    with pytest.raises(UnreadableCVError):
+        extract_text(SCANNED_CV)
+    assert parsed_pages == [1]
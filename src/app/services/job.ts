@@ -1,4 +1,9 @@
-import { api } from './auth';
+import type {
+  FetchArgs,
+  FetchBaseQueryError,
+  FetchBaseQueryMeta,
+} from '@reduxjs/toolkit/query';
+import { api, ServerResponse } from './auth';
 
 export interface Job {
   major_id: string;
@@ -27,6 +32,49 @@ export interface RecommendedCandidateResponse {
   candidates: Candidate[];
 }
 
+interface PageResult {
+  data?: unknown;
+  error?: FetchBaseQueryError;
+  meta?: unknown;
+}
+
+type BaseQuery = (
+  arg: string | FetchArgs,
+) => PageResult | PromiseLike<PageResult>;
+
+/** one page of a paginated job list */
+export interface JobPage extends ServerResponse<Job[]> {
+  // cursor of the next page, null on the last one
+  nextCursor: string | null;
+}
+
+export interface PageArgs {
+  // cursor of the page, the first one when left out
+  cursor?: string;
+}
+
+export interface SearchArgs {
+  title?: string;
+  location?: string;
+  // the newest first, instead of the most relevant
+  sort?: 'date';
+}
+
+/**
+ * fetch one page of a paginated job list; the server sends the cursor of
+ * the next page in the X-Next-Cursor header, left out on the last one
+ */
+async function fetchPage(baseQuery: BaseQuery, args: FetchArgs) {
+  const result = await baseQuery(args);
+  if (result.error) {
+    return { error: result.error };
+  }
+  const page = result.data as ServerResponse<Job[]>;
+  const meta = result.meta as FetchBaseQueryMeta | undefined;
+  const nextCursor = meta?.response?.headers.get('X-Next-Cursor') ?? null;
+  return { data: { ...page, nextCursor } };
+}
+
 export const jobApi = api.injectEndpoints({
   endpoints: (builder) => ({
     createJob: builder.mutation<JobResponse, Partial<Job>>({
@@ -86,17 +134,22 @@ export const jobApi = api.injectEndpoints({
       query: ({ job_id }) => `jobs/${job_id}/recommended_candidates`,
     }),
 
-    getAllJobsSortedByDate: builder.query<Job[], void>({
-      query: () => 'jobs/all/sorted',
+    getAllJobsSortedByDate: builder.query<JobPage, PageArgs>({
+      queryFn: ({ cursor }, _api, _extraOptions, baseQuery) =>
+        fetchPage(baseQuery, { url: 'jobs/all/sorted', params: { cursor } }),
     }),
-    getAllJobsSortedByMajor: builder.query<Job[], void>({
-      query: () => 'jobs/all',
+    getAllJobsSortedByMajor: builder.query<JobPage, PageArgs>({
+      queryFn: ({ cursor }, _api, _extraOptions, baseQuery) =>
+        fetchPage(baseQuery, { url: 'jobs/all', params: { cursor } }),
     }),
-    searchJobs: builder.query<Job[], { location?: string; title?: string }>({
-      query: (params) => ({
-        url: 'jobs/search',
-        params,
-      }),
+    /**
+     * one page of the jobs matching a search: the endpoint sends at most
+     * 50 matches by default, and the cursor of the next ones, which used
+     * to come all at once
+     */
+    searchJobs: builder.query<JobPage, SearchArgs & PageArgs>({
+      queryFn: (params, _api, _extraOptions, baseQuery) =>
+        fetchPage(baseQuery, { url: 'jobs/search', params }),
     }),
     getJobCounts: builder.query<
       { total_count: number; major_counts: Record<string, number> },
@@ -118,6 +171,6 @@ export const {
   useGetRecommendedCandidatesQuery,
   useGetAllJobsSortedByDateQuery,
   useGetAllJobsSortedByMajorQuery,
-  useLazySearchJobsQuery,
+  useSearchJobsQuery,
   useGetJobCountsQuery,
 } = jobApi;
@@ -14,9 +14,11 @@ import {
   Text,
   useMediaQuery,
 } from '@chakra-ui/react';
+import { skipToken } from '@reduxjs/toolkit/query';
 import {
+  SearchArgs,
   useGetAllJobsSortedByDateQuery,
-  useLazySearchJobsQuery,
+  useSearchJobsQuery,
 } from '../app/services/job';
 import { MyIcon } from '../components';
 import { Link, Outlet, useMatch, useNavigate } from 'react-router-dom';
@@ -27,30 +29,36 @@ function Explore() {
   const match = useMatch('/find_jobs/:job_id');
   const navigate = useNavigate();
   const [isLargeThan640] = useMediaQuery('(min-width: 640px)');
-  const [sort, setSort] = useState([]);
+  const [sort, setSort] = useState<string[]>([]);
+  // the search submitted, null while every job is listed
+  const [search, setSearch] = useState<SearchArgs | null>(null);
+  // cursors of the pages walked so far, the shown one last
+  const [cursors, setCursors] = useState<(string | undefined)[]>([
+    undefined,
+  ]);
+  const cursor = cursors[cursors.length - 1];
   const {
-    data = { data: [] },
+    data = { data: [], nextCursor: null },
     isLoading: queryLoading,
     isSuccess,
-  } = useGetAllJobsSortedByDateQuery();
-  const [
-    searchJobs,
-    {
-      data: searchResults = { data: [] },
-      isLoading: searchLoading,
-      isFetching,
-      isSuccess: searchSuccess,
-      isUninitialized,
-    },
-  ] = useLazySearchJobsQuery();
-  const renderedData = isUninitialized ? data.data : searchResults.data;
+  } = useGetAllJobsSortedByDateQuery({ cursor }, { skip: search !== null });
+  const {
+    data: searchResults = { data: [], nextCursor: null },
+    isLoading: searchLoading,
+    isFetching,
+  } = useSearchJobsQuery(search ? { ...search, cursor } : skipToken);
+  const page = search ? searchResults : data;
+  const renderedData = page.data;
 
   const handleSubmit: React.FormEventHandler<HTMLFormElement> = (evt) => {
     evt.preventDefault();
     const formdata = new FormData(evt.currentTarget);
-    formdata.append('sort', JSON.stringify(sort));
-    //    console.log({ form: Object.fromEntries(formdata) });
-    searchJobs(Object.fromEntries(formdata));
+    setSearch({
+      title: formdata.get('title') as string,
+      location: formdata.get('location') as string,
+      sort: sort.includes('date') ? 'date' : undefined,
+    });
+    setCursors([undefined]);
   };
 
   return (
@@ -75,7 +83,11 @@ function Explore() {
             />
           </Box>
           <MenuList>
-            <MenuOptionGroup title="Sort" type="checkbox" onChange={setSort}>
+            <MenuOptionGroup
+              title="Sort"
+              type="checkbox"
+              onChange={(value) => setSort([value].flat())}
+            >
               <MenuItemOption value="date">date</MenuItemOption>
             </MenuOptionGroup>
           </MenuList>
@@ -189,6 +201,11 @@ function Explore() {
                   />
                 </Skeleton>
               )}
+              <Pager
+                cursors={cursors}
+                nextCursor={page.nextCursor}
+                onChange={setCursors}
+              />
             </Box>
             <Box className="col-span-5 min-h-96">
               {match ? (
@@ -252,6 +269,13 @@ function Explore() {
                 <MyIcon href="/sprite.svg#upload-error" className="" />
               </Skeleton>
             )}
+            {match ? null : (
+              <Pager
+                cursors={cursors}
+                nextCursor={page.nextCursor}
+                onChange={setCursors}
+              />
+            )}
           </Box>
         )}
       </Box>
@@ -259,6 +283,31 @@ function Explore() {
   );
 }
 
+type PagerProps = {
+  cursors: (string | undefined)[];
+  nextCursor: string | null;
+  onChange: (cursors: (string | undefined)[]) => void;
+};
+/** previous and next buttons walking a paginated list */
+function Pager({ cursors, nextCursor, onChange }: PagerProps) {
+  return (
+    <Box as="li" className="flex justify-between gap-2">
+      <Button
+        isDisabled={cursors.length < 2}
+        onClick={() => onChange(cursors.slice(0, -1))}
+      >
+        previous
+      </Button>
+      <Button
+        isDisabled={!nextCursor}
+        onClick={() => nextCursor && onChange([...cursors, nextCursor])}
+      >
+        next
+      </Button>
+    </Box>
+  );
+}
+
 type DescProps = {
   desc: string;
   id: string;